@@ -0,0 +1,102 @@
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+
+import org.json.simple.JSONObject;
+import org.json.simple.parser.JSONParser;
+
+/**
+ * Long-running wrapper of ASTMapEval (cs.zju.main.Main), so that the JVM is started and the classes are loaded once
+ * instead of once per mapped (commit, file).
+ *
+ * Protocol: one JSON request per line on stdin, {"id": ..., "project": ..., "commit": ..., "file": ..., "output": ...},
+ * one JSON reply per line on stdout, {"id": ..., "ok": true} or {"id": ..., "ok": false, "error": ...}, in the order
+ * of the requests. The mapping results are written to the output file of the request, as with the -o option of
+ * ASTMapEval. Everything ASTMapEval prints goes to stderr.
+ *
+ * Build (from ASTMapEval_jar):
+ *   javac -cp ASTMapEval.jar -d daemon/classes daemon/ASTMapEvalDaemon.java
+ * Run (from ASTMapEval_jar):
+ *   java -cp ASTMapEval.jar:daemon/classes ASTMapEvalDaemon
+ */
+public class ASTMapEvalDaemon {
+
+    private static class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("ASTMapEval called System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    /** Turn the System.exit calls of ASTMapEval into exceptions, when the JVM still allows a security manager */
+    private static void trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrappedException(status);
+                }
+            });
+        } catch (UnsupportedOperationException | SecurityException e) {
+            // Java 18+ without -Djava.security.manager=allow: a System.exit kills the daemon, the client respawns it
+            System.err.println("ASTMapEvalDaemon: System.exit cannot be trapped: " + e);
+        }
+    }
+
+    @SuppressWarnings("unchecked")
+    public static void main(String[] args) throws Exception {
+        PrintWriter replies = new PrintWriter(new OutputStreamWriter(System.out, StandardCharsets.UTF_8), false);
+        System.setOut(new PrintStream(System.err, true));
+        trapExit();
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        JSONParser parser = new JSONParser();
+
+        String line;
+        while ((line = requests.readLine()) != null) {
+            if (line.trim().isEmpty()) {
+                continue;
+            }
+
+            JSONObject reply = new JSONObject();
+            try {
+                JSONObject request = (JSONObject) parser.parse(line);
+                reply.put("id", request.get("id"));
+
+                String[] mainArgs = {
+                        "-p", (String) request.get("project"),
+                        "-c", (String) request.get("commit"),
+                        "-o", (String) request.get("output"),
+                        "-f", (String) request.get("file")
+                };
+                cs.zju.main.Main.main(mainArgs);
+                reply.put("ok", true);
+            } catch (ExitTrappedException e) {
+                reply.put("ok", e.status == 0);
+                if (e.status != 0) {
+                    reply.put("error", e.getMessage());
+                }
+            } catch (Throwable e) {
+                reply.put("ok", false);
+                reply.put("error", e.toString());
+            }
+
+            replies.println(reply.toJSONString());
+            replies.flush();
+        }
+    }
+}
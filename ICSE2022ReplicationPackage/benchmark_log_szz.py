@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+from setting import *
+
+sys.path.append(os.path.join(SZZ_FOLDER, 'tools/pyszz/'))
+
+from szz.my_szz import MySZZ
+from szz.my_log_szz import MyLogSZZ
+
+FILE_EXT_TO_PARSE = ['c', 'cpp', 'h', 'hpp', 'cxx', 'hxx', 'cc', 'hh']
+
+
+def run(szz, commits, **kwargs):
+    output = {}
+    start = time.time()
+    for commit, imp_files in szz.get_impacted_files_bulk(commits, file_ext_to_parse=FILE_EXT_TO_PARSE, only_deleted_lines=True):
+        bug_introducing_commits = szz.find_bic(fix_commit_hash=commit, impacted_files=imp_files, ignore_revs_file_path=None, **kwargs)
+        if len(bug_introducing_commits) > 0:
+            output[commit] = bug_introducing_commits
+    return output, time.time() - start
+
+
+def chains_by_line(bug_introducing_commits):
+    return {(bic['file_path'], bic['line_num']): [step[0] for step in bic['previous_commits']] for bic in bug_introducing_commits}
+
+
+def compare(reference, output):
+    """ Count the chains of the reference found with the same commits, and with the same last commit """
+    total = same_chain = same_last = missing = 0
+    for commit, bug_introducing_commits in reference.items():
+        chains = chains_by_line(output.get(commit, []))
+        for line, reference_chain in chains_by_line(bug_introducing_commits).items():
+            total += 1
+            chain = chains.get(line)
+            if chain is None:
+                missing += 1
+                continue
+            same_chain += int(chain == reference_chain)
+            same_last += int(chain[-1:] == reference_chain[-1:])
+    return {'chains': total, 'same_chain': same_chain, 'same_last_commit': same_last, 'missing': missing}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the git log -L engine of V-SZZ (MyLogSZZ) with MySZZ')
+    parser.add_argument('project', nargs='?', default='ChakraCore')
+    parser.add_argument('--repo-url', default='https://github.com/chakra-core/ChakraCore')
+    parser.add_argument('--candidates', choices=['file', 'hunk'], default='file')
+    parser.add_argument('--rerun-my', action='store_true', help='also run MySZZ to compare the running times')
+    args = parser.parse_args()
+
+    reference_file = 'results/my-{project}.json'.format(project=args.project)
+    with open(reference_file) as f:
+        reference = json.load(f)
+    commits = list(reference.keys())
+    print(f'{len(commits)} fixing commits in {reference_file}')
+
+    log_szz = MyLogSZZ(repo_full_name=args.project, repo_url=args.repo_url, repos_dir=REPOS_DIR, use_temp_dir=False, ast_map_path=AST_MAP_PATH)
+    log_output, log_time = run(log_szz, commits, candidates=args.candidates)
+    print(f'MyLogSZZ ({args.candidates}): {log_time:.1f}s')
+    print('agreement with', reference_file, compare(reference, log_output))
+
+    if args.rerun_my:
+        # the chain memo would make MySZZ replay the chains of the previous runs
+        my_szz = MySZZ(repo_full_name=args.project, repo_url=args.repo_url, repos_dir=REPOS_DIR, use_temp_dir=False, ast_map_path=AST_MAP_PATH)
+        my_szz.chain_memo = None
+        my_output, my_time = run(my_szz, commits)
+        print(f'MySZZ: {my_time:.1f}s, speedup {my_time / max(log_time, 1e-9):.2f}x')
+        print('MySZZ agreement with', reference_file, compare(reference, my_output))
+
+    output_file = 'results/my-log-{project}.json'.format(project=args.project)
+    with open(output_file, 'w') as fout:
+        json.dump(log_output, fout, indent=4)
@@ -1,4 +1,5 @@
 import subprocess
+import sys
 import xml.etree.ElementTree as ET
 import os
 import re
@@ -9,19 +10,28 @@ import hashlib
 import pandas as pd
 import re
 
+sys.path.append(os.path.join(SZZ_FOLDER, 'tools/pyszz/'))
+
+from szz.core.git_batch import object_readers
+from szz.core.srcml_batch import SrcMLBatch, element_to_source
+
+CHECKOUT_DIR = tempfile.mkdtemp(prefix='checkout_')
+
 def checkout_file_at_commit(repo_path, relative_file_path, commit_hash):
     """
     Checks out a specific version of a file at a given commit hash.
+    The file is read through a persistent git cat-file process and written to CHECKOUT_DIR/<commit>/<path>,
+    so that the versions of a file and files with the same name do not overwrite each other.
+    The working tree of the repository is left untouched.
     """
     try:
-        # Change directory to the repository path
-        os.chdir(repo_path)
-        file_path = os.path.join(repo_path, relative_file_path)
-        # Run the Git checkout command for the specific file at the given commit hash
-        subprocess.run(['git', 'checkout', commit_hash, relative_file_path], check=True)
+        content = object_readers.get(repo_path).read_blob(commit_hash, relative_file_path)
+        file_path = os.path.join(CHECKOUT_DIR, commit_hash, relative_file_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as fout:
+            fout.write(content)
         print(f"Checked out file {relative_file_path} at commit {commit_hash}")
-        os.chdir(WORK_DIR)
-    except subprocess.CalledProcessError as e:
+    except ValueError as e:
         print(f"Error checking out file: {e}")
         return None
     return file_path
@@ -89,12 +99,37 @@ def convert_to_srcml(src_file_path):
         print(f"Error converting to srcML: {e}")
         return None
 
-def extract_function_containing_line(src_file_path, line_number, line_str):
+def convert_files_at_commits_to_srcml(repo_path, relative_file_path, commit_hashes):
+    """
+    Convert the versions of a file at the given commits to srcML with a single srcml invocation.
+    The files are read through a persistent git cat-file process, without checking them out.
+
+    :return: A dict commit hash -> srcML content, the commits where the file does not exist are missing.
+    """
+    batch = SrcMLBatch(CHECKOUT_DIR)
+    for commit_hash in commit_hashes:
+        try:
+            content = object_readers.get(repo_path).read_blob(commit_hash, relative_file_path)
+        except ValueError as e:
+            print(f"Error reading file: {e}")
+            continue
+        batch.add(commit_hash, bytes(content).decode('utf-8', errors='replace'), relative_file_path)
+    return {commit_hash: srcml for commit_hash, srcml in batch.convert().items() if srcml}
+
+def function_to_source(function):
+    """
+    Convert a srcML function element back to source code, in-process instead of running srcml on it.
+    """
+    return '\n'.join(element_to_source(function, with_tail=True).splitlines())
+
+def extract_function_containing_line(src_file_path, line_number, line_str, srcml_content=None):
     """
     Extract a function from srcML content based on a line string.
+    The file is converted to srcML unless its srcML content is given.
     """
     try:
-        srcml_content = convert_to_srcml(src_file_path)
+        if srcml_content is None:
+            srcml_content = convert_to_srcml(src_file_path)
         # print(srcml_content)
         if not srcml_content:
             return None, None
@@ -120,7 +155,7 @@ def extract_function_containing_line(src_file_path, line_number, line_str):
             # print((start_line <= line_number <= end_line))
 
             if start_line and end_line and (start_line <= line_number <= end_line):
-                function_src = convert_xml_string_to_source(ET.tostring(function, encoding='unicode'))
+                function_src = function_to_source(function)
                 if line_str in function_src:
                     function_name = function.find('./src:name', ns)
                     # function_name_parts = function.findall('.//src:name', ns)
@@ -133,12 +168,14 @@ def extract_function_containing_line(src_file_path, line_number, line_str):
 
     return None, None
 
-def extract_function_from_name(src_file_path, function_name):
+def extract_function_from_name(src_file_path, function_name, srcml_content=None):
     """
     Extract latent functions between the BFC and BIC based on file name and function name.
+    The file is converted to srcML unless its srcML content is given.
     """
     try:
-        srcml_content = convert_to_srcml(src_file_path)
+        if srcml_content is None:
+            srcml_content = convert_to_srcml(src_file_path)
         # print(srcml_content)
         if not srcml_content:
             return None, None
@@ -155,7 +192,7 @@ def extract_function_from_name(src_file_path, function_name):
             extract_name = function.find('./src:name', ns)
             extract_name = ''.join([part.text for part in extract_name if part.text])
             if extract_name == function_name:
-                function_src = convert_xml_string_to_source(ET.tostring(function, encoding='unicode'))
+                function_src = function_to_source(function)
                 if function_src:
                     return function_src
     except Exception as e:
@@ -163,18 +200,11 @@ def extract_function_from_name(src_file_path, function_name):
 
     return None
 
-def convert_line_to_srcml(line_str, language, line_number):
+def extract_call_element(srcml_output, line_number):
     """
-    Convert a single line of C/C++ code to srcML XML format and extract the specific part.
+    Extract the first call of a line converted to srcML, with its positions moved to the given line number.
     """
     try:
-        # Using srcML to convert the line to XML format
-        if language == 'c':
-            result = subprocess.run(['srcml', '--position', '--language=C', '-'], input=line_str, text=True, capture_output=True, check=True)
-        elif language == 'cpp':
-            result = subprocess.run(['srcml', '--position', '--language=C++', '-'], input=line_str, text=True, capture_output=True, check=True)
-        srcml_output = result.stdout
-        
         modified_srcml_output = srcml_output.replace('1:', f'{line_number}:')
 
         # Parse the srcML output
@@ -195,59 +225,26 @@ def convert_line_to_srcml(line_str, language, line_number):
             return call_element
         else:
             return "Call element not found."
-    except subprocess.CalledProcessError as e:
-        print(f"Error converting line to srcML: {e}")
-        return None
     except ET.ParseError as e:
         return f"Error parsing src"
-    
-def wrap_srcml_content(srcml_content):
-    """
-    Wraps a srcML content snippet with the necessary root element for srcML.
-
-    :param srcml_content: The srcML content of a function or other code snippet.
-    :return: The wrapped srcML content.
-    """
-    srcml_wrapper_start = '<src:unit xmlns:src="http://www.srcML.org/srcML/src">'
-    srcml_wrapper_end = '</src:unit>'
-
-    wrapped_content = f"{srcml_wrapper_start}{srcml_content}{srcml_wrapper_end}"
-    return wrapped_content
 
-def convert_xml_string_to_source(xml_content):
+def convert_line_to_srcml(line_str, language, line_number):
     """
-    Converts an XML string generated by srcML back to source code using the srcml command.
-
-    :param xml_content: XML content as a string.
-    :return: Converted source code as a string.
+    Convert a single line of C/C++ code to srcML XML format and extract the specific part.
     """
     try:
-        # Create a temporary file to hold the XML content
-        xml_content = wrap_srcml_content(xml_content)
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.xml') as temp_xml_file:
-            temp_xml_file.write(xml_content)
-            temp_xml_file_path = temp_xml_file.name
-
-        # Construct the srcml command
-        command = ['srcml', temp_xml_file_path]
-
-        # Execute the command and capture the output
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        lines = result.stdout.splitlines()
-        # return '\n'.join(lines[1:])
-        return '\n'.join(lines)
+        # Using srcML to convert the line to XML format
+        if language == 'c':
+            result = subprocess.run(['srcml', '--position', '--language=C', '-'], input=line_str, text=True, capture_output=True, check=True)
+        elif language == 'cpp':
+            result = subprocess.run(['srcml', '--position', '--language=C++', '-'], input=line_str, text=True, capture_output=True, check=True)
+        return extract_call_element(result.stdout, line_number)
     except subprocess.CalledProcessError as e:
-        print(f"An error occurred while converting XML to source code: {e}")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        print(f"Error converting line to srcML: {e}")
         return None
-    finally:
-        # Clean up the temporary file
-        if temp_xml_file:
-            temp_xml_file.close()
-            os.remove(temp_xml_file_path)
-
+    except ET.ParseError as e:
+        return f"Error parsing src"
+    
 def replace_newlines_before_first_brace_with_space(text):
     # Find the first brace
     first_brace_index = text.find('{')
@@ -291,9 +288,11 @@ def main():
                     bic_line_number = bic[1]
                     bic_line_str = bic[2]
                     # print(bic_commit_hash)
-                    bic_file = checkout_file_at_commit(repo_path, relative_file_path, bic_commit_hash)
-                    if bic_file:
-                        bic_function_code, bic_function_name = extract_function_containing_line(bic_file, bic_line_number, bic_line_str)
+                    # the BIC version and all the latent versions of the file are converted with one srcml call
+                    latents = get_commit_hashes_between(repo_path, bic_commit_hash, bfc)
+                    srcml_contents = convert_files_at_commits_to_srcml(repo_path, relative_file_path, [bic_commit_hash] + latents)
+                    if bic_commit_hash in srcml_contents:
+                        bic_function_code, bic_function_name = extract_function_containing_line(None, bic_line_number, bic_line_str, srcml_contents[bic_commit_hash])
                         if bic_function_code and bic_function_name:
                             bic_function_code = replace_newlines_before_first_brace_with_space(bic_function_code)
                             md5_function = hashlib.md5(bic_function_code.encode('utf-8')).hexdigest()
@@ -313,11 +312,11 @@ def main():
                             print(f"Function not found at commit {bic_commit_hash}, line {bic_line_number}, {bic_line_str}.")
                         
                         # getting latent
-                        latents = get_commit_hashes_between(repo_path, bic_commit_hash, bfc)
                         if len(latents) > 0:
                             for lantent in latents:
-                                latent_file = checkout_file_at_commit(repo_path, relative_file_path, lantent)
-                                latent_function_code, latent_function_name = extract_function_containing_line(latent_file, bic_line_number, bic_line_str)
+                                if lantent not in srcml_contents:
+                                    continue
+                                latent_function_code, latent_function_name = extract_function_containing_line(None, bic_line_number, bic_line_str, srcml_contents[lantent])
                                 if latent_function_code and latent_function_name:
                                     latent_function_code = replace_newlines_before_first_brace_with_space(latent_function_code)
                                     md5_function = hashlib.md5(latent_function_code.encode('utf-8')).hexdigest()
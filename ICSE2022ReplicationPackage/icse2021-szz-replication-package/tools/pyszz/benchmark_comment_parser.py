@@ -0,0 +1,73 @@
+import logging as log
+import os
+import shutil
+import sys
+import tempfile
+from time import time as ts
+
+from szz.core.comment_parser import c_family_comment_parser, parse_comments_srcml, srcml_file_ext
+
+log.basicConfig(level=log.WARNING, format='%(asctime)s :: %(levelname)s :: %(message)s')
+
+
+def benchmark(corpus_dir: str, limit: int = None):
+    """
+    Parse the C-family files of a corpus (e.g. a checked out repository) with the in-process comment parser and
+    with srcML, reporting the parsing time of both and the files where the comment ranges differ.
+    """
+    files = list()
+    for root, _, file_names in os.walk(corpus_dir):
+        if '.git' in root.split(os.sep):
+            continue
+        files.extend(os.path.join(root, f) for f in file_names if any(f.endswith(e) for e in srcml_file_ext))
+    if limit:
+        files = files[:limit]
+
+    use_srcml = shutil.which('srcml') is not None
+    if not use_srcml:
+        print('srcml not found, only the in-process parser is benchmarked')
+
+    temp_dir = tempfile.mkdtemp(prefix='comments_')
+    elapsed_lexer = elapsed_srcml = 0.0
+    mismatches = 0
+    for i, path in enumerate(files):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        file_name = os.path.basename(path)
+
+        start = ts()
+        lexer_ranges = c_family_comment_parser(content, file_name)
+        elapsed_lexer += ts() - start
+
+        if use_srcml:
+            start = ts()
+            srcml_ranges = parse_comments_srcml(content, file_name, temp_dir)
+            elapsed_srcml += ts() - start
+
+            if lexer_ranges != srcml_ranges:
+                mismatches += 1
+                lexer_only = sorted(set(lexer_ranges) - set(srcml_ranges))
+                srcml_only = sorted(set(srcml_ranges) - set(lexer_ranges))
+                print(f'{path}: lexer only {lexer_only}, srcml only {srcml_only}')
+
+        if (i + 1) % 100 == 0:
+            print(f'{i + 1} of {len(files)}')
+
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f'files: {len(files)}, mismatches: {mismatches}')
+    print(f'lexer: {elapsed_lexer:.2f}s total, {elapsed_lexer / max(len(files), 1) * 1000:.2f}ms per file')
+    if use_srcml:
+        print(f'srcml: {elapsed_srcml:.2f}s total, {elapsed_srcml / max(len(files), 1) * 1000:.2f}ms per file')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('USAGE: python benchmark_comment_parser.py <corpus_directory> [<max_files>]')
+        exit(-1)
+
+    if not os.path.isdir(sys.argv[1]):
+        log.error('invalid corpus directory')
+        exit(-2)
+
+    benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,44 @@
+import logging as log
+import os
+import sys
+
+from szz.core.ast_map_client import OUTPUT_DIR
+from szz.core.ast_map_store import ASTMapStore
+
+log.basicConfig(level=log.INFO, format='%(asctime)s :: %(levelname)s :: %(message)s')
+
+
+def import_json_dbs(ast_map_path: str):
+    """
+    Import the JSON mapping databases (temp/<project>.json) written by the previous versions of V-SZZ into the
+    mapping store of the ASTMapEval directory (temp/ast_map.db).
+    """
+    ast_map_temp = os.path.join(ast_map_path, 'temp')
+    store = ASTMapStore(os.path.join(ast_map_temp, 'ast_map.db'))
+
+    total = 0
+    for root, dir_names, file_names in os.walk(ast_map_temp):
+        if root == ast_map_temp and OUTPUT_DIR in dir_names:
+            dir_names.remove(OUTPUT_DIR)
+        for file_name in file_names:
+            if not file_name.endswith('.json') or file_name == 'tmp.json':
+                continue
+            json_path = os.path.join(root, file_name)
+            # the project of temp/<owner>/<name>.json is <owner>/<name>
+            project = os.path.relpath(json_path, ast_map_temp)[:-len('.json')].replace(os.sep, '/')
+            total += store.import_json_db(project, json_path, force=True)
+
+    store.close()
+    print(f'imported mappings: {total}')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('USAGE: python import_ast_map_db.py <ast_map_eval_directory>')
+        exit(-1)
+
+    if not os.path.isdir(os.path.join(sys.argv[1], 'temp')):
+        log.error('invalid ASTMapEval directory, no temp folder')
+        exit(-2)
+
+    import_json_dbs(sys.argv[1])
@@ -13,6 +13,7 @@ from szz.ma_szz import MASZZ, DetectLineMoved
 from szz.r_szz import RSZZ
 from szz.ra_szz import RASZZ
 from szz.pd_szz import PyDrillerSZZ
+from szz.core.blame_backend import make_blame_backend
 
 log.basicConfig(level=log.INFO, format='%(asctime)s :: %(levelname)s :: %(message)s')
 log.getLogger('pydriller').setLevel(log.WARNING)
@@ -34,6 +35,7 @@ def main(input_json: str, out_json: str, conf: dict(), repos_dir: str):
         szz_name = conf['szz_name']
         if szz_name == 'b':
             b_szz = BaseSZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=repos_dir)
+            b_szz.blame_backend = make_blame_backend(conf.get('blame_backend'), b_szz.repository)
             imp_files = b_szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=conf.get('only_deleted_lines', True))
             bug_introducing_commits = b_szz.find_bic(fix_commit_hash=fix_commit,
                                       impacted_files=imp_files,
@@ -41,6 +43,7 @@ def main(input_json: str, out_json: str, conf: dict(), repos_dir: str):
 
         elif szz_name == 'ag':
             ag_szz = AGSZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=repos_dir)
+            ag_szz.blame_backend = make_blame_backend(conf.get('blame_backend'), ag_szz.repository)
             imp_files = ag_szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=conf.get('only_deleted_lines', True))
             bug_introducing_commits = ag_szz.find_bic(fix_commit_hash=fix_commit,
                                        impacted_files=imp_files,
@@ -49,6 +52,7 @@ def main(input_json: str, out_json: str, conf: dict(), repos_dir: str):
 
         elif szz_name == 'ma':
             ma_szz = MASZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=repos_dir)
+            ma_szz.blame_backend = make_blame_backend(conf.get('blame_backend'), ma_szz.repository)
             imp_files = ma_szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=conf.get('only_deleted_lines', True))
             bug_introducing_commits = ma_szz.find_bic(fix_commit_hash=fix_commit,
                                        impacted_files=imp_files,
@@ -58,6 +62,7 @@ def main(input_json: str, out_json: str, conf: dict(), repos_dir: str):
 
         elif szz_name == 'r':
             r_szz = RSZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=repos_dir)
+            r_szz.blame_backend = make_blame_backend(conf.get('blame_backend'), r_szz.repository)
             imp_files = r_szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=conf.get('only_deleted_lines', True))
             bug_introducing_commits = r_szz.find_bic(fix_commit_hash=fix_commit,
                                       impacted_files=imp_files,
@@ -67,6 +72,7 @@ def main(input_json: str, out_json: str, conf: dict(), repos_dir: str):
 
         elif szz_name == 'l':
             l_szz = LSZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=repos_dir)
+            l_szz.blame_backend = make_blame_backend(conf.get('blame_backend'), l_szz.repository)
             imp_files = l_szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=conf.get('only_deleted_lines', True))
             bug_introducing_commits = l_szz.find_bic(fix_commit_hash=fix_commit,
                                       impacted_files=imp_files,
@@ -75,6 +81,7 @@ def main(input_json: str, out_json: str, conf: dict(), repos_dir: str):
                                       detect_move_from_other_files=DetectLineMoved(conf.get('detect_move_from_other_files')))
         elif szz_name == 'ra':
             ra_szz = RASZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=repos_dir)
+            ra_szz.blame_backend = make_blame_backend(conf.get('blame_backend'), ra_szz.repository)
             imp_files = ra_szz.get_impacted_files(fix_commit_hash=fix_commit, file_ext_to_parse=conf.get('file_ext_to_parse'), only_deleted_lines=conf.get('only_deleted_lines', True))
             bug_introducing_commits = ra_szz.find_bic(fix_commit_hash=fix_commit,
                                        impacted_files=imp_files,
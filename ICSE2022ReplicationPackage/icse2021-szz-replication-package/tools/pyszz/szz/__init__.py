@@ -6,3 +6,4 @@ from .r_szz import RSZZ
 from .ra_szz import RASZZ
 from .pd_szz import PyDrillerSZZ
 from .my_szz import MySZZ
+from .my_log_szz import MyLogSZZ
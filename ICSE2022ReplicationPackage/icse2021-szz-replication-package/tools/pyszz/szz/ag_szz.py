@@ -1,11 +1,12 @@
 import logging as log
 import traceback
-from typing import List, Set
+from typing import Dict, List, Set, Tuple
 from time import time as ts
 from git import Commit
 from pydriller import RepositoryMining
 
-from szz.core.abstract_szz import AbstractSZZ, ImpactedFile
+from szz.core.abstract_szz import AbstractSZZ, BlameData, ImpactedFile
+from szz.core.repo_index import ChangeSizeIndex, get_repo_index, iter_rev_list
 
 
 class AGSZZ(AbstractSZZ):
@@ -13,10 +14,63 @@ class AGSZZ(AbstractSZZ):
     Annotation-Graph SZZ implementation.
     """
 
+    # whether each modified line is blamed to a single BlameData, so that the iterations of the ignore revs fixpoint
+    # loop can blame again only the lines that may change. Subclasses whose _blame() does not hold it set it to False.
+    supports_incremental_reblame = True
+
     def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None, use_temp_dir: bool = True):
         super().__init__(repo_full_name, repo_url, repos_dir, use_temp_dir)
 
+    @property
+    def change_size_index(self) -> ChangeSizeIndex:
+        """
+         Getter of the index of the number of files modified by each commit of the repository, shared by all the SZZ
+         instances and persisted in the cache folder.
+
+         :returns ChangeSizeIndex change_size_index
+        """
+        return get_repo_index(ChangeSizeIndex, self.repository_path, self.cache_dir)
+
+    def _is_large_commit(self, commit_hash: str, max_change_size: int = 20) -> bool:
+        """
+        :param str commit_hash: hash of the commit
+        :param int max_change_size: max number of modified files
+        :returns bool True if the commit modifies more than max_change_size files
+        """
+        change_size = self.change_size_index.get(commit_hash)
+        if change_size is None:
+            # commit not reachable from any ref
+            return commit_hash in self._mine_commits_by_change_size(commit_hash, max_change_size)
+        return change_size > max_change_size
+
     def _exclude_commits_by_change_size(self, commit_hash: str, max_change_size: int = 20) -> Set[str]:
+        """
+        Walk the history from the given commit, in the order of git log, and collect the commits modifying more than
+        max_change_size files up to the first commit that does not.
+
+        :param str commit_hash: hash of the commit to start from
+        :param int max_change_size: max number of modified files
+        :returns Set[str] hashes of the commits to exclude
+        """
+        if not self._is_large_commit(commit_hash, max_change_size):
+            return set()
+
+        to_exclude = set()
+        for commit in iter_rev_list(self.repository_path, commit_hash):
+            change_size = self.change_size_index.get(commit)
+            if change_size is None:
+                return self._mine_commits_by_change_size(commit_hash, max_change_size)
+            if change_size > max_change_size:
+                to_exclude.add(commit)
+            else:
+                break
+
+        if len(to_exclude) > 0:
+            log.info(f'count of commits excluded by change size > {max_change_size}: {len(to_exclude)}')
+
+        return to_exclude
+
+    def _mine_commits_by_change_size(self, commit_hash: str, max_change_size: int = 20) -> Set[str]:
         to_exclude = set()
         repo_mining = RepositoryMining(self.repository_path, to_commit=commit_hash, order='reverse').traverse_commits()
         for commit in repo_mining:
@@ -51,6 +105,103 @@ class AGSZZ(AbstractSZZ):
 
         return blame_data
 
+    def _ag_annotate_incremental(self, fix_commit_hash: str, impacted_files: List['ImpactedFile'],
+                                 annotations: Dict[str, Tuple[Set[str], Dict[int, 'BlameData']]],
+                                 **kwargs) -> Tuple[Set['BlameData'], int]:
+        """
+        Same as _ag_annotate(), for the iterations of the ignore revs fixpoint loop. The blame data of each modified
+        line, comments included, is kept in annotations between the iterations: a file is blamed entirely the first
+        time, then only the line ranges holding a line attributed to one of the commits added to the ignore revs list
+        since the previous iteration are blamed again, as the other lines cannot change. The file is blamed entirely
+        if a commit was removed from the list.
+
+        Blame data are equal when they refer to the same line number of the same file, whatever the commit, so the
+        blame data kept in the set depend on the order of the git blame output. A file having such lines attributed
+        to different commits is blamed entirely at each iteration.
+
+        :param str fix_commit_hash: hash of the fix commit
+        :param List[ImpactedFile] impacted_files: list of impacted files in fix commit
+        :param Dict[str, Tuple[Set[str], Dict[int, BlameData]]] annotations: ignore revs list and blame data of the
+            modified lines of each impacted file, indexed by file path and line number, updated in place
+        :returns Tuple[Set[BlameData], int] blame data, as returned by _ag_annotate(), and number of lines blamed
+        """
+        if not self.supports_incremental_reblame:
+            blamed_count = sum(len(imp_file.modified_lines) for imp_file in impacted_files)
+            return self._ag_annotate(fix_commit_hash, impacted_files, **kwargs), blamed_count
+
+        ignore_revs = set(kwargs.get('ignore_revs_list') or list())
+        blame_data = set()
+        blamed_count = 0
+        for imp_file in impacted_files:
+            previous_ignore_revs, annotation = annotations.pop(imp_file.file_path, (None, None))
+            try:
+                if annotation is not None and previous_ignore_revs <= ignore_revs and not self._has_ambiguous_lines(annotation):
+                    lines_to_blame = self._lines_to_reblame(imp_file.modified_lines, annotation,
+                                                            ignore_revs - previous_ignore_revs)
+                    if lines_to_blame:
+                        blamed_count += len(lines_to_blame)
+                        annotation = dict(annotation)
+                        annotation.update(self._annotate(fix_commit_hash, imp_file.file_path, lines_to_blame, **kwargs))
+                        if self._has_ambiguous_lines(annotation):
+                            annotation = None
+
+                if annotation is None:
+                    blamed_count += len(imp_file.modified_lines)
+                    annotation = self._annotate(fix_commit_hash, imp_file.file_path, imp_file.modified_lines, **kwargs)
+            except:
+                print(traceback.format_exc())
+                continue
+
+            annotations[imp_file.file_path] = (ignore_revs, annotation)
+            # reset for each file, so that only the blame data of the last file are returned: deliberately kept
+            # identical to _ag_annotate(), whose results the incremental iterations must reproduce
+            blame_data = set()
+            for bd in annotation.values():
+                if self._is_comment_line(bd.hexsha, bd.file_path, bd.line_num):
+                    log.info(f"skip comment line ({bd.line_num}): {bd.line_str}")
+                    continue
+                blame_data.add(bd)
+
+        return blame_data, blamed_count
+
+    def _annotate(self, fix_commit_hash: str, file_path: str, modified_lines: List[int], **kwargs) -> Dict[int, 'BlameData']:
+        return self._blame_lines(
+            rev='{commit_id}^'.format(commit_id=fix_commit_hash),
+            file_path=file_path,
+            modified_lines=modified_lines,
+            ignore_whitespaces=True,
+            skip_comments=False,
+            **kwargs
+        )
+
+    def _lines_to_reblame(self, modified_lines: List[int], annotation: Dict[int, 'BlameData'],
+                          ignored_commits: Set[str]) -> List[int]:
+        """
+        Select the line ranges to blame again. Whole ranges are blamed, as git blame detects moved and copied lines
+        on blocks of contiguous lines.
+
+        :param List[int] modified_lines: modified lines of the file
+        :param Dict[int, BlameData] annotation: current blame data of the modified lines, indexed by line number
+        :param Set[str] ignored_commits: commits added to the ignore revs list since the previous iteration
+        :returns List[int] modified lines to blame again
+        """
+        lines_to_blame = list()
+        for line_range in self._parse_line_ranges(modified_lines):
+            start, end = (int(n) for n in line_range.split(','))
+            range_lines = list(range(start, end + 1))
+            if any(line not in annotation or annotation[line].hexsha in ignored_commits for line in range_lines):
+                lines_to_blame.extend(range_lines)
+        return lines_to_blame
+
+    @staticmethod
+    def _has_ambiguous_lines(annotation: Dict[int, 'BlameData']) -> bool:
+        """ Check if different commits are blamed for the same line number of the same file """
+        commits = dict()
+        for bd in annotation.values():
+            if commits.setdefault((bd.file_path, bd.line_num), bd.hexsha) != bd.hexsha:
+                return True
+        return False
+
     # TODO: add type check on kwargs
     def find_bic(self, fix_commit_hash: str, impacted_files: List['ImpactedFile'], **kwargs) -> Set[Commit]:
         """
@@ -79,15 +230,18 @@ class AGSZZ(AbstractSZZ):
         start = ts()
         blame_data = list()
         commits_to_ignore = set()
+        annotations = dict()
+        blamed_counts = list()
         while to_blame:
             log.info(f"excluding commits: {params['ignore_revs_list']}")
-            blame_data = self._ag_annotate(fix_commit_hash, impacted_files, **params)
+            blame_data, blamed_count = self._ag_annotate_incremental(fix_commit_hash, impacted_files, annotations, **params)
+            blamed_counts.append(blamed_count)
 
             new_commits_to_ignore = set()
             for bd in blame_data:
-                if bd.commit.hexsha not in new_commits_to_ignore:
-                    if bd.commit.hexsha not in commits_to_ignore:
-                        new_commits_to_ignore.update(self._exclude_commits_by_change_size(bd.commit.hexsha, max_change_size=max_change_size))
+                if bd.hexsha not in new_commits_to_ignore:
+                    if bd.hexsha not in commits_to_ignore:
+                        new_commits_to_ignore.update(self._exclude_commits_by_change_size(bd.hexsha, max_change_size=max_change_size))
 
             if len(new_commits_to_ignore) == 0:
                 to_blame = False
@@ -98,6 +252,8 @@ class AGSZZ(AbstractSZZ):
             commits_to_ignore.update(new_commits_to_ignore)
             params['ignore_revs_list'] = list(commits_to_ignore)
 
-        bic = set([bd.commit for bd in blame_data if bd.commit.hexsha not in self._exclude_commits_by_change_size(bd.commit.hexsha, max_change_size)])
+        log.info(f"blame iterations: {len(blamed_counts)}, lines blamed per iteration: {blamed_counts}")
+
+        bic = set([bd.commit for bd in blame_data if not self._is_large_commit(bd.hexsha, max_change_size)])
 
         return bic
@@ -1,17 +1,24 @@
 import logging as log
 import ntpath
 import os
+import threading
 from abc import ABC, abstractmethod
+from array import array
 from shutil import copytree
 from enum import Enum
 from shutil import rmtree
-from typing import List, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from tempfile import mkdtemp
 
 from git import Commit, Repo
-from pydriller import ModificationType, GitRepository as PyDrillerGitRepo
+from pydriller import GitRepository as PyDrillerGitRepo
 
-from .comment_parser import parse_comments
+from .blame_backend import BlameBackend, GitBlameBackend
+from .blob_store import blob_line_cache
+from .cache import BlameCache, SQLiteCache
+from .comment_parser import CommentIndex, CommentIndexStore, parse_comments
+from .git_batch import GitObjectReader, object_readers
+from .git_diff import iter_commit_diffs
 
 
 class DetectLineMoved(Enum):
@@ -91,8 +98,18 @@ class AbstractSZZ(ABC):
 
             self._repository = Repo(self._repository_path)
 
+        if repos_dir:
+            self._cache_dir = os.path.join(repos_dir, '.szz_cache', repo_full_name.replace('/', '_'))
+        else:
+            self._cache_dir = os.path.join(self.__temp_dir, '.szz_cache')
+        self._blame_cache = BlameCache(os.path.join(self._cache_dir, 'cache.db'))
+        self._blame_backend = GitBlameBackend(self._repository)
+        self._commits = CommitCache(self._repository)
+        self._comment_indexes = CommentIndexStore(SQLiteCache(os.path.join(self._cache_dir, 'cache.db'), 'comments'))
+
     def __del__(self):
         log.info("cleanup objects...")
+        self.__close_caches()
         self.__cleanup_repo()
         self.__clear_gitpython()
 
@@ -114,6 +131,50 @@ class AbstractSZZ(ABC):
         """
         return self._repository_path
 
+    @property
+    def object_reader(self) -> GitObjectReader:
+        """
+         Getter of the git cat-file based object reader of the current repository, one per thread.
+
+         :returns GitObjectReader object_reader
+        """
+        return object_readers.get(self._repository_path)
+
+    @property
+    def blame_backend(self) -> BlameBackend:
+        """
+         Getter of the backend used to run git blame (git command line by default).
+
+         :returns BlameBackend blame_backend
+        """
+        return self._blame_backend
+
+    @blame_backend.setter
+    def blame_backend(self, blame_backend: BlameBackend):
+        self._blame_backend = blame_backend
+
+    @property
+    def cache_dir(self) -> str:
+        """
+         Getter of the folder where persistent caches of the current repository are stored.
+
+         :returns str cache_dir
+        """
+        return self._cache_dir
+
+    @property
+    def blame_cache(self) -> BlameCache:
+        """
+         Getter of the persistent blame cache, None if blame results are not cached.
+
+         :returns BlameCache blame_cache
+        """
+        return self._blame_cache
+
+    @blame_cache.setter
+    def blame_cache(self, blame_cache: BlameCache):
+        self._blame_cache = blame_cache
+
     @abstractmethod
     def find_bic(self, fix_commit_hash: str, impacted_files: List['ImpactedFile'], **kwargs) -> Set[Commit]:
         """
@@ -144,35 +205,88 @@ class AbstractSZZ(ABC):
 
         fix_commit = PyDrillerGitRepo(self.repository_path).get_commit(fix_commit_hash)
         for mod in fix_commit.modifications:
-            # skip newly added files
-            if not mod.old_path:
+            lines_added = [added[0] for added in mod.diff_parsed['added']]
+            lines_deleted = [deleted[0] for deleted in mod.diff_parsed['deleted']]
+            impacted_file = self._make_impacted_file(mod.old_path, mod.new_path, lines_added, lines_deleted,
+                                                     file_ext_to_parse, only_deleted_lines)
+            if impacted_file:
+                impacted_files.append(impacted_file)
+
+        log.info([str(f) for f in impacted_files])
+
+        return impacted_files
+
+    def get_impacted_files_bulk(self, fix_commit_hashes: List[str],
+                                file_ext_to_parse: List[str] = None,
+                                only_deleted_lines: bool = True) -> Iterator[Tuple[str, List['ImpactedFile']]]:
+        """
+         Same as get_impacted_files() for many fix commits at once. The diffs of all the fix commits are streamed
+         through a single git log process, instead of building a PyDriller commit for each of them, and the
+         impacted files of each fix commit are returned as soon as its diff has been read.
+
+        :param List[str] fix_commit_hashes: hashes of the fix commits to parse
+        :param List[str] file_ext_to_parse: parse only the given file extensions
+        :param only_deleted_lines: considers as modified lines only the line numbers that are deleted and added.
+            By default, only deleted lines are considered
+        :returns Iterator[Tuple[str, List[ImpactedFile]]] (fix commit hash, impacted files) of each fix commit, in the
+            given order. Duplicated hashes are returned once.
+        """
+        hash_by_sha = dict()
+        for fix_commit_hash in fix_commit_hashes:
+            sha = self.object_reader.resolve(f'{fix_commit_hash}^{{commit}}')
+            if sha is None:
+                log.error(f'commit not found: {fix_commit_hash}')
                 continue
+            hash_by_sha.setdefault(sha, fix_commit_hash)
 
-            # filter files by extension
-            if file_ext_to_parse:
-                ext = mod.filename.split('.')
-                if len(ext) < 2 or (len(ext) > 1 and ext[1] not in file_ext_to_parse):
-                    log.info(f"skip file: {mod.filename}")
-                    continue
+        for sha, file_diffs in iter_commit_diffs(self.repository_path, list(hash_by_sha)):
+            impacted_files = list()
+            for file_diff in file_diffs:
+                impacted_file = self._make_impacted_file(file_diff.old_path, file_diff.new_path, file_diff.added_lines,
+                                                         file_diff.deleted_lines, file_ext_to_parse, only_deleted_lines)
+                if impacted_file:
+                    impacted_files.append(impacted_file)
 
-            file_path = mod.new_path
-            if mod.change_type == ModificationType.DELETE or mod.change_type == ModificationType.RENAME:
-                file_path = mod.old_path
+            log.info([str(f) for f in impacted_files])
 
-            lines_added = [added[0] for added in mod.diff_parsed['added']]
-            lines_deleted = [deleted[0] for deleted in mod.diff_parsed['deleted']]
+            yield hash_by_sha[sha], impacted_files
+
+    def _make_impacted_file(self, old_path: str, new_path: str, lines_added: List[int], lines_deleted: List[int],
+                            file_ext_to_parse: List[str] = None, only_deleted_lines: bool = True) -> Optional['ImpactedFile']:
+        """
+         Build the ImpactedFile of a file modified by a fix commit, None if the file is skipped.
+
+        :param str old_path: path of the file before the fix commit, None for added files
+        :param str new_path: path of the file after the fix commit, None for deleted files
+        :param List[int] lines_added: added line numbers (in the new file)
+        :param List[int] lines_deleted: deleted line numbers (in the old file)
+        :param List[str] file_ext_to_parse: parse only the given file extensions
+        :param only_deleted_lines: considers as modified lines only the line numbers that are deleted and added
+        :returns ImpactedFile impacted_file
+        """
+        # skip newly added files
+        if not old_path:
+            return None
 
-            if only_deleted_lines:
-                mod_lines = lines_deleted
-            else:
-                mod_lines = [ld for ld in lines_deleted if ld in lines_added]
+        # filter files by extension
+        if file_ext_to_parse:
+            filename = ntpath.basename(new_path or old_path)
+            ext = filename.split('.')
+            if len(ext) < 2 or (len(ext) > 1 and ext[1] not in file_ext_to_parse):
+                log.info(f"skip file: {filename}")
+                return None
 
-            if len(mod_lines) > 0:
-                impacted_files.append(ImpactedFile(file_path, mod_lines))
+        # deleted and renamed files are blamed with their old path
+        file_path = old_path if new_path is None or new_path != old_path else new_path
 
-        log.info([str(f) for f in impacted_files])
+        if only_deleted_lines:
+            mod_lines = lines_deleted
+        else:
+            mod_lines = [ld for ld in lines_deleted if ld in lines_added]
 
-        return impacted_files
+        if len(mod_lines) > 0:
+            return ImpactedFile(file_path, mod_lines)
+        return None
 
     def _blame(self, rev: str,
                file_path: str,
@@ -202,6 +316,26 @@ class AbstractSZZ(ABC):
         :returns Set[BlameData] a set of bug introducing commits candidates, represented by BlameData object
         """
 
+        return set(self._blame_lines(rev, file_path, modified_lines, skip_comments, ignore_revs_list, ignore_revs_file_path,
+                                     ignore_whitespaces, detect_move_within_file, detect_move_from_other_files).values())
+
+    def _blame_lines(self, rev: str,
+                     file_path: str,
+                     modified_lines: List[int],
+                     skip_comments: bool = False,
+                     ignore_revs_list: List[str] = None,
+                     ignore_revs_file_path: str = None,
+                     ignore_whitespaces: bool = False,
+                     detect_move_within_file: bool = False,
+                     detect_move_from_other_files: 'DetectLineMoved' = None
+                     ) -> Dict[int, 'BlameData']:
+        """
+         Same as _blame(), but the blame data is returned for each modified line. All the line ranges are blamed
+         with a single git blame call. Lines skipped because they are comments are not in the returned dict.
+
+        :returns Dict[int, BlameData] blame data of the modified lines, indexed by line number in the blamed revision
+        """
+
         kwargs = dict()
         if ignore_whitespaces:
             kwargs['w'] = True
@@ -218,27 +352,75 @@ class AbstractSZZ(ABC):
         if detect_move_from_other_files and detect_move_from_other_files == DetectLineMoved.ANY_COMMIT:
             kwargs['C'] = [True, True, True]
 
-        bug_introd_commits = set()
+        blamed_lines = dict()
         mod_line_ranges = self._parse_line_ranges(modified_lines)
         print(mod_line_ranges)
         log.info(f"processing file: {file_path}")
-        for mod_line_ranges in mod_line_ranges:
-            for entry in self.repository.blame_incremental(**kwargs, rev=rev, L=mod_line_ranges, file=file_path):
-                # entry.linenos = input lines to blame (current lines)
-                # entry.orig_lineno = output line numbers from blame (previous commit lines from blame)
-                for line_num in entry.orig_linenos:
-                    source_file_content = self.repository.git.show(f"{entry.commit.hexsha}:{entry.orig_path}")
-                    line_str = source_file_content.split('\n')[line_num - 1].strip()
-                    b_data = BlameData(entry.commit, line_num, line_str, entry.orig_path)
+        for final_line_num, commit_hexsha, orig_path, line_num in self._blame_entries(rev, file_path, mod_line_ranges, kwargs):
+            source_file_lines = self._get_file_lines(commit_hexsha, orig_path)
+            line_str = source_file_lines[line_num - 1].strip()
+            b_data = BlameData.from_hexsha(self._commits, commit_hexsha, line_num, line_str, orig_path)
+
+            if skip_comments and self._is_comment_line(commit_hexsha, orig_path, line_num):
+                log.info(f"skip comment line ({line_num}): {line_str}")
+                continue
+
+            log.info(b_data)
+            blamed_lines[final_line_num] = b_data
+
+        return blamed_lines
+
+    def _blame_entries(self, rev: str, file_path: str, line_ranges: List[str], blame_kwargs: dict) -> List[Tuple[int, str, str, int]]:
+        """
+        Run a single git blame on all the given line ranges, looking up the result in the blame cache first.
+
+        :param str rev: commit revision
+        :param str file_path: path of file to blame
+        :param List[str] line_ranges: line ranges in the format of the '-L' param of git blame
+        :param dict blame_kwargs: git blame options, as built by _blame_lines()
+        :returns List[Tuple[int, str, str, int]] list of (line number, commit hash, original path, original line number)
+        """
+        if not line_ranges:
+            return list()
+
+        cache_key = None
+        if self.blame_cache is not None:
+            ignore_revs_file = blame_kwargs.get('ignore-revs-file')
+            cache_key = BlameCache.make_key(self.object_reader.resolve(rev), file_path, line_ranges,
+                                            dict(blame_kwargs, backend=self.blame_backend.name),
+                                            BlameCache.file_digest(ignore_revs_file) if ignore_revs_file else None)
+            cached = self.blame_cache.get_json(cache_key)
+            if cached is not None:
+                return [tuple(e) for e in cached]
 
-                    if skip_comments and self._is_comment(line_num, source_file_content, ntpath.basename(b_data.file_path)):
-                        log.info(f"skip comment line ({line_num}): {line_str}")
-                        continue
+        entries = self.blame_backend.blame(rev, file_path, line_ranges, blame_kwargs)
 
-                    log.info(b_data)
-                    bug_introd_commits.add(b_data)
+        if cache_key is not None:
+            self.blame_cache.put_json(cache_key, entries)
 
-        return bug_introd_commits
+        return entries
+
+    def _get_file_lines(self, commit_hexsha: str, file_path: str) -> List[str]:
+        """
+        Get the lines of a file at the given commit. The lines are cached in memory and shared by all SZZ instances.
+
+        :param str commit_hexsha: hash of the commit
+        :param str file_path: path of the file
+        :returns List[str] lines of the file
+        """
+        return blob_line_cache.get_lines((self.repository_path, commit_hexsha, file_path),
+                                         lambda: self._read_file(commit_hexsha, file_path))
+
+    def _read_file(self, commit_hexsha: str, file_path: str) -> str:
+        """
+        Read the content of a file at the given commit, as returned by 'git show <commit>:<path>'.
+
+        :param str commit_hexsha: hash of the commit
+        :param str file_path: path of the file
+        :returns str content of the file
+        """
+        content = str(self.object_reader.read_blob(commit_hexsha, file_path), 'utf-8', errors='replace')
+        return content[:-1] if content.endswith('\n') else content
 
     def _parse_line_ranges(self, modified_lines: List) -> List[str]:
         """
@@ -283,11 +465,23 @@ class AbstractSZZ(ABC):
         """
 
         comment_ranges = parse_comments(source_file_content, source_file_name, self.__temp_dir)
+        return CommentIndex(comment_ranges).contains(line_num)
 
-        for comment_range in comment_ranges:
-            if comment_range.start <= line_num <= comment_range.end:
-                return True
-        return False
+    def _is_comment_line(self, commit_hexsha: str, file_path: str, line_num: int) -> bool:
+        """
+        Check if the given line of a file at a commit is a comment. Comments are parsed once per blob,
+        the resulting comment index is memoized in memory and in the persistent cache.
+
+        :param str commit_hexsha: hash of the commit
+        :param str file_path: path of the file
+        :param int line_num: line number
+        :returns bool
+        """
+        blob_sha = self.object_reader.resolve(f"{commit_hexsha}:{file_path}")
+        comment_index = self._comment_indexes.get(blob_sha, ntpath.basename(file_path),
+                                                  lambda: '\n'.join(self._get_file_lines(commit_hexsha, file_path)),
+                                                  self.__temp_dir)
+        return comment_index.contains(line_num)
 
     def _set_working_tree_to_commit(self, commit: str):
         # self.repository.head.reference = self.repository.commit(fix_commit_hash)
@@ -295,6 +489,16 @@ class AbstractSZZ(ABC):
         self.repository.head.reset(commit=commit, index=True, working_tree=True)
         assert not self.repository.head.is_detached
 
+    def __close_caches(self):
+        """ Close the persistent caches, logging their hit/miss counters """
+        if getattr(self, '_blame_cache', None) is not None:
+            log.info(f"blame cache stats: {self._blame_cache.stats()}")
+            self._blame_cache.close()
+        if getattr(self, '_comment_indexes', None) is not None:
+            self._comment_indexes.disk_cache.close()
+        if getattr(self, '_repository_path', None):
+            object_readers.release(self._repository_path)
+
     def __cleanup_repo(self):
         """ Cleanup of local repository used by SZZ """
         if self.use_temp_dir:
@@ -321,8 +525,36 @@ class AbstractSZZ(ABC):
             print("may be the init commit. Error message: " + str(e))
             return None
 
+_path_ids = dict()
+_paths = list()
+_paths_lock = threading.Lock()
+
+
+def intern_path(path: str) -> int:
+    """
+    Get the id of a file path, so that records referring to the same path share a single string.
+
+    :param str path: file path
+    :returns int id of the path
+    """
+    path_id = _path_ids.get(path)
+    if path_id is None:
+        with _paths_lock:
+            path_id = _path_ids.get(path)
+            if path_id is None:
+                path_id = _path_ids[path] = len(_paths)
+                _paths.append(path)
+    return path_id
+
+
+def path_of(path_id: int) -> str:
+    return _paths[path_id]
+
+
 class ImpactedFile:
-    """ Data class to represent impacted files """
+    """ Data class to represent impacted files. Lines are stored in an int array and the path as an interned id """
+    __slots__ = ('_path_id', '_modified_lines')
+
     def __init__(self, file_path: str, modified_lines: List[int]):
         """
         :param str file_path: previous path of the current impacted file
@@ -332,12 +564,61 @@ class ImpactedFile:
         self.file_path = file_path
         self.modified_lines = modified_lines
 
+    @property
+    def file_path(self) -> str:
+        return path_of(self._path_id)
+
+    @file_path.setter
+    def file_path(self, file_path: str):
+        self._path_id = intern_path(file_path)
+
+    @property
+    def modified_lines(self) -> array:
+        return self._modified_lines
+
+    @modified_lines.setter
+    def modified_lines(self, modified_lines: List[int]):
+        self._modified_lines = array('i', modified_lines)
+
     def __str__(self) -> str:
-        return f'{self.__class__.__name__}(file_path="{self.file_path}",modified_lines={self.modified_lines})'
+        return f'{self.__class__.__name__}(file_path="{self.file_path}",modified_lines={self.modified_lines.tolist()})'
+
+
+class CommitCache:
+    """
+    GitPython Commit objects of a repository, built once per commit: the blame data of the same commit share a single
+    Commit, whose metadata is read from git once.
+    """
+    __slots__ = ('repo', '_commits')
+
+    def __init__(self, repo: Repo):
+        """
+        :param Repo repo: GitPython Repo object of the repository
+        """
+        self.repo = repo
+        self._commits: Dict[bytes, Commit] = dict()
+
+    def add(self, commit: Commit):
+        self._commits.setdefault(commit.binsha, commit)
+
+    def get(self, binsha: bytes) -> Commit:
+        """
+        :param bytes binsha: binary hash of the commit
+        :returns Commit commit
+        """
+        commit = self._commits.get(binsha)
+        if commit is None:
+            commit = self._commits.setdefault(binsha, Commit(self.repo, binsha))
+        return commit
 
 
 class BlameData:
-    """ Data class to represent blame data """
+    """
+    Data class to represent blame data. The commit is stored as its binary hash, the GitPython Commit object is
+    only built when the commit property is first read, and shared through the CommitCache of the repository.
+    """
+    __slots__ = ('_commits', '_binsha', 'line_num', 'line_str', '_path_id')
+
     def __init__(self, commit: Commit, line_num: int, line_str: str, file_path: str):
         """
         :param Commit commit: commit detected by git blame
@@ -346,18 +627,58 @@ class BlameData:
         :param str file_path: path of the blamed file
         :returns BlameData
         """
-        self.commit = commit
+        self._commits = CommitCache(commit.repo)
+        self._commits.add(commit)
+        self._binsha = commit.binsha
         self.line_num = line_num
         self.line_str = line_str
-        self.file_path = file_path
+        self._path_id = intern_path(file_path)
+
+    @classmethod
+    def from_hexsha(cls, commits: CommitCache, hexsha: str, line_num: int, line_str: str, file_path: str) -> 'BlameData':
+        """
+        Build the blame data of a commit given its hash, without creating the Commit object.
+
+        :param CommitCache commits: Commit objects of the repository of the commit
+        :param str hexsha: full hash of the commit detected by git blame
+        :param int line_num: number of the blamed line
+        :param str line_str: content of the blamed line
+        :param str file_path: path of the blamed file
+        :returns BlameData
+        """
+        blame_data = cls.__new__(cls)
+        blame_data._commits = commits
+        blame_data._binsha = bytes.fromhex(hexsha)
+        blame_data.line_num = line_num
+        blame_data.line_str = line_str
+        blame_data._path_id = intern_path(file_path)
+        return blame_data
+
+    @property
+    def commit(self) -> Commit:
+        """
+         Getter of the GitPython Commit object of the blamed commit. The first read builds it, the next reads of any
+         blame data of the same commit return the same object. Use hexsha when only the hash is needed.
+
+         :returns Commit commit
+        """
+        return self._commits.get(self._binsha)
+
+    @property
+    def hexsha(self) -> str:
+        return self._binsha.hex()
+
+    @property
+    def file_path(self) -> str:
+        return path_of(self._path_id)
 
     def __str__(self) -> str:
-        return f'{self.__class__.__name__}(commit={self.commit.hexsha},line_num={self.line_num},file_path="{self.file_path}",line_str="{self.line_str}")'
+        return f'{self.__class__.__name__}(commit={self.hexsha},line_num={self.line_num},file_path="{self.file_path}",line_str="{self.line_str}")'
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, self.__class__):
             return False
-        return self.file_path == other.file_path and self.line_num == other.line_num
+        return self._path_id == other._path_id and self.line_num == other.line_num
 
     def __hash__(self) -> int:
-        return 31 * hash(self.line_num) + hash(self.file_path)
+        return 31 * hash(self.line_num) + self._path_id
@@ -0,0 +1,329 @@
+import atexit
+import itertools
+import json
+import logging as log
+import os
+import subprocess
+import threading
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+DAEMON_CLASS = 'ASTMapEvalDaemon'
+DAEMON_DIR = 'daemon'
+OUTPUT_DIR = 'outputs'
+DEFAULT_POOL_SIZE = 2
+DEFAULT_TIMEOUT = 600
+
+
+class ASTMapError(Exception):
+    pass
+
+
+class ASTMapDaemonCrashed(ASTMapError):
+    pass
+
+
+def ast_map_command(project: str, commit_id: str, file_path: str, output_path: str) -> List[str]:
+    return ['java', '-jar', 'ASTMapEval.jar', '-p', project, '-c', commit_id, '-o', output_path, '-f', file_path]
+
+
+def read_mapping_results(output_path: str) -> list:
+    """ Read and delete the output file of an ASTMapEval run """
+    try:
+        with open(output_path) as f:
+            return json.load(f)
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
+class LatencyStats:
+    """ Count and latency of the mapping calls """
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, elapsed: float, failed: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.failures += int(failed)
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def stats(self) -> dict:
+        mean = self.total_time / self.calls if self.calls else 0.0
+        return {'calls': self.calls, 'failures': self.failures, 'mean_ms': round(mean * 1000, 1),
+                'max_ms': round(self.max_time * 1000, 1), 'total_s': round(self.total_time, 1)}
+
+
+class ASTMapDaemon:
+    """
+    Client of a long-running ASTMapEvalDaemon JVM, which maps (commit, file) pairs with ASTMapEval without paying
+    the JVM startup on each call. Requests are pipelined: they are written to the daemon as soon as they are
+    submitted, a reader thread resolves their futures as the replies come back. If the daemon dies, the pending
+    requests fail with ASTMapDaemonCrashed and the daemon is respawned by the next request. Each spawned process has
+    its own pending requests, so that the reader of a dead process never fails the requests of the next one.
+    """
+
+    def __init__(self, ast_map_path: str, latency: LatencyStats = None):
+        """
+        :param str ast_map_path: directory of ASTMapEval.jar and its dependencies
+        :param LatencyStats latency: stats updated with the latency of each call
+        """
+        self.ast_map_path = ast_map_path
+        self.latency = latency if latency is not None else LatencyStats()
+        self.restarts = 0
+
+        self._process = None
+        self._started = False
+        # pending requests of the current process, indexed by request id
+        self._pending = dict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _build(self):
+        """ Compile the daemon against ASTMapEval.jar, if its class is missing or older than its source """
+        source = os.path.join(self.ast_map_path, DAEMON_DIR, f'{DAEMON_CLASS}.java')
+        class_file = os.path.join(self.ast_map_path, DAEMON_DIR, 'classes', f'{DAEMON_CLASS}.class')
+        if os.path.exists(class_file) and os.path.getmtime(class_file) >= os.path.getmtime(source):
+            return
+        subprocess.run(['javac', '-cp', 'ASTMapEval.jar', '-d', os.path.join(DAEMON_DIR, 'classes'), source],
+                       cwd=self.ast_map_path, check=True, capture_output=True)
+
+    def _start(self):
+        self._build()
+        classpath = os.pathsep.join(['ASTMapEval.jar', os.path.join(DAEMON_DIR, 'classes')])
+        self._process = subprocess.Popen(['java', '-cp', classpath, DAEMON_CLASS], cwd=self.ast_map_path,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._pending = dict()
+        reader = threading.Thread(target=self._read_replies, args=(self._process, self._pending), daemon=True)
+        reader.start()
+
+    def _read_replies(self, process: subprocess.Popen, pending: dict):
+        """
+        Resolve the requests of a process as its replies come back, and fail the remaining ones when it dies.
+
+        :param Popen process: daemon process
+        :param dict pending: pending requests of the process, indexed by request id
+        """
+        for raw_line in process.stdout:
+            try:
+                reply = json.loads(raw_line)
+            except ValueError:
+                continue
+
+            # not under the lock: a submit blocked on a full stdin pipe must not block the replies
+            request = pending.pop(reply.get('id'), None)
+            if request is None:
+                continue
+
+            future, output_path, start = request
+            if reply.get('ok'):
+                try:
+                    future.set_result(read_mapping_results(output_path))
+                except Exception as e:
+                    future.set_exception(ASTMapError(f'unable to read the mapping results {output_path}: {e}'))
+            else:
+                future.set_exception(ASTMapError(reply.get('error')))
+            self.latency.add(perf_counter() - start, failed=not reply.get('ok'))
+
+        # EOF: the daemon died, fail the requests it will never answer
+        process.wait()
+        with self._lock:
+            if self._process is process:
+                self._process = None
+            crashed = list(pending.values())
+            pending.clear()
+        for future, output_path, start in crashed:
+            future.set_exception(ASTMapDaemonCrashed(f'ASTMapEval daemon terminated with code {process.returncode}'))
+            self.latency.add(perf_counter() - start, failed=True)
+        if crashed:
+            log.error(f'ASTMapEval daemon crashed ({process.returncode}), {len(crashed)} requests failed')
+
+    def submit(self, project: str, commit_id: str, file_path: str, output_path: str) -> Future:
+        """
+        Send a mapping request to the daemon, without waiting for the previous requests.
+
+        :param str project: full name of the project, as expected by ASTMapEval
+        :param str commit_id: hash of the commit whose changes are mapped
+        :param str file_path: path of the mapped file in the commit
+        :param str output_path: output file of the request, must be unique among the pending requests
+        :returns Future future resolved with the mapping results (the parsed output of ASTMapEval)
+        """
+        future = Future()
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                if self._started:
+                    self.restarts += 1
+                    log.warning(f'restarting ASTMapEval daemon (restart {self.restarts})')
+                self._start()
+                self._started = True
+
+            request_id = next(self._ids)
+            request = {'id': request_id, 'project': project, 'commit': commit_id, 'file': file_path, 'output': output_path}
+            self._pending[request_id] = (future, output_path, perf_counter())
+            try:
+                self._process.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                future.set_exception(ASTMapDaemonCrashed(f'unable to write to the ASTMapEval daemon: {e}'))
+        return future
+
+    def kill(self):
+        """ Kill the daemon, e.g. when it hangs: its pending requests fail and the next request respawns it """
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def close(self):
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process is not None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=5)
+            except Exception:
+                process.kill()
+
+
+class ASTMapDaemonPool:
+    """
+    Pool of ASTMapEval daemons shared by the workers of the process. Each request goes to the daemon with the fewest
+    pending requests. If the daemons cannot be built or started (e.g. no JDK), every request falls back to a one-shot
+    'java -jar ASTMapEval.jar' run.
+    """
+
+    def __init__(self, ast_map_path: str, size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        """
+        :param str ast_map_path: directory of ASTMapEval.jar and its dependencies
+        :param int size: number of daemons
+        :param float timeout: max time in seconds to wait for a mapping, the daemon is killed when it is exceeded
+        """
+        self.ast_map_path = ast_map_path
+        self.temp_dir = os.path.join(ast_map_path, 'temp', OUTPUT_DIR)
+        self.timeout = timeout
+        self.latency = LatencyStats()
+        self.use_daemons = True
+
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self._daemons = [ASTMapDaemon(ast_map_path, self.latency) for _ in range(max(1, size))]
+        self._lock = threading.Lock()
+
+    def _output_path(self) -> str:
+        # one output file per call, so that concurrent mappings never overwrite each other's results
+        return os.path.join(self.temp_dir, f'{uuid.uuid4().hex}.json')
+
+    def _submit(self, project: str, commit_id: str, file_path: str) -> Tuple[Optional[ASTMapDaemon], Optional[Future]]:
+        if not self.use_daemons:
+            return None, None
+
+        with self._lock:
+            daemon = min(self._daemons, key=lambda d: d.pending)
+        try:
+            return daemon, daemon.submit(project, commit_id, file_path, self._output_path())
+        except (OSError, subprocess.CalledProcessError) as e:
+            log.error(f'unable to start the ASTMapEval daemon, falling back to one-shot runs: {e}')
+            self.use_daemons = False
+            return None, None
+
+    def submit(self, project: str, commit_id: str, file_path: str) -> Optional[Future]:
+        """
+        Submit a mapping request to the least busy daemon, without waiting for its result.
+
+        :param str project: full name of the project, as expected by ASTMapEval
+        :param str commit_id: hash of the commit whose changes are mapped
+        :param str file_path: path of the file in the commit
+        :returns Future future resolved with the mapping results, None if the daemons are not available
+        """
+        return self._submit(project, commit_id, file_path)[1]
+
+    def map(self, project: str, commit_id: str, file_path: str) -> list:
+        """
+        Map the changes of a file in a commit, retrying once if the daemon crashed.
+
+        :param str project: full name of the project, as expected by ASTMapEval
+        :param str commit_id: hash of the commit whose changes are mapped
+        :param str file_path: path of the file in the commit
+        :returns list mapping results (the parsed output of ASTMapEval)
+        """
+        for attempt in range(2):
+            daemon, future = self._submit(project, commit_id, file_path)
+            if future is None:
+                return self.map_once(project, commit_id, file_path)
+            try:
+                return future.result(timeout=self.timeout)
+            except ASTMapDaemonCrashed:
+                if attempt == 1:
+                    raise
+            except FutureTimeoutError:
+                log.error(f'ASTMapEval timed out on {project} {commit_id} {file_path}, killing its daemon')
+                daemon.kill()
+                raise
+
+    def map_once(self, project: str, commit_id: str, file_path: str) -> list:
+        """ Map the changes of a file in a commit with a one-shot ASTMapEval run """
+        output_path = self._output_path()
+        start = perf_counter()
+        try:
+            subprocess.run(ast_map_command(project, commit_id, file_path, output_path),
+                           cwd=self.ast_map_path, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            results = read_mapping_results(output_path)
+        except Exception:
+            self.latency.add(perf_counter() - start, failed=True)
+            raise
+        self.latency.add(perf_counter() - start)
+        return results
+
+    def stats(self) -> dict:
+        stats = self.latency.stats()
+        stats['daemons'] = len(self._daemons) if self.use_daemons else 0
+        stats['restarts'] = sum(daemon.restarts for daemon in self._daemons)
+        return stats
+
+    def close(self):
+        for daemon in self._daemons:
+            daemon.close()
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+def get_daemon_pool(ast_map_path: str, size: int = DEFAULT_POOL_SIZE) -> ASTMapDaemonPool:
+    """
+    Get the daemon pool of the given ASTMapEval directory, shared by all the SZZ instances of the process.
+
+    :param str ast_map_path: directory of ASTMapEval.jar and its dependencies
+    :param int size: number of daemons, only used when the pool is created
+    :returns ASTMapDaemonPool pool
+    """
+    key = os.path.abspath(ast_map_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ASTMapDaemonPool(key, size)
+        return pool
+
+
+def close_daemon_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            log.info(f'ASTMapEval stats {pool.ast_map_path}: {pool.stats()}')
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_daemon_pools)
@@ -0,0 +1,90 @@
+import logging as log
+import threading
+from concurrent.futures import Future
+from typing import Dict, Tuple
+
+from .ast_map_client import ASTMapDaemonPool
+from .ast_map_store import ASTMapStore
+
+
+class ASTMapPrefetcher:
+    """
+    Map (commit, file) pairs with ASTMapEval ahead of time. As soon as the blamed lines of a chain frontier are known,
+    the pairs the next mapping step needs are submitted to the daemon pool, and their results are written to the
+    mapping store when they come back, while the tracing goes on blaming the other files. The synchronous mapping
+    waits for a pair still in flight instead of submitting it again, and then finds it in the store.
+    """
+
+    def __init__(self, pool: ASTMapDaemonPool, store: ASTMapStore, project: str):
+        """
+        :param ASTMapDaemonPool pool: daemons mapping the pairs
+        :param ASTMapStore store: store receiving the mapping results
+        :param str project: full name of the project, as expected by ASTMapEval
+        """
+        self.pool = pool
+        self.store = store
+        self.project = project
+
+        self.submitted = 0
+        self.waited = 0
+        self.failures = 0
+
+        self._in_flight: Dict[Tuple[str, str], threading.Event] = dict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, commit_id: str, file_path: str):
+        """
+        Submit a (commit, file) pair, unless it is already mapped or in flight.
+
+        :param str commit_id: hash of the commit whose changes are mapped
+        :param str file_path: path of the file in the commit
+        """
+        key = (commit_id, file_path)
+        with self._lock:
+            if key in self._in_flight:
+                return
+        if self.store.contains(self.project, commit_id, file_path):
+            return
+
+        with self._lock:
+            if key in self._in_flight:
+                return
+            future = self.pool.submit(self.project, commit_id, file_path)
+            if future is None:
+                # no daemon available, the pairs are mapped one at a time by the synchronous path
+                return
+            stored = self._in_flight[key] = threading.Event()
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._store_result(key, f, stored))
+
+    def _store_result(self, key: Tuple[str, str], future: Future, stored: threading.Event):
+        try:
+            self.store.put(self.project, key[0], key[1], future.result())
+        except Exception as e:
+            self.failures += 1
+            log.warning(f'ASTMapEval prefetch failed for {self.project} {key[0]} {key[1]}: {e}')
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            stored.set()
+
+    def wait(self, commit_id: str, file_path: str, timeout: float = None):
+        """
+        Wait for a (commit, file) pair in flight, if any, and for its result to be stored. Failures are left to the
+        synchronous mapping, which maps the pair again.
+
+        :param str commit_id: hash of the commit whose changes are mapped
+        :param str file_path: path of the file in the commit
+        :param float timeout: max time in seconds to wait, the timeout of the pool by default
+        """
+        with self._lock:
+            stored = self._in_flight.get((commit_id, file_path))
+        if stored is None:
+            return
+
+        self.waited += 1
+        stored.wait(timeout if timeout is not None else self.pool.timeout)
+
+    def stats(self) -> dict:
+        return {'submitted': self.submitted, 'waited': self.waited, 'failures': self.failures,
+                'in_flight': len(self._in_flight)}
@@ -0,0 +1,211 @@
+import json
+import logging as log
+import os
+import sqlite3
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+
+class ASTMapStore:
+    """
+    Persistent store of the ASTMapEval results, keyed by (project, commit, file path), backed by a SQLite database in
+    WAL mode. The statements of the results are indexed by their line in the mapped commit (dstStmtStartLine), so
+    that mapping a line is a single lookup. Each thread uses its own connection and each mapping is written in its own
+    transaction, so that several threads and processes can read and write the store concurrently.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        :param str db_path: path of the SQLite database file, created if it does not exist
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._connections = list()
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS mappings (
+                project TEXT NOT NULL, commit_id TEXT NOT NULL, file_path TEXT NOT NULL, results BLOB NOT NULL,
+                PRIMARY KEY (project, commit_id, file_path));
+            CREATE TABLE IF NOT EXISTS statements (
+                project TEXT NOT NULL, commit_id TEXT NOT NULL, file_path TEXT NOT NULL, dst_line INTEGER NOT NULL,
+                src_line INTEGER, change_type TEXT NOT NULL,
+                PRIMARY KEY (project, commit_id, file_path, dst_line)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS imports (
+                json_path TEXT PRIMARY KEY, mtime REAL NOT NULL, mappings INTEGER NOT NULL);
+        ''')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def contains(self, project: str, commit_id: str, file_path: str) -> bool:
+        """
+        :param str project: full name of the project
+        :param str commit_id: hash of the mapped commit
+        :param str file_path: path of the mapped file in the commit
+        :returns bool True if the file has been mapped at the commit
+        """
+        row = self._conn().execute('SELECT 1 FROM mappings WHERE project = ? AND commit_id = ? AND file_path = ?',
+                                   (project, commit_id, file_path)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def get_statement(self, project: str, commit_id: str, file_path: str, line_num: int) -> Optional[Tuple[Optional[int], str]]:
+        """
+        Get the statement of a mapped file starting at the given line, as the first statement of the first result
+        of the file in the output of ASTMapEval.
+
+        :param str project: full name of the project
+        :param str commit_id: hash of the mapped commit
+        :param str file_path: path of the mapped file in the commit
+        :param int line_num: start line of the statement in the commit (dstStmtStartLine)
+        :returns Tuple[int, str] (srcStmtStartLine, stmtChangeType) of the statement, None if no statement starts at
+            the line. srcStmtStartLine is None if ASTMapEval does not report it.
+        """
+        row = self._conn().execute('SELECT src_line, change_type FROM statements '
+                                   'WHERE project = ? AND commit_id = ? AND file_path = ? AND dst_line = ?',
+                                   (project, commit_id, file_path, line_num)).fetchone()
+        return (row[0], row[1]) if row is not None else None
+
+    def get_results(self, project: str, commit_id: str, file_path: str) -> Optional[list]:
+        """
+        :returns list the raw ASTMapEval results of a mapped file, None if the file has not been mapped
+        """
+        row = self._conn().execute('SELECT results FROM mappings WHERE project = ? AND commit_id = ? AND file_path = ?',
+                                   (project, commit_id, file_path)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def put(self, project: str, commit_id: str, file_path: str, mapping_results: list):
+        """
+        Store the results of ASTMapEval for a file at a commit, in a single transaction.
+
+        :param str project: full name of the project
+        :param str commit_id: hash of the mapped commit
+        :param str file_path: path of the mapped file in the commit
+        :param list mapping_results: parsed output of ASTMapEval
+        """
+        self.put_many(project, [(commit_id, file_path, mapping_results)])
+
+    def put_many(self, project: str, mappings: List[Tuple[str, str, list]]):
+        """
+        Store several results of ASTMapEval in a single transaction.
+
+        :param str project: full name of the project
+        :param List[Tuple[str, str, list]] mappings: (commit, file path, mapping results) of each mapped file
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for commit_id, file_path, mapping_results in mappings:
+                self._insert(conn, project, commit_id, file_path, mapping_results)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, project: str, commit_id: str, file_path: str, mapping_results: list):
+        raw_results = zlib.compress(json.dumps(mapping_results, separators=(',', ':')).encode('utf-8'))
+        conn.execute('INSERT OR REPLACE INTO mappings (project, commit_id, file_path, results) VALUES (?, ?, ?, ?)',
+                     (project, commit_id, file_path, sqlite3.Binary(raw_results)))
+        conn.execute('DELETE FROM statements WHERE project = ? AND commit_id = ? AND file_path = ?',
+                     (project, commit_id, file_path))
+
+        # only the results of the mapped file are looked up, the first statement of a line wins
+        statements = dict()
+        for result in mapping_results:
+            if result.get('src') != file_path:
+                continue
+            for stmt in result.get('stmt', []):
+                if 'dstStmtStartLine' in stmt:
+                    statements.setdefault(int(stmt['dstStmtStartLine']), (stmt.get('srcStmtStartLine'), stmt['stmtChangeType']))
+
+        conn.executemany('INSERT INTO statements (project, commit_id, file_path, dst_line, src_line, change_type) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         [(project, commit_id, file_path, dst_line, src_line, change_type)
+                          for dst_line, (src_line, change_type) in statements.items()])
+
+    def import_json_db(self, project: str, json_path: str, force: bool = False) -> int:
+        """
+        Import a JSON mapping database of the previous versions (commit -> file path -> mapping results). A database
+        is imported once, unless it changed since its import.
+
+        :param str project: full name of the project
+        :param str json_path: path of the JSON database
+        :param bool force: import the database even if it has already been imported
+        :returns int number of imported mappings
+        """
+        json_path = os.path.abspath(json_path)
+        mtime = os.path.getmtime(json_path)
+        conn = self._conn()
+        if not force:
+            row = conn.execute('SELECT mtime FROM imports WHERE json_path = ?', (json_path,)).fetchone()
+            if row is not None and row[0] == mtime:
+                return 0
+
+        with open(json_path) as f:
+            mapping_db = json.load(f)
+        mappings = [(commit_id, file_path, mapping_results)
+                    for commit_id, files in mapping_db.items() for file_path, mapping_results in files.items()]
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for commit_id, file_path, mapping_results in mappings:
+                self._insert(conn, project, commit_id, file_path, mapping_results)
+            conn.execute('INSERT OR REPLACE INTO imports (json_path, mtime, mappings) VALUES (?, ?, ?)',
+                         (json_path, mtime, len(mappings)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        log.info(f'imported {len(mappings)} mappings of {project} from {json_path}')
+        return len(mappings)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_stores = dict()
+_stores_lock = threading.Lock()
+
+
+def get_ast_map_store(db_path: str) -> ASTMapStore:
+    """
+    Get the mapping store of the given database, shared by all the SZZ instances of the process.
+
+    :param str db_path: path of the SQLite database file
+    :returns ASTMapStore store
+    """
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ASTMapStore(key)
+        return store
@@ -0,0 +1,146 @@
+import logging as log
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+
+from git import Repo
+
+from .git_batch import unquote_git_path
+
+
+def parse_blame_incremental(output: str) -> List[Tuple[int, str, str, int]]:
+    """
+    Parse the output of 'git blame --incremental'. Each group of lines starts with the header
+    '<sha> <orig_line> <final_line> <num_lines>', optionally followed by the commit info, and ends with 'filename <path>'.
+
+    :param str output: output of git blame --incremental
+    :returns List[Tuple[int, str, str, int]] list of (line number, commit hash, original path, original line number)
+    """
+    entries = list()
+    header = None
+    for line in output.split('\n'):
+        if header is None:
+            parts = line.split(' ')
+            if len(parts) == 4 and len(parts[0]) == 40:
+                header = (parts[0], int(parts[1]), int(parts[2]), int(parts[3]))
+        elif line.startswith('filename '):
+            orig_path = unquote_git_path(line[len('filename '):])
+            sha, orig_line, final_line, num_lines = header
+            for i in range(num_lines):
+                entries.append((final_line + i, sha, orig_path, orig_line + i))
+            header = None
+
+    return entries
+
+
+class BlameBackend(ABC):
+    """
+    BlameBackend is the base class of the implementations of git blame used by AbstractSZZ.
+    """
+
+    name = None
+
+    def __init__(self, repository: Repo):
+        """
+        :param Repo repository: GitPython Repo object of the repository to blame
+        """
+        self.repository = repository
+
+    @abstractmethod
+    def blame(self, rev: str, file_path: str, line_ranges: List[str], blame_kwargs: dict) -> List[Tuple[int, str, str, int]]:
+        """
+        Blame the given line ranges of a file.
+
+        :param str rev: commit revision
+        :param str file_path: path of file to blame
+        :param List[str] line_ranges: line ranges in the format of the '-L' param of git blame
+        :param dict blame_kwargs: git blame options, as built by AbstractSZZ._blame_lines()
+        :returns List[Tuple[int, str, str, int]] list of (line number, commit hash, original path, original line number)
+        """
+        pass
+
+
+class GitBlameBackend(BlameBackend):
+    """
+    Blame through the git command line, with a single 'git blame --incremental' call for all the line ranges.
+    """
+
+    name = 'git'
+
+    def blame(self, rev: str, file_path: str, line_ranges: List[str], blame_kwargs: dict) -> List[Tuple[int, str, str, int]]:
+        output = self.repository.git.blame(rev, '--', file_path, incremental=True, L=line_ranges,
+                                           stdout_as_string=False, **blame_kwargs)
+        return parse_blame_incremental(output.decode('utf-8', errors='replace'))
+
+
+class Pygit2BlameBackend(BlameBackend):
+    """
+    Blame in-process through libgit2 (pygit2), avoiding a git process for each blame. libgit2 does not support
+    ignored revisions and move/copy detection like git does, blame calls using these options are delegated to git.
+    """
+
+    name = 'pygit2'
+
+    def __init__(self, repository: Repo):
+        super().__init__(repository)
+        try:
+            import pygit2
+        except ImportError:
+            raise ImportError('the pygit2 blame backend requires pygit2 (pip install pygit2==1.20.1)')
+
+        self._pygit2 = pygit2
+        self._repo = pygit2.Repository(repository.git_dir)
+        self._git_backend = GitBlameBackend(repository)
+
+    def _flags(self, blame_kwargs: dict):
+        if any(opt in blame_kwargs for opt in ('ignore-rev', 'ignore-revs-file', 'M', 'C')):
+            return None
+
+        flags = getattr(self._pygit2, 'GIT_BLAME_NORMAL', 0)
+        if blame_kwargs.get('w'):
+            ignore_whitespace = getattr(self._pygit2, 'GIT_BLAME_IGNORE_WHITESPACE', None)
+            if ignore_whitespace is None:
+                return None
+            flags |= ignore_whitespace
+        return flags
+
+    def blame(self, rev: str, file_path: str, line_ranges: List[str], blame_kwargs: dict) -> List[Tuple[int, str, str, int]]:
+        flags = self._flags(blame_kwargs)
+        if flags is None:
+            log.info(f'blame options not supported by pygit2, using git: {blame_kwargs}')
+            return self._git_backend.blame(rev, file_path, line_ranges, blame_kwargs)
+
+        newest_commit = self._repo.revparse_single(rev).peel(self._pygit2.Commit).id
+
+        entries = list()
+        for line_range in line_ranges:
+            start, end = (int(n) for n in line_range.split(','))
+            blame = self._repo.blame(file_path, flags=flags, newest_commit=newest_commit, min_line=start, max_line=end)
+            for hunk in blame:
+                final_start = hunk.final_start_line_number
+                orig_start = hunk.orig_start_line_number
+                for i in range(hunk.lines_in_hunk):
+                    if start <= final_start + i <= end:
+                        entries.append((final_start + i, str(hunk.final_commit_id), hunk.orig_path, orig_start + i))
+
+        return entries
+
+
+BLAME_BACKENDS = {
+    GitBlameBackend.name: GitBlameBackend,
+    Pygit2BlameBackend.name: Pygit2BlameBackend
+}
+
+
+def make_blame_backend(name: str, repository: Repo) -> BlameBackend:
+    """
+    Create the blame backend with the given name.
+
+    :param str name: name of the backend (git or pygit2), git is used if None
+    :param Repo repository: GitPython Repo object of the repository to blame
+    :returns BlameBackend blame_backend
+    """
+    if not name:
+        name = GitBlameBackend.name
+    if name not in BLAME_BACKENDS:
+        raise ValueError(f'unknown blame backend: {name} (available: {", ".join(BLAME_BACKENDS)})')
+    return BLAME_BACKENDS[name](repository)
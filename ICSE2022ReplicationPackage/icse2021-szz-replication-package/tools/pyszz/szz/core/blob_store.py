@@ -0,0 +1,62 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+DEFAULT_BLOB_CACHE_BUDGET = 256 * 1024 * 1024  # 256 MiB
+LINE_OVERHEAD = sys.getsizeof('')
+
+
+class BlobLineCache:
+    """
+    In-memory LRU cache of file contents at a given commit, stored as lists of lines. The cache is bounded by
+    an estimate of the bytes used by the cached lines, so that few huge files and many small files are handled alike.
+    """
+
+    def __init__(self, budget: int = DEFAULT_BLOB_CACHE_BUDGET):
+        """
+        :param int budget: max number of bytes used by the cached lines
+        """
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_lines(self, key: Tuple[str, str, str], fetch: Callable[[], str]) -> List[str]:
+        """
+        Get the lines of the blob identified by the given key, fetching and splitting its content on a cache miss.
+
+        :param Tuple[str, str, str] key: (repository path, commit hash, file path) of the blob
+        :param Callable fetch: function returning the content of the blob as a string
+        :returns List[str] lines of the blob
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        lines = fetch().split('\n')
+        size = sum(len(line) for line in lines) + LINE_OVERHEAD * len(lines)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (lines, size)
+                self._size += size
+                while self._size > self.budget and len(self._entries) > 1:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._size -= evicted_size
+
+        return lines
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'size': self._size}
+
+
+# shared by all the SZZ instances of the process
+blob_line_cache = BlobLineCache()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging as log
+import os
+import sqlite3
+import threading
+from time import time as ts
+from typing import Any, List, Optional
+
+DEFAULT_CACHE_MAX_SIZE = 1024 * 1024 * 1024  # 1 GiB
+BLAME_CACHE_VERSION = 2
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache backed by a SQLite database. Values are stored as raw bytes, entries are evicted
+    in least-recently-used order once the total size of the stored values exceeds max_size. Each cache instance
+    works on its own namespace, so that several caches can share the same database file.
+    """
+
+    def __init__(self, db_path: str, namespace: str, max_size: int = DEFAULT_CACHE_MAX_SIZE):
+        """
+        :param str db_path: path of the SQLite database file, created if it does not exist
+        :param str namespace: name of the table used by this cache
+        :param int max_size: max size in bytes of the stored values before evicting the least recently used entries
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.db_path = db_path
+        self.namespace = namespace
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{namespace}" ('
+                           'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{namespace}_last_access" ON "{namespace}" (last_access)')
+        self._size = self._conn.execute(f'SELECT COALESCE(SUM(size), 0) FROM "{namespace}"').fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get the value stored for the given key, updating its last access time.
+
+        :param str key: key of the entry
+        :returns bytes the stored value, None if the key is not in the cache
+        """
+        with self._lock:
+            row = self._conn.execute(f'SELECT value FROM "{self.namespace}" WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute(f'UPDATE "{self.namespace}" SET last_access = ? WHERE key = ?', (ts(), key))
+            return bytes(row[0])
+
+    def put(self, key: str, value: bytes):
+        """
+        Store the given value, evicting the least recently used entries if the cache exceeds its max size.
+
+        :param str key: key of the entry
+        :param bytes value: value to store
+        """
+        with self._lock:
+            old = self._conn.execute(f'SELECT size FROM "{self.namespace}" WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(f'INSERT OR REPLACE INTO "{self.namespace}" (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                               (key, sqlite3.Binary(value), len(value), ts()))
+            self._size += len(value) - (old[0] if old else 0)
+
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """ Evict the least recently used entries until the cache size is below 90% of its max size """
+        target = int(self.max_size * 0.9)
+        to_delete = list()
+        for key, size in self._conn.execute(f'SELECT key, size FROM "{self.namespace}" ORDER BY last_access'):
+            if self._size <= target:
+                break
+            to_delete.append((key,))
+            self._size -= size
+
+        self._conn.executemany(f'DELETE FROM "{self.namespace}" WHERE key = ?', to_delete)
+        self.evictions += len(to_delete)
+        log.info(f'cache {self.namespace}: evicted {len(to_delete)} entries')
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def put_json(self, key: str, value: Any):
+        self.put(key, json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': self._size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BlameCache(SQLiteCache):
+    """
+    Content-addressed cache for git blame results. The key of each entry is a digest of the resolved revision,
+    the blamed path, the line ranges and the full set of blame options, so that an entry never becomes stale.
+    """
+
+    def __init__(self, db_path: str, max_size: int = DEFAULT_CACHE_MAX_SIZE):
+        super().__init__(db_path, 'blame', max_size)
+
+    @staticmethod
+    def make_key(rev_sha: str, file_path: str, line_ranges: List[str], options: dict, ignore_revs_file_digest: str = None) -> str:
+        """
+        Build the cache key of a blame call.
+
+        :param str rev_sha: full hash of the blamed revision (not a revision expression like HEAD^)
+        :param str file_path: path of the blamed file
+        :param List[str] line_ranges: line ranges in the format of the '-L' param of git blame
+        :param dict options: git blame options (-w, -M, -C, ignore-rev...)
+        :param str ignore_revs_file_digest: digest of the content of the ignore revs file, if any
+        :returns str key
+        """
+        opts = dict(options)
+        opts.pop('ignore-revs-file', None)
+        if 'ignore-rev' in opts:
+            opts['ignore-rev'] = sorted(opts['ignore-rev'])
+        if 'C' in opts:
+            opts['C'] = len(opts['C']) if isinstance(opts['C'], list) else 1
+
+        raw_key = json.dumps([BLAME_CACHE_VERSION, rev_sha, file_path, list(line_ranges), sorted(opts.items()), ignore_revs_file_digest])
+        return hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def file_digest(file_path: str) -> str:
+        with open(file_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
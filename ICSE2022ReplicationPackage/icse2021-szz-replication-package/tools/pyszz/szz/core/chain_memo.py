@@ -0,0 +1,93 @@
+import json
+import threading
+from typing import List, Optional, Tuple
+
+from .cache import SQLiteCache
+
+# 2: chains follow the renames of the blamed files
+CHAIN_MEMO_VERSION = 2
+
+
+class ChainMemo:
+    """
+    Memo of the blame chains traced by V-SZZ. A chain is a path in a DAG whose nodes are blamed lines, identified by
+    (blame commit, traced file, blamed file, blamed line): the next hop of a node only depends on the node itself,
+    so chains that reach a known node share its tail. Each node is stored with its step and the key of the next node,
+    the remaining chain of a node is rebuilt by following the links. Only completed chains are stored.
+    """
+
+    def __init__(self, disk_cache: SQLiteCache = None):
+        """
+        :param SQLiteCache disk_cache: persistent store of the nodes, None to keep them in memory only
+        """
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+
+        self._nodes = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def node_key(hexsha: str, traced_path: str, file_path: str, line_num: int, context: str = None) -> str:
+        """
+        :param str hexsha: commit detected by git blame
+        :param str traced_path: path of the file whose lines are traced
+        :param str file_path: path of the blamed file in the blame commit
+        :param int line_num: number of the blamed line
+        :param str context: anything else the chains depend on (e.g. the digest of the ignore revs file)
+        :returns str key of the node
+        """
+        return json.dumps([CHAIN_MEMO_VERSION, context, hexsha, traced_path, file_path, line_num])
+
+    def _get_node(self, key: str) -> Optional[Tuple[tuple, Optional[str]]]:
+        node = self._nodes.get(key)
+        if node is None and self.disk_cache is not None:
+            stored = self.disk_cache.get_json(key)
+            if stored is not None:
+                node = (tuple(stored[0]), stored[1])
+                with self._lock:
+                    self._nodes[key] = node
+        return node
+
+    def get_chain(self, key: str) -> Optional[List[tuple]]:
+        """
+        Get the chain starting at the given node.
+
+        :param str key: key of the node
+        :returns List[tuple] steps of the chain, None if the node is unknown
+        """
+        steps = list()
+        while key is not None:
+            node = self._get_node(key)
+            if node is None:
+                # unknown node, or a missing link if the persistent store evicted part of the chain
+                self.misses += 1
+                return None
+            steps.append(node[0])
+            key = node[1]
+
+        self.hits += 1
+        return steps
+
+    def put_chain(self, keys: List[str], steps: List[tuple], next_key: str = None):
+        """
+        Store a completed chain.
+
+        :param List[str] keys: keys of the nodes of the chain
+        :param List[tuple] steps: step of each node
+        :param str next_key: key of the known node the chain continues with, None if the chain ends with its last step
+        """
+        # stored from the tail, so that a node is never visible before the nodes that follow it
+        for i in reversed(range(len(keys))):
+            node = (tuple(steps[i]), keys[i + 1] if i + 1 < len(keys) else next_key)
+            with self._lock:
+                self._nodes[keys[i]] = node
+            if self.disk_cache is not None:
+                self.disk_cache.put_json(keys[i], [node[0], node[1]])
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'nodes': len(self._nodes)}
+
+    def close(self):
+        if self.disk_cache is not None:
+            self.disk_cache.close()
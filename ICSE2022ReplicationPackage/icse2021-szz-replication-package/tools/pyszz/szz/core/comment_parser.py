@@ -1,15 +1,114 @@
 import logging as log
 import os
 import re
-import subprocess
-from collections import namedtuple
+import threading
+from array import array
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
+from typing import Callable, List, Tuple
 import tempfile
 
+from .cache import SQLiteCache
+from .srcml_batch import SrcMLBatch
+
 CommentRange = namedtuple('CommentRange', 'start end')
 srcml_file_ext = ['.c', '.h', '.hh', '.hpp', '.hxx', '.cxx', '.cpp', '.cc', '.cs', '.java']
 
 
-def parse_comments(file_str: str, file_name: str, temp_dir: str = tempfile.gettempdir()):
+class CommentIndex:
+    """
+    Index of the comment lines of a file. The comment ranges are merged into disjoint intervals, stored as sorted
+    arrays of start and end lines, so that a line can be looked up with a binary search.
+    """
+
+    def __init__(self, comment_ranges: List[CommentRange]):
+        """
+        :param List[CommentRange] comment_ranges: comment ranges returned by parse_comments()
+        """
+        self.starts = array('i')
+        self.ends = array('i')
+        for comment_range in sorted(comment_ranges):
+            if self.ends and comment_range.start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], comment_range.end)
+            else:
+                self.starts.append(comment_range.start)
+                self.ends.append(comment_range.end)
+
+    def contains(self, line_num: int) -> bool:
+        """
+        Check if the given line is inside a comment.
+
+        :param int line_num: line number
+        :returns bool
+        """
+        idx = bisect_right(self.starts, line_num) - 1
+        return idx >= 0 and line_num <= self.ends[idx]
+
+    def to_list(self) -> List[List[int]]:
+        return [list(self.starts), list(self.ends)]
+
+    @classmethod
+    def from_list(cls, starts_ends: List[List[int]]) -> 'CommentIndex':
+        index = cls([])
+        index.starts = array('i', starts_ends[0])
+        index.ends = array('i', starts_ends[1])
+        return index
+
+
+class CommentIndexStore:
+    """
+    Memo of the CommentIndex of each blob, so that comments are parsed once per blob. Indexes are kept in an in-memory
+    LRU and, optionally, in a persistent cache. Since the parser depends on the file extension, the key of an index is
+    the blob hash along with the extension.
+    """
+
+    def __init__(self, disk_cache: SQLiteCache = None, max_entries: int = 10000, use_srcml: bool = False):
+        """
+        :param SQLiteCache disk_cache: persistent cache of the indexes, None to keep them in memory only
+        :param int max_entries: max number of indexes kept in memory
+        :param bool use_srcml: parse C-family comments with srcML instead of the in-process parser
+        """
+        self.disk_cache = disk_cache
+        self.max_entries = max_entries
+        self.use_srcml = use_srcml
+
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, blob_sha: str, file_name: str, load_content: Callable[[], str], temp_dir: str = tempfile.gettempdir()) -> CommentIndex:
+        """
+        Get the comment index of a blob, parsing its content if the index is not memoized.
+
+        :param str blob_sha: hash of the blob
+        :param str file_name: name of the file, used to select the comment parser
+        :param Callable load_content: function returning the content of the blob
+        :param str temp_dir: temp folder used by the srcML parser
+        :returns CommentIndex comment_index
+        """
+        key = f'{blob_sha}{os.path.splitext(file_name)[1].lower()}{":srcml" if self.use_srcml else ""}'
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+
+        cached = self.disk_cache.get_json(key) if self.disk_cache is not None else None
+        if cached is not None:
+            index = CommentIndex.from_list(cached)
+        else:
+            index = CommentIndex(parse_comments(load_content(), file_name, temp_dir, self.use_srcml))
+            if self.disk_cache is not None:
+                self.disk_cache.put_json(key, index.to_list())
+
+        with self._lock:
+            self._indexes[key] = index
+            if len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+
+        return index
+
+
+def parse_comments(file_str: str, file_name: str, temp_dir: str = tempfile.gettempdir(), use_srcml: bool = False):
     if file_name.endswith(".py"):
         line_comment_ranges = py_comment_parser(file_str, file_name)
     elif file_name.endswith(".js"):
@@ -18,6 +117,8 @@ def parse_comments(file_str: str, file_name: str, temp_dir: str = tempfile.gette
         line_comment_ranges = php_comment_parser(file_str, file_name)
     elif file_name.endswith(".rb"):
         line_comment_ranges = rb_comment_parser(file_str, file_name)
+    elif not use_srcml and any(file_name.endswith(e) for e in srcml_file_ext):
+        line_comment_ranges = c_family_comment_parser(file_str, file_name)
     else:
         line_comment_ranges = parse_comments_srcml(file_str, file_name, temp_dir)
 
@@ -25,34 +126,145 @@ def parse_comments(file_str: str, file_name: str, temp_dir: str = tempfile.gette
 
 
 def parse_comments_srcml(file_str: str, file_name: str, temp_folder: str = tempfile.gettempdir()):
+    return parse_comments_srcml_batch([(file_str, file_name)], temp_folder)[0]
+
+
+def parse_comments_srcml_batch(files: List[Tuple[str, str]], temp_folder: str = tempfile.gettempdir()) -> List[List[CommentRange]]:
+    """
+    Parse the comments of several files with a single srcml invocation.
+
+    :param List[Tuple[str, str]] files: list of (file content, file name)
+    :param str temp_folder: folder where the files are written before the conversion
+    :returns List[List[CommentRange]] comment ranges of each file, in the same order
+    """
+    batch = SrcMLBatch(temp_folder)
+    for i, (file_str, file_name) in enumerate(files):
+        if any(file_name.endswith(e) for e in srcml_file_ext):
+            batch.add(i, file_str, file_name)
+        else:
+            log.error(f"file not supported by srcML: {file_name}")
+
+    units = batch.convert() if len(batch) else dict()
+
+    all_comment_ranges = list()
+    for i in range(len(files)):
+        line_comment_ranges = list()
+        for line in (units.get(i) or '').split('\n'):
+            if line.strip().startswith("<comment"):
+                line_comment_ranges.append(CommentRange(start=int(re.search('pos:start="(\d+):', line).groups()[0]),
+                                                        end=int(re.search('pos:end="(\d+):', line).groups()[0])))
+        all_comment_ranges.append(line_comment_ranges)
+
+    return all_comment_ranges
+
+
+CODE_TOKEN = re.compile(r'//|/\*|"|\'|\\\r?\n|\n')
+STRING_BODY = re.compile(r'(?:[^"\\\n]|\\[\s\S])*')
+CHAR_BODY = re.compile(r"(?:[^'\\\n]|\\[\s\S])*")
+VERBATIM_STRING_BODY = re.compile(r'(?:[^"]|"")*')
+RAW_STRING_DELIMITER = re.compile(r'([^()\\\s"]{0,16})\(')
+RAW_STRING_PREFIXES = ('R', 'LR', 'uR', 'UR', 'u8R')
+
+
+def _identifier_before(file_str: str, idx: int) -> str:
+    start = idx
+    while start > 0 and (file_str[start - 1].isalnum() or file_str[start - 1] == '_'):
+        start -= 1
+    return file_str[start:idx]
+
+
+def _skip_line_comment(file_str: str, start: int) -> int:
+    """ Return the index of the newline ending the line comment starting at start, following line continuations """
+    end = start
+    while True:
+        nl = file_str.find('\n', end)
+        if nl == -1:
+            return len(file_str)
+        if file_str[nl - 1] == '\\' or (file_str[nl - 1] == '\r' and file_str[nl - 2] == '\\'):
+            end = nl + 1
+            continue
+        return nl
+
+
+def _skip_string(file_str: str, start: int, ext: str) -> int:
+    """ Return the index following the string literal starting at start (the opening double quote) """
+    n = len(file_str)
+    if ext == '.java' and file_str.startswith('"""', start):
+        close = file_str.find('"""', start + 3)
+        return n if close == -1 else close + 3
+
+    if ext == '.cs' and start > 0 and file_str[start - 1] == '@':
+        end = VERBATIM_STRING_BODY.match(file_str, start + 1).end()
+        return min(end + 1, n)
+
+    if ext not in ('.java', '.cs') and _identifier_before(file_str, start) in RAW_STRING_PREFIXES:
+        delimiter = RAW_STRING_DELIMITER.match(file_str, start + 1)
+        if delimiter:
+            close = file_str.find(')' + delimiter.group(1) + '"', delimiter.end())
+            return n if close == -1 else close + len(delimiter.group(1)) + 2
+
+    end = STRING_BODY.match(file_str, start + 1).end()
+    return end + 1 if end < n and file_str[end] == '"' else end
+
+
+def c_family_comment_parser(file_str, file_name):
+    """
+    In-process comment parser for C, C++, C# and Java, returning the same comment ranges as parse_comments_srcml.
+    It handles line and block comments, string and char literals (including raw strings, text blocks and verbatim
+    strings) and line continuations. As with srcML, only comments that are the first token of their line are
+    reported, comments following code on the same line do not make the line a comment.
+    """
     line_comment_ranges = list()
 
-    if any(file_name.endswith(e) for e in srcml_file_ext):
-        if not os.path.isdir(temp_folder):
-            os.makedirs(temp_folder)
-
-        file_name = os.path.join(temp_folder, 'temp_' + file_name)
-        with open(file_name, 'w', encoding='utf-8', errors='ignore') as temp_file:
-            temp_file.write(file_str)
-
-        process_out = list()
-        p = subprocess.Popen(f'srcml --position {file_name}', shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        for line in p.stdout.readlines():
-            process_out.append(line.decode('utf-8').strip())
-        status = p.wait()
-
-        if status == 0:
-            for line in process_out:
-                if line.strip().startswith("<comment"):
-                    line_comment_ranges.append(CommentRange(start=int(re.search('pos:start="(\d+):', line).groups()[0]),
-                                                            end=int(re.search('pos:end="(\d+):', line).groups()[0])))
+    if not any(file_name.endswith(e) for e in srcml_file_ext):
+        log.error(f"unable to parse comments for: {file_name}")
+        return line_comment_ranges
+
+    ext = os.path.splitext(file_name)[1]
+    line = 1
+    code_on_line = False
+    pos = 0
+    while True:
+        m = CODE_TOKEN.search(file_str, pos)
+        if not m:
+            break
+
+        token = m.group()
+        start = m.start()
+        if not code_on_line and file_str[pos:start].strip():
+            code_on_line = True
+
+        if token.endswith('\n'):
+            line += 1
+            code_on_line = False
+            pos = m.end()
+            continue
+
+        if token == '//' or token == '/*':
+            if token == '//':
+                end = _skip_line_comment(file_str, start)
+            else:
+                close = file_str.find('*/', start + 2)
+                end = len(file_str) if close == -1 else close + 2
+            end_line = line + file_str.count('\n', start, end)
+            if not code_on_line:
+                line_comment_ranges.append(CommentRange(start=line, end=end_line))
+        elif token == '"':
+            end = _skip_string(file_str, start, ext)
+            end_line = line + file_str.count('\n', start, end)
         else:
-            log.error(process_out)
+            # digit separator (e.g. 1'000'000) or char literal
+            if _identifier_before(file_str, start)[:1].isdigit():
+                end = start + 1
+            else:
+                end = CHAR_BODY.match(file_str, start + 1).end()
+                if end < len(file_str) and file_str[end] == "'":
+                    end += 1
+            end_line = line + file_str.count('\n', start, end)
 
-        if os.path.isfile(file_name):
-            os.remove(file_name)
-    else:
-        log.error(f"file not supported by srcML: {file_name}")
+        line = end_line
+        code_on_line = True
+        pos = end
 
     return line_comment_ranges
 
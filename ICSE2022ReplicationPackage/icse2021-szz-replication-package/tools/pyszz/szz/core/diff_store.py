@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .git_diff import read_file_diff, read_name_status
+
+DEFAULT_MAX_COMMITS = 4096
+DEFAULT_MAX_FILE_DIFFS = 16384
+
+
+class DiffStore:
+    """
+    LRU cache of the diffs of the files modified by a commit, keyed by (commit, path). The list of the files modified
+    by a commit is read once, and the diff of a file is only parsed when it is requested, so that the files of a
+    large commit that are never traced cost nothing. Files are matched as in PyDriller: by their new path, or by
+    their old path if they are deleted or renamed.
+    """
+
+    def __init__(self, max_commits: int = DEFAULT_MAX_COMMITS, max_file_diffs: int = DEFAULT_MAX_FILE_DIFFS):
+        """
+        :param int max_commits: max number of commits whose list of modified files is kept
+        :param int max_file_diffs: max number of parsed file diffs kept
+        """
+        self.max_commits = max_commits
+        self.max_file_diffs = max_file_diffs
+        self.hits = 0
+        self.misses = 0
+
+        self._modified_files = OrderedDict()
+        self._file_diffs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_modified_files(self, repo_path: str, commit_hash: str) -> Dict[str, Tuple[str, str]]:
+        """
+        :param str repo_path: path of the git repository
+        :param str commit_hash: full hash of the commit
+        :returns Dict[str, Tuple[str, str]] (old path, new path) of each file modified by the commit, indexed by the
+            new path, or the old path for deleted and renamed files
+        """
+        key = (repo_path, commit_hash)
+        with self._lock:
+            modified_files = self._modified_files.get(key)
+            if modified_files is not None:
+                self._modified_files.move_to_end(key)
+                return modified_files
+
+        modified_files = dict()
+        for status, old_path, new_path in read_name_status(repo_path, commit_hash):
+            file_path = old_path if status in ('D', 'R') else new_path
+            modified_files.setdefault(file_path, (old_path, new_path))
+
+        with self._lock:
+            self._modified_files[key] = modified_files
+            while len(self._modified_files) > self.max_commits:
+                self._modified_files.popitem(last=False)
+        return modified_files
+
+    def get_deleted_lines(self, repo_path: str, commit_hash: str, file_path: str) -> Optional[List[Tuple[int, str]]]:
+        """
+        Get the lines of a file deleted by a commit.
+
+        :param str repo_path: path of the git repository
+        :param str commit_hash: full hash of the commit
+        :param str file_path: path of the file, the old path for deleted and renamed files
+        :returns List[Tuple[int, str]] deleted lines (line number in the parent commit, line), None if the file is
+            not modified by the commit or is newly added
+        """
+        key = (repo_path, commit_hash, file_path)
+        with self._lock:
+            if key in self._file_diffs:
+                self._file_diffs.move_to_end(key)
+                self.hits += 1
+                return self._file_diffs[key]
+            self.misses += 1
+
+        paths = self.get_modified_files(repo_path, commit_hash).get(file_path)
+        if paths is None or paths[0] is None:
+            deleted_lines = None
+        else:
+            deleted_lines = read_file_diff(repo_path, commit_hash, paths[0], paths[1]).deleted_lines
+
+        with self._lock:
+            self._file_diffs[key] = deleted_lines
+            while len(self._file_diffs) > self.max_file_diffs:
+                self._file_diffs.popitem(last=False)
+        return deleted_lines
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'commits': len(self._modified_files), 'file_diffs': len(self._file_diffs)}
+
+
+# shared by all the SZZ instances of the process
+diff_store = DiffStore()
@@ -0,0 +1,199 @@
+import atexit
+import codecs
+import logging as log
+import subprocess
+import threading
+from typing import Optional, Tuple
+
+
+def unquote_git_path(path: str) -> str:
+    """
+    Unquote a path quoted by git (C-style quoting with octal escapes, used for paths with special characters).
+
+    :param str path: path as printed by git
+    :returns str unquoted path
+    """
+    if len(path) < 2 or not (path.startswith('"') and path.endswith('"')):
+        return path
+    return codecs.escape_decode(path[1:-1].encode('utf-8'))[0].decode('utf-8', errors='replace')
+
+
+class CatFileProcess:
+    """
+    Wrapper of a long-lived 'git cat-file --batch' (or '--batch-check') process. Objects are requested by writing
+    their name on stdin, the process answers with a header line '<sha> <type> <size>' followed by the content.
+    """
+
+    def __init__(self, repo_path: str, check_only: bool = False):
+        """
+        :param str repo_path: path of the git repository
+        :param bool check_only: run 'git cat-file --batch-check', which only returns the header of the objects
+        """
+        self.repo_path = repo_path
+        self.check_only = check_only
+        self._process = None
+
+    def _start(self):
+        mode = '--batch-check' if self.check_only else '--batch'
+        self._process = subprocess.Popen(['git', 'cat-file', mode], cwd=self.repo_path,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def request(self, object_name: str) -> Tuple[Optional[Tuple[str, str, int]], Optional[memoryview]]:
+        """
+        Request an object to git cat-file.
+
+        :param str object_name: name of the object, any expression accepted by git rev-parse (e.g. <commit>:<path>)
+        :returns Tuple the header (sha, type, size) and the content of the object, (None, None) if the object is missing
+        """
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+
+        try:
+            self._process.stdin.write(object_name.encode('utf-8') + b'\n')
+            self._process.stdin.flush()
+
+            header = self._process.stdout.readline()
+            if not header:
+                raise BrokenPipeError(f'git cat-file terminated: {self.repo_path}')
+        except (BrokenPipeError, OSError):
+            self.close()
+            raise
+
+        parts = header.split()
+        if len(parts) != 3:
+            # '<object_name> missing' or '<object_name> ambiguous'
+            return None, None
+
+        sha, obj_type, size = parts[0].decode('ascii'), parts[1].decode('ascii'), int(parts[2])
+        if self.check_only:
+            return (sha, obj_type, size), None
+
+        content = bytearray(size)
+        view = memoryview(content)
+        read = 0
+        while read < size:
+            n = self._process.stdout.readinto(view[read:])
+            if not n:
+                self.close()
+                raise BrokenPipeError(f'git cat-file terminated: {self.repo_path}')
+            read += n
+        self._process.stdout.read(1)  # trailing newline
+
+        return (sha, obj_type, size), view
+
+    def close(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout=5)
+            except Exception:
+                self._process.kill()
+            self._process = None
+
+
+class GitObjectReader:
+    """
+    Read git objects of a repository through persistent git cat-file processes, so that the cost of starting git
+    is paid once instead of once per object.
+    """
+
+    def __init__(self, repo_path: str):
+        """
+        :param str repo_path: path of the git repository
+        """
+        self.repo_path = repo_path
+        self._batch = CatFileProcess(repo_path)
+        self._batch_check = CatFileProcess(repo_path, check_only=True)
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """
+        Resolve a revision expression (e.g. <sha>^) to the full hash of the object it refers to.
+
+        :param str rev: revision expression
+        :returns str full hash, None if the revision does not exist
+        """
+        header, _ = self._batch_check.request(rev)
+        return header[0] if header else None
+
+    def read_blob(self, rev: str, path: str) -> memoryview:
+        """
+        Read the content of a file at the given revision.
+
+        :param str rev: revision of the file
+        :param str path: path of the file
+        :returns memoryview content of the file
+        """
+        return self._read(f'{rev}:{path}', 'blob')
+
+    def read_commit(self, sha: str) -> memoryview:
+        """
+        Read the raw commit object (headers and message) of the given commit.
+
+        :param str sha: hash of the commit
+        :returns memoryview raw commit object
+        """
+        return self._read(sha, 'commit')
+
+    def _read(self, object_name: str, expected_type: str) -> memoryview:
+        header, content = self._batch.request(object_name)
+        if header is None:
+            raise ValueError(f'git object not found: {object_name} ({self.repo_path})')
+        if header[1] != expected_type:
+            raise ValueError(f'git object {object_name} is a {header[1]}, expected {expected_type} ({self.repo_path})')
+        return content
+
+    def close(self):
+        self._batch.close()
+        self._batch_check.close()
+
+
+class GitObjectReaderPool:
+    """
+    Pool of GitObjectReader, with one reader per repository and per thread, so that concurrent workers never
+    share a cat-file process.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._all_readers = list()
+        self._lock = threading.Lock()
+
+    def get(self, repo_path: str) -> GitObjectReader:
+        """
+        Get the reader of the given repository for the current thread.
+
+        :param str repo_path: path of the git repository
+        :returns GitObjectReader reader
+        """
+        readers = getattr(self._local, 'readers', None)
+        if readers is None:
+            readers = self._local.readers = dict()
+
+        reader = readers.get(repo_path)
+        if reader is None:
+            reader = readers[repo_path] = GitObjectReader(repo_path)
+            with self._lock:
+                self._all_readers.append(reader)
+        return reader
+
+    def release(self, repo_path: str):
+        """ Close the reader of the given repository for the current thread """
+        readers = getattr(self._local, 'readers', None)
+        if readers and repo_path in readers:
+            reader = readers.pop(repo_path)
+            reader.close()
+            with self._lock:
+                self._all_readers.remove(reader)
+
+    def close_all(self):
+        with self._lock:
+            for reader in self._all_readers:
+                try:
+                    reader.close()
+                except Exception as e:
+                    log.error(f'unable to close git cat-file process: {reader.repo_path} {e}')
+            self._all_readers.clear()
+
+
+object_readers = GitObjectReaderPool()
+atexit.register(object_readers.close_all)
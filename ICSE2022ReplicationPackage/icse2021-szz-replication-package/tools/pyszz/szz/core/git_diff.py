@@ -0,0 +1,197 @@
+import logging as log
+import re
+import subprocess
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Tuple
+
+from .git_batch import unquote_git_path
+
+# old_path is None for added files, new_path is None for deleted files. Line numbers of the deleted lines refer to
+# the old file, line numbers of the added lines refer to the new file, as in PyDriller's diff_parsed. When the diff is
+# parsed with its content, the lines are (line number, line) tuples.
+FileDiff = namedtuple('FileDiff', 'old_path new_path deleted_lines added_lines')
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+COMMIT_MARKER = '\x01'
+
+# options making the output independent of the user configuration
+DIFF_OPTIONS = ['--no-color', '--no-ext-diff', '--no-textconv', '--src-prefix=a/', '--dst-prefix=b/']
+
+
+def _diff_path(header_path: str, prefix: str):
+    if header_path == '/dev/null':
+        return None
+    # git appends a tab to paths containing spaces
+    path = unquote_git_path(header_path.rstrip('\t'))
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+def parse_unified_diff(lines: Iterable[str], with_content: bool = False) -> List[FileDiff]:
+    """
+    Parse a unified diff of several files, as printed by git diff or git log -p. Files without hunks (pure renames,
+    mode changes, binary files) are not returned.
+
+    :param Iterable[str] lines: lines of the diff, without line terminators
+    :param bool with_content: return the deleted and added lines as (line number, line) instead of line numbers
+    :returns List[FileDiff] file_diffs
+    """
+    file_diffs = list()
+    old_path = new_path = None
+    deleted_lines = added_lines = None
+    old_remaining = new_remaining = 0
+    old_line = new_line = 0
+
+    for line in lines:
+        if old_remaining > 0 or new_remaining > 0:
+            # inside a hunk, a deleted line starting with '--' must not be taken for a file header
+            if line.startswith('-'):
+                deleted_lines.append((old_line, line[1:]) if with_content else old_line)
+                old_line += 1
+                old_remaining -= 1
+            elif line.startswith('+'):
+                added_lines.append((new_line, line[1:]) if with_content else new_line)
+                new_line += 1
+                new_remaining -= 1
+            elif line.startswith(' '):
+                old_line += 1
+                new_line += 1
+                old_remaining -= 1
+                new_remaining -= 1
+            continue
+
+        if line.startswith('diff --git '):
+            old_path = new_path = None
+            deleted_lines = added_lines = None
+        elif line.startswith('--- '):
+            old_path = _diff_path(line[4:], 'a/')
+        elif line.startswith('+++ '):
+            new_path = _diff_path(line[4:], 'b/')
+            deleted_lines = list()
+            added_lines = list()
+            file_diffs.append(FileDiff(old_path, new_path, deleted_lines, added_lines))
+        elif deleted_lines is not None:
+            hunk = HUNK_HEADER.match(line)
+            if hunk:
+                old_line = int(hunk.group(1))
+                old_remaining = int(hunk.group(2)) if hunk.group(2) is not None else 1
+                new_line = int(hunk.group(3))
+                new_remaining = int(hunk.group(4)) if hunk.group(4) is not None else 1
+
+    return file_diffs
+
+
+def _stream_commit_diffs(repo_path: str, cmd: List[str], stdin_data: bytes = None, with_content: bool = False) -> Iterator[Tuple[str, List[FileDiff]]]:
+    """
+    Run a git log command printing '{COMMIT_MARKER}%H' before the patch of each commit, and parse its output as it
+    is streamed. The process is killed if the iteration stops early.
+    """
+    p = subprocess.Popen(cmd, cwd=repo_path, stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    try:
+        if stdin_data is not None:
+            # git log reads all the revisions before printing anything
+            p.stdin.write(stdin_data)
+            p.stdin.close()
+
+        commit = None
+        diff_lines = list()
+        for raw_line in p.stdout:
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\n')
+            if line.startswith(COMMIT_MARKER):
+                if commit is not None:
+                    yield commit, parse_unified_diff(diff_lines, with_content)
+                commit = line[len(COMMIT_MARKER):]
+                diff_lines = list()
+            else:
+                diff_lines.append(line)
+        if commit is not None:
+            yield commit, parse_unified_diff(diff_lines, with_content)
+
+        if p.wait() != 0:
+            log.error(f'git log failed on {repo_path}: {p.stderr.read().decode("utf-8", errors="replace")}')
+    finally:
+        if p.poll() is None:
+            p.kill()
+            p.wait()
+        p.stdout.close()
+        p.stderr.close()
+
+
+def iter_commit_diffs(repo_path: str, commit_hashes: List[str]) -> Iterator[Tuple[str, List[FileDiff]]]:
+    """
+    Stream the diffs of the given commits against their first parent through a single 'git log --no-walk --stdin -p'
+    process. Merge commits have no diff, as in PyDriller. Renames are detected (-M) and no context line is printed.
+
+    :param List[str] commit_hashes: full hashes of the commits, each commit is returned once, in the given order
+    :returns Iterator[Tuple[str, List[FileDiff]]] (commit hash, file diffs) of each commit
+    """
+    cmd = ['git', '-c', 'core.quotePath=false', 'log', '--no-walk=unsorted', '--stdin', '-p', '-U0', '-M',
+           *DIFF_OPTIONS, f'--format={COMMIT_MARKER}%H']
+    stdin_data = ''.join(f'{h}\n' for h in commit_hashes).encode('ascii')
+    return _stream_commit_diffs(repo_path, cmd, stdin_data)
+
+
+def iter_line_log(repo_path: str, rev: str, file_path: str, line_num: int) -> Iterator[Tuple[str, List[FileDiff]]]:
+    """
+    Stream the history of a line with 'git log -L', from the given revision back to the commit adding the line.
+    Only the commits modifying the line range tracked by git are returned, newest first, with the diff of the range
+    and its content. The file is followed across renames: the paths of the diffs are the paths in each commit.
+
+    :param str rev: revision to start from
+    :param str file_path: path of the file at the revision
+    :param int line_num: number of the line at the revision
+    :returns Iterator[Tuple[str, List[FileDiff]]] (commit hash, file diffs) of each commit
+    """
+    cmd = ['git', '-c', 'core.quotePath=false', 'log', f'-L{line_num},{line_num}:{file_path}', *DIFF_OPTIONS,
+           f'--format={COMMIT_MARKER}%H', rev, '--']
+    return _stream_commit_diffs(repo_path, cmd, with_content=True)
+
+
+def read_name_status(repo_path: str, commit_hash: str) -> List[Tuple[str, str, str]]:
+    """
+    List the files modified by a commit against its parent, with rename detection. Merge and root commits have no
+    modified files, as in PyDriller.
+
+    :param str commit_hash: hash of the commit
+    :returns List[Tuple[str, str, str]] (status letter, old path, new path), old path is None for added files and
+        new path is None for deleted files
+    """
+    p = subprocess.run(['git', 'diff-tree', '-r', '-M', '--no-commit-id', '--name-status', '-z', commit_hash],
+                       cwd=repo_path, capture_output=True, check=True)
+    parts = p.stdout.decode('utf-8', errors='replace').split('\0')
+
+    files = list()
+    i = 0
+    while i < len(parts) - 1:
+        status = parts[i][:1]
+        if status in ('R', 'C'):
+            files.append((status, parts[i + 1], parts[i + 2]))
+            i += 3
+        else:
+            path = parts[i + 1]
+            files.append((status, None if status == 'A' else path, None if status == 'D' else path))
+            i += 2
+    return files
+
+
+def read_file_diff(repo_path: str, commit_hash: str, old_path: str, new_path: str) -> FileDiff:
+    """
+    Get the diff of a single file modified by a commit, parsed with its content. Only the hunks of the file are
+    printed by git, however large the commit is.
+
+    :param str commit_hash: hash of the commit
+    :param str old_path: path of the file in the parent commit, None for added files
+    :param str new_path: path of the file in the commit, None for deleted files
+    :returns FileDiff file_diff, with no lines if the file has no hunks (pure rename, binary file)
+    """
+    paths = [path for path in dict.fromkeys((old_path, new_path)) if path is not None]
+    p = subprocess.run(['git', '-c', 'core.quotePath=false', 'diff-tree', '-r', '-p', '-M', '-U0', '--no-commit-id',
+                        *DIFF_OPTIONS, commit_hash, '--', *paths], cwd=repo_path, capture_output=True, check=True)
+    # decoded as PyDriller does
+    lines = p.stdout.decode('utf-8', errors='ignore').split('\n')
+
+    for file_diff in parse_unified_diff(lines, with_content=True):
+        if file_diff.old_path == old_path and file_diff.new_path == new_path:
+            return file_diff
+    return FileDiff(old_path, new_path, [], [])
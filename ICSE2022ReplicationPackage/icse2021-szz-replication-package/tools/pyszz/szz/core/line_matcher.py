@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+try:
+    from rapidfuzz import process
+    from rapidfuzz.distance import Indel
+except ImportError:
+    process = None
+    import Levenshtein
+
+MATCH_THRESHOLD = 0.75
+DEFAULT_MAX_CANDIDATES = 16384
+
+
+def remove_whitespace(line_str):
+    return ''.join(line_str.strip().split())
+
+
+def compute_line_ratio(line_str1, line_str2):
+    l1 = remove_whitespace(line_str1)
+    l2 = remove_whitespace(line_str2)
+    if process is not None:
+        return Indel.normalized_similarity(l1, l2)
+    return Levenshtein.ratio(l1, l2)
+
+
+class LineCandidates:
+    """ Lines a blamed line can be matched to (the deleted lines of a file in a commit), normalized once """
+    __slots__ = ('line_nums', 'normalized_lines')
+
+    def __init__(self, lines: List[Tuple[int, str]]):
+        """
+        :param List[Tuple[int, str]] lines: candidate lines (line number, line)
+        """
+        self.line_nums = [line[0] for line in lines]
+        self.normalized_lines = [remove_whitespace(line[1]) for line in lines]
+
+    def __len__(self):
+        return len(self.line_nums)
+
+
+def best_match(line_str: str, line_num: int, candidates: Optional[LineCandidates], threshold: float = MATCH_THRESHOLD) -> int:
+    """
+    Find the candidate most similar to the given line, ignoring whitespaces. The similarity is the Levenshtein
+    ratio (normalized Indel similarity). Ties are broken by the distance between the line numbers, then by the order
+    of the candidates. All the candidates are scored in a single rapidfuzz call when rapidfuzz is installed.
+
+    :param str line_str: line to match
+    :param int line_num: number of the line to match
+    :param LineCandidates candidates: candidate lines
+    :param float threshold: the similarity of the match must be greater than threshold
+    :returns int line number of the best candidate, -1 if no candidate is similar enough
+    """
+    if not candidates or not line_str:
+        return -1
+
+    query = remove_whitespace(line_str)
+    if process is not None:
+        scores = ((score, i) for _, score, i in process.extract(query, candidates.normalized_lines, scorer=Indel.normalized_similarity,
+                                                                processor=None, score_cutoff=threshold, limit=None))
+    else:
+        scores = ((Levenshtein.ratio(query, normalized), i) for i, normalized in enumerate(candidates.normalized_lines))
+
+    best_key = None
+    best_index = -1
+    for score, i in scores:
+        if score <= threshold:
+            continue
+        key = (score, -abs(line_num - candidates.line_nums[i]), -i)
+        if best_key is None or key > best_key:
+            best_key = key
+            best_index = i
+
+    return candidates.line_nums[best_index] if best_key is not None else -1
+
+
+class LineCandidatesCache:
+    """ LRU cache of the normalized candidate lines, so that each (commit, file) is normalized once per run """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_CANDIDATES):
+        """
+        :param int max_entries: max number of candidate sets kept in memory
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, fetch: Callable[[], Optional[List[Tuple[int, str]]]]) -> Optional[LineCandidates]:
+        """
+        :param Hashable key: key of the candidate lines, e.g. (repository path, commit hash, file path)
+        :param Callable fetch: function returning the candidate lines (line number, line), None if there are none
+        :returns LineCandidates candidates, None if there are no candidate lines
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        lines = fetch()
+        candidates = LineCandidates(lines) if lines else None
+
+        with self._lock:
+            self._entries[key] = candidates
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return candidates
+
+
+# shared by all the SZZ instances of the process
+line_candidates_cache = LineCandidatesCache()
@@ -0,0 +1,340 @@
+import json
+import logging as log
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_CLAIM_TIMEOUT = 60 * 60
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class RefactoringLocations:
+    """
+    Right side locations of the refactorings detected by RefactoringMiner in a commit. The locations of each file are
+    stored as arrays of intervals sorted by start line, with the running max of the end lines, so that finding the
+    refactoring of a line is a binary search followed by a short backward scan.
+    """
+    __slots__ = ('_files',)
+
+    def __init__(self, files: Dict[str, Tuple[array, array, array, List[str]]] = None):
+        """
+        :param Dict[str, Tuple[array, array, array, List[str]]] files: start lines, end lines, running max of the end
+            lines and refactoring types of the intervals of each file, indexed by file path
+        """
+        self._files = files if files is not None else dict()
+
+    @classmethod
+    def from_intervals(cls, intervals: Dict[str, List[Tuple[int, int, str]]]) -> 'RefactoringLocations':
+        """
+        :param Dict[str, List[Tuple[int, int, str]]] intervals: (start line, end line, refactoring type) of the
+            locations of each file, in any order
+        :returns RefactoringLocations
+        """
+        files = dict()
+        for file_path, file_intervals in intervals.items():
+            file_intervals = sorted(file_intervals, key=lambda interval: interval[0])
+            starts = array('i', (interval[0] for interval in file_intervals))
+            ends = array('i', (interval[1] for interval in file_intervals))
+            max_ends = array('i')
+            max_end = 0
+            for end in ends:
+                max_end = max(max_end, end)
+                max_ends.append(max_end)
+            files[file_path] = (starts, ends, max_ends, [interval[2] for interval in file_intervals])
+        return cls(files)
+
+    @classmethod
+    def from_refminer_output(cls, refminer_output: dict) -> 'RefactoringLocations':
+        """
+        :param dict refminer_output: parsed JSON output of RefactoringMiner for a single commit
+        :returns RefactoringLocations right side locations of the refactorings of the commit
+        """
+        intervals = dict()
+        for refactoring in refminer_output['commits'][0]['refactorings']:
+            for location in refactoring['rightSideLocations']:
+                intervals.setdefault(location['filePath'], list()).append(
+                    (int(location['startLine']), int(location['endLine']), refactoring['type']))
+        return cls.from_intervals(intervals)
+
+    def intervals(self) -> Dict[str, List[Tuple[int, int, str]]]:
+        """
+        :returns Dict[str, List[Tuple[int, int, str]]] (start line, end line, refactoring type) of the locations of
+            each file, sorted by start line
+        """
+        return {file_path: list(zip(starts, ends, types)) for file_path, (starts, ends, _, types) in self._files.items()}
+
+    def find(self, file_path: str, line_num: int) -> Optional[str]:
+        """
+        :param str file_path: path of the file in the commit
+        :param int line_num: line number in the commit
+        :returns str type of a refactoring whose location contains the line, None if there is none
+        """
+        file_intervals = self._files.get(file_path)
+        if file_intervals is None:
+            return None
+        starts, ends, max_ends, types = file_intervals
+        i = bisect_right(starts, line_num) - 1
+        while i >= 0 and max_ends[i] >= line_num:
+            if ends[i] >= line_num:
+                return types[i]
+            i -= 1
+        return None
+
+    def __len__(self):
+        return sum(len(starts) for starts, _, _, _ in self._files.values())
+
+
+class RefactoringStore:
+    """
+    Persistent store of the refactorings detected by RefactoringMiner in the commits of a repository, keyed by commit
+    hash, backed by a SQLite database in WAL mode. A worker claims a commit before running RefactoringMiner on it: the
+    other threads and processes wait for its result instead of running RefactoringMiner on the same commit. The claim
+    of a worker that died on this host is taken over at once, the claim of a worker of another host expires after
+    claim_timeout seconds.
+    """
+
+    def __init__(self, db_path: str, claim_timeout: float = DEFAULT_CLAIM_TIMEOUT):
+        """
+        :param str db_path: path of the SQLite database file, created if it does not exist
+        :param float claim_timeout: time in seconds after which the claim of a commit can be taken over
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.db_path = db_path
+        self.claim_timeout = claim_timeout
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+        self._local = threading.local()
+        self._connections = list()
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS refactorings (commit_id TEXT PRIMARY KEY, locations BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS claims (commit_id TEXT PRIMARY KEY, owner TEXT NOT NULL, claimed_at REAL NOT NULL);
+        ''')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _owner() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+    @staticmethod
+    def _is_dead_owner(owner: str) -> bool:
+        """
+        :param str owner: owner of a claim, as returned by _owner()
+        :returns bool True if the owner is a thread or a process of this host that no longer exists
+        """
+        host, pid, thread_id = owner.rsplit(':', 2)
+        if host != socket.gethostname():
+            return False
+        if int(pid) == os.getpid():
+            return int(thread_id) not in {thread.ident for thread in threading.enumerate()}
+        if os.name == 'nt':
+            # os.kill terminates the process on Windows, the claim expires after claim_timeout
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            # e.g. the process exists but belongs to another user
+            pass
+        return False
+
+    def get(self, commit_id: str) -> Optional[RefactoringLocations]:
+        """
+        :param str commit_id: hash of the commit
+        :returns RefactoringLocations refactorings of the commit, None if RefactoringMiner has not analyzed it yet
+        """
+        locations = self._load(commit_id)
+        if locations is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return locations
+
+    def _load(self, commit_id: str) -> Optional[RefactoringLocations]:
+        row = self._conn().execute('SELECT locations FROM refactorings WHERE commit_id = ?', (commit_id,)).fetchone()
+        if row is None:
+            return None
+        intervals = json.loads(zlib.decompress(row[0]))
+        return RefactoringLocations.from_intervals({file_path: [tuple(interval) for interval in file_intervals]
+                                                    for file_path, file_intervals in intervals.items()})
+
+    def put(self, commit_id: str, locations: RefactoringLocations):
+        """
+        Store the refactorings of a commit and release its claim, in a single transaction.
+
+        :param str commit_id: hash of the commit
+        :param RefactoringLocations locations: refactorings detected in the commit
+        """
+        raw_locations = zlib.compress(json.dumps(locations.intervals(), separators=(',', ':')).encode('utf-8'))
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO refactorings (commit_id, locations) VALUES (?, ?)',
+                         (commit_id, sqlite3.Binary(raw_locations)))
+            conn.execute('DELETE FROM claims WHERE commit_id = ?', (commit_id,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def claim(self, commit_id: str) -> bool:
+        """
+        Claim a commit not analyzed yet, unless another worker that is still alive holds a claim younger than
+        claim_timeout.
+
+        :param str commit_id: hash of the commit
+        :returns bool True if the caller must run RefactoringMiner on the commit and store its result
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM refactorings WHERE commit_id = ?', (commit_id,)).fetchone() is not None:
+                claimed = False
+            else:
+                row = conn.execute('SELECT claimed_at, owner FROM claims WHERE commit_id = ?', (commit_id,)).fetchone()
+                if row is None:
+                    claimed = True
+                elif time.time() - row[0] > self.claim_timeout:
+                    claimed = True
+                    log.warning(f'claim of {commit_id} expired, running RefactoringMiner again')
+                elif self._is_dead_owner(row[1]):
+                    claimed = True
+                    log.warning(f'owner {row[1]} of the claim of {commit_id} is dead, running RefactoringMiner again')
+                else:
+                    claimed = False
+                if claimed:
+                    conn.execute('INSERT OR REPLACE INTO claims (commit_id, owner, claimed_at) VALUES (?, ?, ?)',
+                                 (commit_id, self._owner(), time.time()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return claimed
+
+    def release(self, commit_id: str):
+        """ Release the claim of a commit held by the caller, so that another worker can analyze it """
+        self._conn().execute('DELETE FROM claims WHERE commit_id = ? AND owner = ?', (commit_id, self._owner()))
+
+    def iter_extract(self, commit_ids: Iterable[str], submit: Callable[[str], Future],
+                     poll_interval: float = DEFAULT_POLL_INTERVAL) -> Iterator[Tuple[str, RefactoringLocations]]:
+        """
+        Get the refactorings of several commits, each one as soon as it is known: the stored commits first, then the
+        commits the caller claimed, as RefactoringMiner completes them, and the commits claimed by other workers, as
+        they store them. All the claimed commits are submitted before waiting for any of them, and each result is
+        stored as soon as it comes back. A failed analysis is raised once the analyses completed at the same time are
+        stored.
+
+        :param Iterable[str] commit_ids: hashes of the commits
+        :param Callable[[str], Future] submit: function submitting a commit to RefactoringMiner, returning a future
+            resolved with its parsed JSON output
+        :param float poll_interval: time in seconds between two checks of the commits analyzed by other workers
+        :returns Iterator[Tuple[str, RefactoringLocations]] (commit, refactorings) pairs, in completion order
+        """
+        waiting = list()
+        for commit_id in dict.fromkeys(commit_ids):
+            locations = self.get(commit_id)
+            if locations is not None:
+                yield commit_id, locations
+            else:
+                waiting.append(commit_id)
+
+        running = dict()
+        waited = set()
+        try:
+            while waiting or running:
+                claimed_by_others = list()
+                for commit_id in waiting:
+                    if self.claim(commit_id):
+                        running[submit(commit_id)] = commit_id
+                        continue
+                    locations = self._load(commit_id)
+                    if locations is not None:
+                        yield commit_id, locations
+                        continue
+                    if commit_id not in waited:
+                        waited.add(commit_id)
+                        self.waits += 1
+                        log.info(f'waiting for RefactoringMiner on {commit_id}, claimed by another worker')
+                    claimed_by_others.append(commit_id)
+                waiting = claimed_by_others
+
+                if not running:
+                    if waiting:
+                        time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval if waiting else None, return_when=FIRST_COMPLETED)
+                # all the completed analyses are stored before a failure is raised, so that none of them is lost
+                completed = list()
+                failure = None
+                for future in done:
+                    commit_id = running.pop(future)
+                    try:
+                        locations = RefactoringLocations.from_refminer_output(future.result())
+                    except BaseException as e:
+                        self.release(commit_id)
+                        failure = failure or e
+                        continue
+                    self.put(commit_id, locations)
+                    completed.append((commit_id, locations))
+                yield from completed
+                if failure is not None:
+                    raise failure
+        finally:
+            # a commit failed or the caller stopped early: the other workers can take over the commits still running
+            for future, commit_id in running.items():
+                future.cancel()
+                self.release(commit_id)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'waits': self.waits}
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_stores = dict()
+_stores_lock = threading.Lock()
+
+
+def get_refactoring_store(db_path: str) -> RefactoringStore:
+    """
+    Get the refactoring store of the given database, shared by all the SZZ instances of the process.
+
+    :param str db_path: path of the SQLite database file
+    :returns RefactoringStore store
+    """
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = RefactoringStore(key)
+        return store
@@ -0,0 +1,286 @@
+import atexit
+import itertools
+import json
+import logging as log
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import List
+
+from .ast_map_client import LatencyStats
+
+DAEMON_CLASS = 'RefactoringMinerDaemon'
+DAEMON_DIR = 'daemon'
+DEFAULT_POOL_SIZE = 2
+DEFAULT_TIMEOUT = 600
+
+# the commits needed right away are analyzed before the commits prefetched in the background
+PRIORITY_REQUEST = 0
+PRIORITY_PREFETCH = 1
+
+
+class RefMinerError(Exception):
+    pass
+
+
+class RefMinerDaemonCrashed(RefMinerError):
+    pass
+
+
+def refminer_command(refminer_home: str, repo_path: str, commit_id: str) -> List[str]:
+    """ Command line of a one-shot RefactoringMiner run on a commit, with the start script of the platform """
+    script = 'RefactoringMiner.bat' if os.name == 'nt' else 'RefactoringMiner'
+    return [os.path.join(refminer_home, 'bin', script), '-c', repo_path, commit_id]
+
+
+class RefMinerDaemon:
+    """
+    Client of a long-running RefactoringMinerDaemon JVM, which analyzes commits with RefactoringMiner without paying
+    the JVM startup on each call. The daemon analyzes one commit at a time, so a client is used by a single thread and
+    each request waits for its reply. The daemon is killed when a request exceeds the timeout, and respawned by the
+    next request.
+    """
+
+    def __init__(self, refminer_home: str, timeout: float = DEFAULT_TIMEOUT):
+        """
+        :param str refminer_home: directory of RefactoringMiner, with its bin and lib folders
+        :param float timeout: max time in seconds to analyze a commit
+        """
+        self.refminer_home = refminer_home
+        self.timeout = timeout
+        self.restarts = 0
+
+        self._process = None
+        self._started = False
+        self._ids = itertools.count()
+
+    def _build(self):
+        """ Compile the daemon against the RefactoringMiner libraries, if its class is missing or older than its source """
+        source = os.path.join(self.refminer_home, DAEMON_DIR, f'{DAEMON_CLASS}.java')
+        class_file = os.path.join(self.refminer_home, DAEMON_DIR, 'classes', f'{DAEMON_CLASS}.class')
+        if os.path.exists(class_file) and os.path.getmtime(class_file) >= os.path.getmtime(source):
+            return
+        subprocess.run(['javac', '-cp', os.path.join('lib', '*'), '-d', os.path.join(DAEMON_DIR, 'classes'), source],
+                       cwd=self.refminer_home, check=True, capture_output=True)
+
+    def _start(self):
+        self._build()
+        classpath = os.pathsep.join([os.path.join('lib', '*'), os.path.join(DAEMON_DIR, 'classes')])
+        self._process = subprocess.Popen(['java', '-cp', classpath, DAEMON_CLASS], cwd=self.refminer_home,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def detect(self, repo_path: str, commit_id: str) -> dict:
+        """
+        Detect the refactorings of a commit.
+
+        :param str repo_path: path of the git repository
+        :param str commit_id: hash of the commit
+        :returns dict parsed JSON output of RefactoringMiner, as printed by 'RefactoringMiner -c'
+        """
+        if self._process is None or self._process.poll() is not None:
+            if self._started:
+                self.restarts += 1
+                log.warning(f'restarting RefactoringMiner daemon (restart {self.restarts})')
+            self._start()
+            self._started = True
+
+        process = self._process
+        request = {'id': next(self._ids), 'repo': repo_path, 'commit': commit_id}
+        try:
+            process.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+            process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self._process = None
+            raise RefMinerDaemonCrashed(f'unable to write to the RefactoringMiner daemon: {e}')
+
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(self.timeout, kill)
+        timer.start()
+        try:
+            raw_line = process.stdout.readline()
+        finally:
+            timer.cancel()
+
+        if not raw_line:
+            process.wait()
+            self._process = None
+            if timed_out.is_set():
+                raise RefMinerError(f'RefactoringMiner timed out on {commit_id}, its daemon was killed')
+            raise RefMinerDaemonCrashed(f'RefactoringMiner daemon terminated with code {process.returncode}')
+
+        reply = json.loads(raw_line)
+        if not reply.get('ok'):
+            raise RefMinerError(reply.get('error'))
+        return json.loads(reply['output'])
+
+    def close(self):
+        process = self._process
+        self._process = None
+        if process is not None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=5)
+            except Exception:
+                process.kill()
+
+
+class RefMinerPool:
+    """
+    Pool of RefactoringMiner JVMs shared by the workers of the process. The submitted commits are queued and each one
+    is analyzed as soon as a daemon is free, its future resolves as soon as its analysis completes. The prefetched
+    commits are only analyzed when no other commit is queued. Each thread of the pool owns a daemon. If the daemons
+    cannot be built or started (e.g. no JDK), the commits are analyzed with one-shot runs of the start script of the
+    platform, still size at a time.
+    """
+
+    def __init__(self, refminer_home: str, size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        """
+        :param str refminer_home: directory of RefactoringMiner, with its bin and lib folders
+        :param int size: number of daemons
+        :param float timeout: max time in seconds to analyze a commit
+        """
+        self.refminer_home = refminer_home
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.latency = LatencyStats()
+        self.use_daemons = True
+
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='refminer')
+        # each task of the executor analyzes the queued commit with the highest priority
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._local = threading.local()
+        self._daemons = list()
+        self._lock = threading.Lock()
+
+    def _daemon(self) -> RefMinerDaemon:
+        daemon = getattr(self._local, 'daemon', None)
+        if daemon is None:
+            daemon = self._local.daemon = RefMinerDaemon(self.refminer_home, self.timeout)
+            with self._lock:
+                self._daemons.append(daemon)
+        return daemon
+
+    def _detect(self, repo_path: str, commit_id: str) -> dict:
+        start = perf_counter()
+        try:
+            refminer_output = self._run(repo_path, commit_id)
+        except Exception:
+            self.latency.add(perf_counter() - start, failed=True)
+            raise
+        self.latency.add(perf_counter() - start)
+        return refminer_output
+
+    def _run(self, repo_path: str, commit_id: str) -> dict:
+        if self.use_daemons:
+            daemon = self._daemon()
+            for attempt in range(2):
+                try:
+                    return daemon.detect(repo_path, commit_id)
+                except RefMinerDaemonCrashed:
+                    if attempt == 1:
+                        raise
+                except (OSError, subprocess.CalledProcessError) as e:
+                    log.error(f'unable to start the RefactoringMiner daemon, falling back to one-shot runs: {e}')
+                    self.use_daemons = False
+                    break
+        return self.detect_once(repo_path, commit_id)
+
+    def _run_next(self):
+        try:
+            _, _, future, repo_path, commit_id = self._queue.get_nowait()
+        except queue.Empty:
+            return
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            refminer_output = self._detect(repo_path, commit_id)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(refminer_output)
+
+    def submit(self, repo_path: str, commit_id: str, prefetch: bool = False) -> Future:
+        """
+        Queue a commit for analysis, without waiting for its result.
+
+        :param str repo_path: path of the git repository
+        :param str commit_id: hash of the commit
+        :param bool prefetch: analyze the commit after all the commits queued without prefetch
+        :returns Future future resolved with the parsed JSON output of RefactoringMiner
+        """
+        log.info(f'Running RefMiner on {commit_id}')
+        future = Future()
+        priority = PRIORITY_PREFETCH if prefetch else PRIORITY_REQUEST
+        self._queue.put((priority, next(self._sequence), future, repo_path, commit_id))
+        self._executor.submit(self._run_next)
+        return future
+
+    def detect(self, repo_path: str, commit_id: str) -> dict:
+        """ Analyze a commit and wait for its result, see submit() """
+        return self.submit(repo_path, commit_id).result()
+
+    def detect_once(self, repo_path: str, commit_id: str) -> dict:
+        """ Analyze a commit with a one-shot RefactoringMiner run """
+        p = subprocess.run(refminer_command(self.refminer_home, repo_path, commit_id), check=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=self.timeout)
+        return json.loads(p.stdout)
+
+    def stats(self) -> dict:
+        stats = self.latency.stats()
+        stats['daemons'] = len(self._daemons) if self.use_daemons else 0
+        stats['restarts'] = sum(daemon.restarts for daemon in self._daemons)
+        return stats
+
+    def close(self):
+        # the queued commits are cancelled, only the running analyses are waited for
+        while True:
+            try:
+                _, _, future, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for daemon in self._daemons:
+                daemon.close()
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+def get_refminer_pool(refminer_home: str, size: int = DEFAULT_POOL_SIZE) -> RefMinerPool:
+    """
+    Get the RefactoringMiner pool of the given RefactoringMiner directory, shared by all the SZZ instances of the
+    process.
+
+    :param str refminer_home: directory of RefactoringMiner, with its bin and lib folders
+    :param int size: number of daemons, only used when the pool is created
+    :returns RefMinerPool pool
+    """
+    key = os.path.abspath(refminer_home)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = RefMinerPool(key, size)
+        return pool
+
+
+def close_refminer_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            log.info(f'RefactoringMiner stats {pool.refminer_home}: {pool.stats()}')
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_refminer_pools)
@@ -0,0 +1,384 @@
+import logging as log
+import os
+import pickle
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .git_batch import unquote_git_path
+
+COMMIT_MARKER = '\x01'
+
+MetaChanges = namedtuple('MetaChanges', 'merge mode_changes renames copies')
+NO_META_CHANGES = MetaChanges(False, (), (), ())
+
+
+class RepoLogIndex(ABC):
+    """
+    Base class of the indexes of a repository built from a single 'git log --all' pass. The index is persisted with
+    the refs it covers, and extended with the commits added since then by logging only the new commits
+    ('git log --all ^<old refs>'). Subclasses define the git log arguments and how the output is parsed.
+    """
+
+    NAME = None
+    VERSION = 1
+    LOG_ARGS: List[str] = list()
+
+    def __init__(self, repo_path: str, cache_dir: str = None):
+        """
+        :param str repo_path: path of the git repository
+        :param str cache_dir: folder where the index is persisted, None to keep it in memory only
+        """
+        self.repo_path = repo_path
+        self.index_path = os.path.join(cache_dir, f'{self.NAME}.idx') if cache_dir else None
+        self._tips = list()
+        self._lock = threading.Lock()
+        self._updated = False
+
+    def _refs(self) -> List[str]:
+        p = subprocess.run(['git', 'rev-parse', '--all'], cwd=self.repo_path, capture_output=True, check=True)
+        return sorted(set(p.stdout.decode('ascii').split()))
+
+    def _log(self, excluded_tips: List[str]) -> Iterable[str]:
+        cmd = ['git', '-c', 'core.quotePath=false', 'log', '--all', '--stdin', '--no-color',
+               f'--format={COMMIT_MARKER}%H %P', *self.LOG_ARGS]
+        p = subprocess.Popen(cmd, cwd=self.repo_path, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            p.stdin.write(''.join(f'^{tip}\n' for tip in excluded_tips).encode('ascii'))
+            p.stdin.close()
+            for raw_line in p.stdout:
+                yield raw_line.decode('utf-8', errors='replace').rstrip('\n')
+            if p.wait() != 0:
+                raise subprocess.CalledProcessError(p.returncode, cmd, stderr=p.stderr.read())
+        finally:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+            p.stdout.close()
+            p.stderr.close()
+
+    def _iter_commits(self, lines: Iterable[str]) -> Iterable[Tuple[str, List[str], List[str]]]:
+        """ Group the git log output by commit: (hash, parent hashes, lines printed after the commit header) """
+        commit = None
+        for line in lines:
+            if line.startswith(COMMIT_MARKER):
+                if commit is not None:
+                    yield commit
+                hashes = line[len(COMMIT_MARKER):].split()
+                commit = (hashes[0], hashes[1:], list())
+            elif commit is not None and line:
+                commit[2].append(line)
+        if commit is not None:
+            yield commit
+
+    def update(self) -> int:
+        """
+        Load the persisted index and add the commits it does not cover yet.
+
+        :returns int number of commits added to the index
+        """
+        with self._lock:
+            if not self._tips:
+                self._load()
+
+            tips = self._refs()
+            if tips == self._tips:
+                self._updated = True
+                return 0
+
+            try:
+                added = self._add_commits(self._iter_commits(self._log(self._tips)))
+            except subprocess.CalledProcessError as e:
+                # old refs that are no longer in the repository (e.g. rewritten history): rebuild from scratch
+                log.warning(f'{self.NAME} index of {self.repo_path}: incremental update failed, rebuilding it: {e.stderr}')
+                self._reset()
+                added = self._add_commits(self._iter_commits(self._log([])))
+
+            self._tips = tips
+            self._updated = True
+            self._save()
+            log.info(f'{self.NAME} index of {self.repo_path}: {added} commits added')
+            return added
+
+    def ensure_updated(self):
+        """ Update the index the first time it is used """
+        if not self._updated:
+            self.update()
+
+    def _load(self):
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'rb') as f:
+                stored = pickle.load(f)
+        except Exception as e:
+            log.warning(f'unable to load {self.index_path}: {e}')
+            return
+        if stored.get('version') != self.VERSION:
+            return
+        self._set_state(stored['state'])
+        self._tips = stored['tips']
+
+    def _save(self):
+        if self.index_path is None:
+            return
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        # written to a temporary file first, so that a concurrent reader never loads a partial index
+        temp_path = f'{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'version': self.VERSION, 'tips': self._tips, 'state': self._get_state()}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.index_path)
+
+    @abstractmethod
+    def _add_commits(self, commits: Iterable[Tuple[str, List[str], List[str]]]) -> int:
+        """
+        Add the commits logged by git to the index.
+
+        :param Iterable[Tuple[str, List[str], List[str]]] commits: (hash, parent hashes, lines printed after the
+            commit header) of each commit
+        :returns int number of commits added to the index
+        """
+        pass
+
+    @abstractmethod
+    def _reset(self):
+        """ Empty the index, before rebuilding it from scratch """
+        pass
+
+    @abstractmethod
+    def _get_state(self):
+        """
+        :returns picklable content of the index, persisted with the refs it covers
+        """
+        pass
+
+    @abstractmethod
+    def _set_state(self, state):
+        """
+        :param state: content of the index, as returned by _get_state()
+        """
+        pass
+
+
+class RenameIndex(RepoLogIndex):
+    """ Files renamed by each commit of a repository (against its first parent, merge commits excluded) """
+
+    NAME = 'renames'
+    LOG_ARGS = ['--name-status', '-M', '--diff-filter=R']
+
+    def __init__(self, repo_path: str, cache_dir: str = None):
+        super().__init__(repo_path, cache_dir)
+        self._renames: Dict[str, Dict[str, str]] = dict()
+
+    def _add_commits(self, commits: Iterable[Tuple[str, List[str], List[str]]]) -> int:
+        count = 0
+        for commit_hash, _, lines in commits:
+            count += 1
+            renames = dict()
+            for line in lines:
+                parts = line.split('\t')
+                if len(parts) == 3 and parts[0].startswith('R'):
+                    renames[unquote_git_path(parts[2])] = unquote_git_path(parts[1])
+            if renames:
+                self._renames[commit_hash] = renames
+        return count
+
+    def _reset(self):
+        self._renames = dict()
+
+    def _get_state(self):
+        return self._renames
+
+    def _set_state(self, state):
+        self._renames = state
+
+    def old_path(self, commit_hash: str, file_path: str) -> str:
+        """
+        Get the path a file had in the parent of a commit.
+
+        :param str commit_hash: full hash of the commit
+        :param str file_path: path of the file in the commit
+        :returns str path of the file in the parent commit, file_path if the commit did not rename it
+        """
+        self.ensure_updated()
+        renames = self._renames.get(commit_hash)
+        return renames.get(file_path, file_path) if renames else file_path
+
+    def renames(self, commit_hash: str) -> Dict[str, str]:
+        """
+        :param str commit_hash: full hash of the commit
+        :returns Dict[str, str] old path of each file renamed by the commit, indexed by new path
+        """
+        self.ensure_updated()
+        return dict(self._renames.get(commit_hash, {}))
+
+
+class ChangeSizeIndex(RepoLogIndex):
+    """
+    Number of files modified by each commit of a repository, against its first parent, as counted by PyDriller
+    (merge commits modify no file). The hashes are stored as a sorted array of 20-byte binary hashes with a parallel
+    int32 array of sizes, so that a lookup is a binary search on a few compact buffers.
+    """
+
+    NAME = 'change_sizes'
+    LOG_ARGS = ['--numstat', '-M']
+
+    def __init__(self, repo_path: str, cache_dir: str = None):
+        super().__init__(repo_path, cache_dir)
+        self._shas = b''
+        self._sizes = array('i')
+
+    def _add_commits(self, commits: Iterable[Tuple[str, List[str], List[str]]]) -> int:
+        new_sizes = dict()
+        for commit_hash, parents, lines in commits:
+            new_sizes[bytes.fromhex(commit_hash)] = 0 if len(parents) > 1 else len(lines)
+        if not new_sizes:
+            return 0
+
+        entries = dict(zip((self._shas[i:i + 20] for i in range(0, len(self._shas), 20)), self._sizes))
+        entries.update(new_sizes)
+        shas = sorted(entries)
+        self._shas = b''.join(shas)
+        self._sizes = array('i', (entries[sha] for sha in shas))
+        return len(new_sizes)
+
+    def _reset(self):
+        self._shas = b''
+        self._sizes = array('i')
+
+    def _get_state(self):
+        return self._shas, self._sizes.tobytes()
+
+    def _set_state(self, state):
+        self._shas = state[0]
+        self._sizes = array('i')
+        self._sizes.frombytes(state[1])
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def get(self, commit_hash: str) -> Optional[int]:
+        """
+        :param str commit_hash: full hash of the commit
+        :returns int number of files modified by the commit, None if the commit is not reachable from any ref
+        """
+        self.ensure_updated()
+        key = bytes.fromhex(commit_hash)
+        lo, hi = 0, len(self._sizes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._shas[mid * 20:mid * 20 + 20] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._sizes) and self._shas[lo * 20:lo * 20 + 20] == key:
+            return self._sizes[lo]
+        return None
+
+
+class MetaChangeIndex(RepoLogIndex):
+    """
+    Meta-changes of each commit of a repository: whether it is a merge commit, the files whose mode it changes, as
+    listed by 'git show --summary', and the files it renames or copies, against its first parent (merge commits
+    modify no file). The commits without meta-changes share the same entry.
+    """
+
+    NAME = 'meta_changes'
+    # --name-status hides the summary, the renames and copies are read from the raw output
+    LOG_ARGS = ['--raw', '--summary', '-M', '-C']
+
+    def __init__(self, repo_path: str, cache_dir: str = None):
+        super().__init__(repo_path, cache_dir)
+        self._meta_changes: Dict[bytes, MetaChanges] = dict()
+
+    def _add_commits(self, commits: Iterable[Tuple[str, List[str], List[str]]]) -> int:
+        count = 0
+        for commit_hash, parents, lines in commits:
+            count += 1
+            mode_changes, renames, copies = list(), list(), list()
+            for line in lines:
+                if line.startswith(':'):
+                    # :<old mode> <new mode> <old sha> <new sha> <status>\t<path>[\t<new path>]
+                    parts = line.split('\t')
+                    status = parts[0].split()[-1]
+                    if len(parts) == 3 and status[0] in 'RC':
+                        paths = (unquote_git_path(parts[1]), unquote_git_path(parts[2]))
+                        (renames if status[0] == 'R' else copies).append(paths)
+                elif line.startswith(' mode change '):
+                    # ' mode change <old mode> => <new mode> <path>', without path for renamed and copied files
+                    parts = line.strip().split(' ', 5)
+                    if len(parts) == 6:
+                        mode_changes.append(unquote_git_path(parts[5]))
+
+            if len(parents) > 1 or mode_changes or renames or copies:
+                self._meta_changes[bytes.fromhex(commit_hash)] = MetaChanges(len(parents) > 1, tuple(mode_changes),
+                                                                             tuple(renames), tuple(copies))
+            else:
+                self._meta_changes[bytes.fromhex(commit_hash)] = NO_META_CHANGES
+        return count
+
+    def _reset(self):
+        self._meta_changes = dict()
+
+    def _get_state(self):
+        # the entries are pickled as plain tuples, the commits without meta-changes as None
+        return {sha: (None if entry is NO_META_CHANGES else tuple(entry)) for sha, entry in self._meta_changes.items()}
+
+    def _set_state(self, state):
+        self._meta_changes = {sha: (NO_META_CHANGES if entry is None else MetaChanges(*entry)) for sha, entry in state.items()}
+
+    def __len__(self):
+        return len(self._meta_changes)
+
+    def get(self, commit_hash: str) -> Optional[MetaChanges]:
+        """
+        :param str commit_hash: full hash of the commit
+        :returns MetaChanges meta-changes of the commit, None if the commit is not reachable from any ref
+        """
+        self.ensure_updated()
+        return self._meta_changes.get(bytes.fromhex(commit_hash))
+
+
+def iter_rev_list(repo_path: str, rev: str) -> Iterator[str]:
+    """
+    Stream the hashes of the commits reachable from a revision, in the order of git log. The process is killed if
+    the iteration stops early.
+
+    :param str repo_path: path of the git repository
+    :param str rev: revision to start from
+    :returns Iterator[str] commit hashes
+    """
+    p = subprocess.Popen(['git', 'rev-list', rev, '--'], cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for raw_line in p.stdout:
+            yield raw_line.decode('ascii').strip()
+    finally:
+        if p.poll() is None:
+            p.kill()
+        p.wait()
+        p.stdout.close()
+
+
+_indexes = dict()
+_indexes_lock = threading.Lock()
+
+
+def get_repo_index(index_class: type, repo_path: str, cache_dir: str = None) -> Optional[RepoLogIndex]:
+    """
+    Get the index of the given class for a repository, shared by all the SZZ instances of the process.
+
+    :param type index_class: subclass of RepoLogIndex
+    :param str repo_path: path of the git repository
+    :param str cache_dir: folder where the index is persisted
+    :returns RepoLogIndex index
+    """
+    key = (index_class, os.path.abspath(repo_path))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = index_class(repo_path, cache_dir)
+        return index
@@ -0,0 +1,163 @@
+import logging as log
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Hashable, List, Optional, Tuple
+
+SRCML_ESCAPE_TAG = '{http://www.srcML.org/srcML/src}escape'
+
+UNIT_OPEN_TAG = re.compile(r'<unit\b[^>]*>')
+FILENAME_ATTR = re.compile(r'\bfilename="([^"]*)"')
+XMLNS_ATTR = re.compile(r'\bxmlns(?::[\w-]+)?="[^"]*"')
+
+
+def element_to_source(element: ET.Element, with_tail: bool = False) -> str:
+    """
+    Convert a srcML element back to source code in-process. srcML is lossless, the source code is the text
+    content of the element, apart from the control characters that srcML stores as <escape char="0x.."/> elements.
+
+    :param Element element: srcML element
+    :param bool with_tail: append the text following the element, as ET.tostring() does
+    :returns str source code
+    """
+    parts = list()
+
+    def visit(el: ET.Element):
+        if el.tag == SRCML_ESCAPE_TAG:
+            parts.append(chr(int(el.attrib.get('char', '0x0'), 16)))
+        elif el.text:
+            parts.append(el.text)
+        for child in el:
+            visit(child)
+            if child.tail:
+                parts.append(child.tail)
+
+    visit(element)
+    if with_tail and element.tail:
+        parts.append(element.tail)
+    return ''.join(parts)
+
+
+def split_srcml_archive(archive: str) -> List[Tuple[str, str]]:
+    """
+    Split a srcML archive into its units. Each unit is returned as a standalone document, with the namespace
+    declarations of the archive root copied to the unit.
+
+    :param str archive: srcML archive, as produced by 'srcml --archive'
+    :returns List[Tuple[str, str]] list of (filename attribute, unit xml)
+    """
+    root_tag = UNIT_OPEN_TAG.search(archive)
+    if root_tag is None:
+        return []
+    namespaces = XMLNS_ATTR.findall(root_tag.group())
+
+    units = list()
+    pos = root_tag.end()
+    while True:
+        unit_tag = UNIT_OPEN_TAG.search(archive, pos)
+        if unit_tag is None:
+            break
+        # units are not nested inside a unit of the archive, '<' is always escaped in the source code
+        end = archive.find('</unit>', unit_tag.end())
+        if end == -1:
+            break
+        end += len('</unit>')
+
+        open_tag = unit_tag.group()
+        declared = {ns.split('=')[0] for ns in XMLNS_ATTR.findall(open_tag)}
+        missing = ' '.join(ns for ns in namespaces if ns.split('=')[0] not in declared)
+        if missing:
+            open_tag = open_tag[:len('<unit')] + ' ' + missing + open_tag[len('<unit'):]
+
+        filename = FILENAME_ATTR.search(unit_tag.group())
+        units.append((filename.group(1) if filename else '', open_tag + archive[unit_tag.end():end]))
+        pos = end
+
+    return units
+
+
+class SrcMLBatch:
+    """
+    Batch of source code units converted to srcML with a single srcml invocation (archive mode), so that the cost
+    of starting srcml is paid once per batch instead of once per file. The language of each unit is given by the
+    extension of its file name, as when calling srcml on a single file.
+    """
+
+    def __init__(self, temp_dir: str = tempfile.gettempdir(), max_units: int = 500, srcml_args: Tuple[str, ...] = ('--position',)):
+        """
+        :param str temp_dir: folder where the units are written before the conversion
+        :param int max_units: max number of units converted by a single srcml invocation
+        :param Tuple[str] srcml_args: additional srcml arguments
+        """
+        self.temp_dir = temp_dir
+        self.max_units = max_units
+        self.srcml_args = list(srcml_args)
+        self._pending = list()
+
+    def add(self, key: Hashable, content: str, file_name: str):
+        """
+        Add a unit to the batch.
+
+        :param Hashable key: key identifying the unit in the result of convert()
+        :param str content: source code of the unit
+        :param str file_name: name of the file, its extension determines the language
+        """
+        self._pending.append((key, content, os.path.basename(file_name)))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def convert(self) -> Dict[Hashable, Optional[str]]:
+        """
+        Convert the pending units and clear the batch.
+
+        :returns Dict[Hashable, str] srcML document of each unit, None if srcml failed on the unit
+        """
+        pending, self._pending = self._pending, list()
+        result = dict()
+        for i in range(0, len(pending), self.max_units):
+            result.update(self._convert(pending[i:i + self.max_units]))
+        return result
+
+    def _convert(self, units: List[Tuple[Hashable, str, str]]) -> Dict[Hashable, Optional[str]]:
+        if not os.path.isdir(self.temp_dir):
+            os.makedirs(self.temp_dir, exist_ok=True)
+        batch_dir = tempfile.mkdtemp(prefix='srcml_', dir=self.temp_dir)
+
+        try:
+            paths = list()
+            for i, (_, content, file_name) in enumerate(units):
+                # the index prefix keeps names unique and maps the units of the archive back to their keys
+                path = os.path.join(batch_dir, f'{i}_{file_name}')
+                with open(path, 'w', encoding='utf-8', errors='ignore') as f:
+                    f.write(content)
+                paths.append(path)
+
+            files_from = os.path.join(batch_dir, 'files.txt')
+            with open(files_from, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(paths) + '\n')
+
+            p = subprocess.run(['srcml', '--archive', *self.srcml_args, '--files-from', files_from], capture_output=True)
+            if p.returncode == 0:
+                result = {key: None for key, _, _ in units}
+                for filename, unit_xml in split_srcml_archive(p.stdout.decode('utf-8', errors='replace')):
+                    index = os.path.basename(filename).split('_', 1)[0]
+                    if index.isdigit() and int(index) < len(units):
+                        result[units[int(index)][0]] = unit_xml
+                return result
+
+            log.warning(f'srcml batch conversion failed, converting {len(units)} units one by one: {p.stderr.decode("utf-8", errors="replace")}')
+            result = dict()
+            for (key, _, _), path in zip(units, paths):
+                p = subprocess.run(['srcml', *self.srcml_args, path], capture_output=True)
+                if p.returncode == 0:
+                    result[key] = p.stdout.decode('utf-8', errors='replace')
+                else:
+                    log.error(f'srcml conversion failed: {path} {p.stderr.decode("utf-8", errors="replace")}')
+                    result[key] = None
+            return result
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
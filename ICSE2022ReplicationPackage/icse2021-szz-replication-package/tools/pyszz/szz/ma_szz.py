@@ -6,6 +6,7 @@ from pydriller import RepositoryMining, ModificationType
 
 from szz.ag_szz import AGSZZ
 from szz.core.abstract_szz import ImpactedFile, DetectLineMoved
+from szz.core.repo_index import MetaChangeIndex, get_repo_index
 
 
 class MASZZ(AGSZZ):
@@ -28,10 +29,39 @@ class MASZZ(AGSZZ):
     def change_types_to_ignore(self, changes_to_ignore: List[ModificationType]):
         self.__changes_to_ignore = changes_to_ignore
 
+    @property
+    def meta_change_index(self) -> MetaChangeIndex:
+        """
+         Getter of the index of the merge commits, file mode changes, renames and copies of the repository, shared by
+         all the SZZ instances and persisted in the cache folder.
+
+         :returns MetaChangeIndex meta_change_index
+        """
+        return get_repo_index(MetaChangeIndex, self.repository_path, self.cache_dir)
+
     def _is_git_mode_change(self, git_show_output: List[str], current_file: str):
         return any(line.strip().startswith('mode change') and current_file in line for line in git_show_output)
 
     def get_meta_changes(self, commit_hash: str, current_file: str) -> Set[str]:
+        meta_changes = self.meta_change_index.get(commit_hash)
+        if meta_changes is None or any(t not in (ModificationType.RENAME, ModificationType.COPY) for t in self.change_types_to_ignore):
+            # commit not reachable from any ref, or change types not in the index
+            return self._mine_meta_changes(commit_hash, current_file)
+
+        if any(current_file in path for path in meta_changes.mode_changes):
+            log.info(f'exclude meta-change (file mode change): {current_file} {commit_hash}')
+            return {commit_hash}
+
+        # PyDriller diffs the commits with rename detection only, the copied files are added files: as before, the
+        # copies of the index are not meta-changes
+        if ModificationType.RENAME in self.change_types_to_ignore:
+            if any(current_file == old_path or current_file == new_path for old_path, new_path in meta_changes.renames):
+                log.info(f'exclude meta-change ({ModificationType.RENAME}): {current_file} {commit_hash}')
+                return {commit_hash}
+
+        return set()
+
+    def _mine_meta_changes(self, commit_hash: str, current_file: str) -> Set[str]:
         meta_changes = set()
         repo_mining = RepositoryMining(path_to_repo=self.repository_path, single=commit_hash).traverse_commits()
         for commit in repo_mining:
@@ -51,6 +81,18 @@ class MASZZ(AGSZZ):
         return meta_changes
 
     def get_merge_commits(self, commit_hash: str) -> Set[str]:
+        meta_changes = self.meta_change_index.get(commit_hash)
+        if meta_changes is None:
+            # commit not reachable from any ref
+            return self._mine_merge_commits(commit_hash)
+
+        if not meta_changes.merge:
+            return set()
+
+        log.info(f'merge commits count: 1')
+        return {commit_hash}
+
+    def _mine_merge_commits(self, commit_hash: str) -> Set[str]:
         merge = set()
         repo_mining = RepositoryMining(single=commit_hash, path_to_repo=self.repository_path).traverse_commits()
         for commit in repo_mining:
@@ -98,20 +140,23 @@ class MASZZ(AGSZZ):
         bic = set()
         for imp_file in impacted_files:
             commits_to_ignore_current_file = commits_to_ignore.copy()
+            annotations = dict()
+            blamed_counts = list()
 
             to_blame = True
             while to_blame:
                 log.info(f"excluding commits: {params['ignore_revs_list']}")
-                blame_data = self._ag_annotate(fix_commit_hash, [imp_file], **params)
+                blame_data, blamed_count = self._ag_annotate_incremental(fix_commit_hash, [imp_file], annotations, **params)
+                blamed_counts.append(blamed_count)
 
                 new_commits_to_ignore = set()
                 new_commits_to_ignore_current_file = set()
                 for bd in blame_data:
-                    if bd.commit.hexsha not in new_commits_to_ignore and bd.commit.hexsha not in new_commits_to_ignore_current_file:
-                        if bd.commit.hexsha not in commits_to_ignore_current_file:
-                            new_commits_to_ignore.update(self._exclude_commits_by_change_size(bd.commit.hexsha, max_change_size=max_change_size))
-                            new_commits_to_ignore.update(self.get_merge_commits(bd.commit.hexsha))
-                            new_commits_to_ignore_current_file.update(self.get_meta_changes(bd.commit.hexsha, bd.file_path))
+                    if bd.hexsha not in new_commits_to_ignore and bd.hexsha not in new_commits_to_ignore_current_file:
+                        if bd.hexsha not in commits_to_ignore_current_file:
+                            new_commits_to_ignore.update(self._exclude_commits_by_change_size(bd.hexsha, max_change_size=max_change_size))
+                            new_commits_to_ignore.update(self.get_merge_commits(bd.hexsha))
+                            new_commits_to_ignore_current_file.update(self.get_meta_changes(bd.hexsha, bd.file_path))
 
                 if len(new_commits_to_ignore) == 0 and len(new_commits_to_ignore_current_file) == 0:
                     to_blame = False
@@ -124,6 +169,8 @@ class MASZZ(AGSZZ):
                 commits_to_ignore_current_file.update(new_commits_to_ignore_current_file)
                 params['ignore_revs_list'] = list(commits_to_ignore_current_file)
 
-            bic.update(set([bd.commit for bd in blame_data if bd.commit.hexsha not in self._exclude_commits_by_change_size(bd.commit.hexsha, max_change_size)]))
+            log.info(f"blame iterations for {imp_file.file_path}: {len(blamed_counts)}, lines blamed per iteration: {blamed_counts}")
+
+            bic.update(set([bd.commit for bd in blame_data if not self._is_large_commit(bd.hexsha, max_change_size)]))
 
         return bic
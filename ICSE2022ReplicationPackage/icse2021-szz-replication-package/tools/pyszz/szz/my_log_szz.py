@@ -0,0 +1,155 @@
+import logging as log
+import traceback
+from typing import List, Optional, Set, Tuple
+
+from git import Commit
+
+from szz.core.abstract_szz import ImpactedFile
+from szz.core.diff_store import diff_store
+from szz.core.git_diff import FileDiff, iter_line_log
+from szz.core.line_matcher import LineCandidates, best_match, line_candidates_cache
+from szz.my_szz import MySZZ, TraceBudget
+
+
+class MyLogSZZ(MySZZ):
+    """
+    V-SZZ tracing the lines with 'git log -L' instead of one git blame per hop. The history of a line is streamed by
+    a single git process as long as the line git follows is the line V-SZZ maps to (the most similar deleted line,
+    with a similarity greater than 0.75); a new process is started from the parent commit when they differ. Java
+    files are traced by MySZZ, as their lines are mapped with ASTMapEval.
+
+    The lines modified by the fix commit are blamed as in MySZZ. Along the chains, comment lines end the chain as
+    in MySZZ, but the ignore revs file is not applied: git log -L has no equivalent.
+
+    Supported **kwargs:
+
+    * ignore_revs_file_path
+    * max_chain_depth
+    * max_seconds
+    * max_blame_calls (number of git log processes for the non-Java files)
+    * candidates: 'file' (default) to match a line against all the lines of the file deleted by the commit, as
+      MySZZ does, or 'hunk' to match it against the deleted lines of the range followed by git only, which needs
+      no other git call
+
+    """
+
+    def find_bic(self, fix_commit_hash: str, impacted_files: List['ImpactedFile'], **kwargs) -> Set[Commit]:
+        """
+        Find bug introducing commits candidates.
+
+        :param str fix_commit_hash: hash of fix commit to scan for buggy commits
+        :param List[ImpactedFile] impacted_files: list of impacted files in fix commit
+        :key ignore_revs_file_path (str): specify ignore revs file for git blame to ignore specific commits.
+        :key max_chain_depth (int): max number of steps traced per chain, None for no limit
+        :key max_seconds (float): max wall-clock time spent tracing the chains of the fix commit, None for no limit
+        :key max_blame_calls (int): max number of git blame and git log calls for the fix commit, None for no limit
+        :key candidates (str): 'file' or 'hunk', the deleted lines a line is matched against
+        :returns Set[Commit] a set of bug introducing commits candidates, in the format of MySZZ
+        """
+        java_files = [imp_file for imp_file in impacted_files if imp_file.file_path.endswith(".java")]
+        bug_introd_commits = super().find_bic(fix_commit_hash, java_files, **kwargs) if java_files else []
+
+        ignore_revs_file_path = kwargs.get('ignore_revs_file_path', None)
+        candidates_mode = kwargs.get('candidates', 'file')
+        budget = TraceBudget(kwargs.get('max_chain_depth', None), kwargs.get('max_seconds', None),
+                             kwargs.get('max_blame_calls', None))
+
+        for imp_file in impacted_files:
+            if imp_file.file_path.endswith(".java"):
+                continue
+
+            budget.blame_calls += 1
+            try:
+                blame_data = self._blame_lines(
+                    rev='{commit_id}^'.format(commit_id=fix_commit_hash),
+                    file_path=imp_file.file_path,
+                    modified_lines=imp_file.modified_lines,
+                    ignore_revs_file_path=ignore_revs_file_path,
+                    ignore_whitespaces=False,
+                    skip_comments=True
+                )
+            except:
+                print(traceback.format_exc())
+                continue
+
+            for entry in blame_data.values():
+                try:
+                    steps, truncated = self._trace_line(entry, budget, candidates_mode)
+                except:
+                    print(traceback.format_exc())
+                    continue
+
+                bic = {'line_num': entry.line_num, 'line_str': entry.line_str, 'file_path': entry.file_path, 'previous_commits': steps}
+                if truncated is not None:
+                    bic['truncated'] = truncated
+                bug_introd_commits.append(bic)
+
+        return bug_introd_commits
+
+    def _trace_line(self, entry, budget: TraceBudget, candidates_mode: str) -> Tuple[List[tuple], Optional[str]]:
+        """
+        Trace a blamed line back to the commit introducing it.
+
+        :param BlameData entry: blamed line the chain starts from
+        :param TraceBudget budget: budget of the fix commit
+        :param str candidates_mode: 'file' or 'hunk', the deleted lines a line is matched against
+        :returns Tuple[List[tuple], str] steps (commit, line number, line) of the chain, and the name of the budget
+            that stopped it, None if the chain is complete
+        """
+        steps = list()
+        # the first stream starts at the blamed commit itself, the next ones at the parent of the last step
+        start = (entry.hexsha, entry.file_path, entry.line_num)
+        while start is not None:
+            rev, file_path, line_num = start
+            start = None
+
+            exceeded = budget.exceeded(len(steps))
+            if exceeded is not None:
+                return steps, exceeded
+            budget.blame_calls += 1
+
+            stream = iter_line_log(self.repository_path, rev, file_path, line_num)
+            try:
+                for commit_hash, file_diffs in stream:
+                    if not file_diffs or not file_diffs[0].added_lines:
+                        break
+                    file_diff = file_diffs[0]
+                    # git follows a single line, which the commit modified
+                    step_line_num, step_line_str = file_diff.added_lines[0]
+                    # stripped as the line_str of BlameData, so that both engines output the same previous commits
+                    step_line_str = step_line_str.strip()
+
+                    if steps and self._is_comment_line(commit_hash, file_diff.new_path, step_line_num):
+                        log.info(f"skip comment line ({step_line_num}): {step_line_str}")
+                        break
+                    steps.append((commit_hash, step_line_num, step_line_str))
+
+                    mapped_line_num = best_match(step_line_str, step_line_num,
+                                                 self._line_candidates(commit_hash, file_diff, candidates_mode))
+                    if mapped_line_num == -1:
+                        break
+
+                    if [deleted[0] for deleted in file_diff.deleted_lines] == [mapped_line_num]:
+                        # git goes on with the same line as V-SZZ, keep reading its history
+                        exceeded = budget.exceeded(len(steps))
+                        if exceeded is not None:
+                            return steps, exceeded
+                        continue
+
+                    start = ('{commit_id}^'.format(commit_id=commit_hash), file_diff.old_path, mapped_line_num)
+                    break
+            finally:
+                stream.close()
+
+        return steps, None
+
+    def _line_candidates(self, commit_hash: str, file_diff: FileDiff, candidates_mode: str) -> Optional[LineCandidates]:
+        if file_diff.old_path is None:
+            # the commit adds the file
+            return None
+        if candidates_mode == 'hunk':
+            return LineCandidates(file_diff.deleted_lines) if file_diff.deleted_lines else None
+
+        # the diff store indexes renamed files by their old path
+        key = (self.repository_path, commit_hash, file_diff.old_path)
+        return line_candidates_cache.get(key, lambda: diff_store.get_deleted_lines(*key))
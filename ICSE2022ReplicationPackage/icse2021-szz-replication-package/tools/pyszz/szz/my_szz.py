@@ -2,27 +2,21 @@ import os
 import sys
 import logging as log
 import traceback
-from typing import List, Set
-import subprocess
-import json
+from time import time as ts
+from typing import Dict, List, Optional, Set, Tuple
 
 from git import Commit
 
 from szz.core.abstract_szz import AbstractSZZ, ImpactedFile
+from szz.core.ast_map_client import DEFAULT_POOL_SIZE, ASTMapDaemonPool, get_daemon_pool
+from szz.core.ast_map_prefetch import ASTMapPrefetcher
+from szz.core.ast_map_store import ASTMapStore, get_ast_map_store
+from szz.core.cache import BlameCache, SQLiteCache
+from szz.core.chain_memo import ChainMemo
+from szz.core.diff_store import diff_store
+from szz.core.line_matcher import best_match, line_candidates_cache
+from szz.core.repo_index import RenameIndex, get_repo_index
 
-from pydriller import ModificationType, GitRepository as PyDrillerGitRepo
-import Levenshtein
-
-
-def remove_whitespace(line_str):
-    return ''.join(line_str.strip().split())
-
-def compute_line_ratio(line_str1, line_str2):
-    l1 = remove_whitespace(line_str1)
-    l2 = remove_whitespace(line_str2)
-    return Levenshtein.ratio(l1, l2)
-
-MAXSIZE = sys.maxsize
 
 class MySZZ(AbstractSZZ):
     """
@@ -31,12 +25,96 @@ class MySZZ(AbstractSZZ):
     Supported **kwargs:
 
     * ignore_revs_file_path
+    * max_chain_depth
+    * max_seconds
+    * max_blame_calls
 
     """
 
-    def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None, use_temp_dir: bool = True, ast_map_path = None):
+    def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None, use_temp_dir: bool = True, ast_map_path = None,
+                 ast_map_workers: int = DEFAULT_POOL_SIZE):
         super().__init__(repo_full_name, repo_url, repos_dir, use_temp_dir)
         self.ast_map_path = ast_map_path
+        self.ast_map_workers = ast_map_workers
+        self._ast_map_pool = None
+        self._ast_map_store = None
+        self._ast_map_prefetcher = None
+        self._chain_memo = ChainMemo(SQLiteCache(os.path.join(self.cache_dir, 'cache.db'), 'vszz_chains'))
+
+    def __del__(self):
+        if getattr(self, '_chain_memo', None) is not None:
+            log.info(f"chain memo stats: {self._chain_memo.stats()}, diff store stats: {diff_store.stats()}")
+            self._chain_memo.close()
+        if getattr(self, '_ast_map_pool', None) is not None:
+            log.info(f"ASTMapEval stats: {self._ast_map_pool.stats()}")
+        if getattr(self, '_ast_map_prefetcher', None) is not None:
+            log.info(f"ASTMapEval prefetch stats: {self._ast_map_prefetcher.stats()}")
+        if getattr(self, '_ast_map_store', None) is not None:
+            log.info(f"ASTMapEval store stats: {self._ast_map_store.stats()}")
+        super().__del__()
+
+    @property
+    def ast_map_pool(self) -> ASTMapDaemonPool:
+        """
+         Getter of the pool of ASTMapEval daemons mapping the lines of Java files, shared by all the SZZ instances
+         using the same ASTMapEval directory.
+
+         :returns ASTMapDaemonPool ast_map_pool
+        """
+        if self._ast_map_pool is None:
+            self._ast_map_pool = get_daemon_pool(self.ast_map_path, self.ast_map_workers)
+        return self._ast_map_pool
+
+    @property
+    def ast_map_store(self) -> ASTMapStore:
+        """
+         Getter of the store of the ASTMapEval results, shared by all the projects using the same ASTMapEval
+         directory. The JSON mapping database of the project written by the previous versions is imported once.
+
+         :returns ASTMapStore ast_map_store
+        """
+        if self._ast_map_store is None:
+            ast_map_temp = os.path.join(self.ast_map_path, 'temp')
+            self._ast_map_store = get_ast_map_store(os.path.join(ast_map_temp, 'ast_map.db'))
+            legacy_db_file = os.path.join(ast_map_temp, "{project}.json".format(project=self.repo_full_name))
+            if os.path.exists(legacy_db_file):
+                self._ast_map_store.import_json_db(self.repo_full_name, legacy_db_file)
+        return self._ast_map_store
+
+    @property
+    def ast_map_prefetcher(self) -> ASTMapPrefetcher:
+        """
+         Getter of the prefetcher mapping the Java files of the next chain hops ahead of time.
+
+         :returns ASTMapPrefetcher ast_map_prefetcher
+        """
+        if self._ast_map_prefetcher is None:
+            self._ast_map_prefetcher = ASTMapPrefetcher(self.ast_map_pool, self.ast_map_store, self.repo_full_name)
+        return self._ast_map_prefetcher
+
+    @property
+    def rename_index(self) -> RenameIndex:
+        """
+         Getter of the index of the files renamed by each commit of the repository, shared by all the SZZ instances
+         and persisted in the cache folder.
+
+         :returns RenameIndex rename_index
+        """
+        return get_repo_index(RenameIndex, self.repository_path, self.cache_dir)
+
+    @property
+    def chain_memo(self) -> ChainMemo:
+        """
+         Getter of the memo of the traced blame chains, shared by all the fix commits of the project and persisted
+         across runs.
+
+         :returns ChainMemo chain_memo
+        """
+        return self._chain_memo
+
+    @chain_memo.setter
+    def chain_memo(self, chain_memo: ChainMemo):
+        self._chain_memo = chain_memo
 
     def find_bic(self, fix_commit_hash: str, impacted_files: List['ImpactedFile'], **kwargs) -> Set[Commit]:
         """
@@ -45,19 +123,28 @@ class MySZZ(AbstractSZZ):
         :param str fix_commit_hash: hash of fix commit to scan for buggy commits
         :param List[ImpactedFile] impacted_files: list of impacted files in fix commit
         :key ignore_revs_file_path (str): specify ignore revs file for git blame to ignore specific commits.
-        :returns Set[Commit] a set of bug introducing commits candidates, represented by Commit object
+        :key max_chain_depth (int): max number of steps traced per chain, None for no limit
+        :key max_seconds (float): max wall-clock time spent tracing the chains of the fix commit, None for no limit
+        :key max_blame_calls (int): max number of git blame calls for the fix commit, None for no limit
+        :returns Set[Commit] a set of bug introducing commits candidates, represented by Commit object. The chains
+            stopped by a budget keep their partial steps and have a 'truncated' key naming the budget
         """
 
         log.info(f"find_bic() kwargs: {kwargs}")
 
         ignore_revs_file_path = kwargs.get('ignore_revs_file_path', None)
+        budget = TraceBudget(kwargs.get('max_chain_depth', None), kwargs.get('max_seconds', None),
+                             kwargs.get('max_blame_calls', None))
+        memo_context = BlameCache.file_digest(ignore_revs_file_path) if ignore_revs_file_path else None
         # self._set_working_tree_to_commit(fix_commit_hash)
 
-        bug_introd_commits = []
+        # blame of the modified lines in the parent of the fix commit, each blamed line starts a chain
+        chains = list()
         for imp_file in impacted_files:
             # print('impacted file', imp_file.file_path)
+            budget.blame_calls += 1
             try:
-                blame_data = self._blame(
+                blame_data = self._blame_lines(
                     # rev='HEAD^',
                     rev='{commit_id}^'.format(commit_id=fix_commit_hash),
                     file_path=imp_file.file_path,
@@ -66,144 +153,238 @@ class MySZZ(AbstractSZZ):
                     ignore_whitespaces=False,
                     skip_comments=True
                 )
-
-                for entry in blame_data:
-                    print(entry.commit, entry.line_num, entry.line_str)
-                    previous_commits = []
-                    
-                    blame_result = entry
-                    while True:
-                        if imp_file.file_path.endswith(".java"):
-                            mapped_line_num, change_type = self.map_modified_line_java(blame_result, imp_file.file_path)
-                            previous_commits.append((blame_result.commit.hexsha, blame_result.line_num, blame_result.line_str, change_type))
-                        else:
-                            mapped_line_num = self.map_modified_line(blame_result, imp_file.file_path)
-                            previous_commits.append((blame_result.commit.hexsha, blame_result.line_num, blame_result.line_str))
-                        
-                        if mapped_line_num == -1:
-                            break
-                        
-                        
-                        blame_data2 = self._blame(
-                                        rev='{commit_id}^'.format(commit_id=blame_result.commit.hexsha),
-                                        file_path=imp_file.file_path,
-                                        modified_lines=[mapped_line_num],
-                                        ignore_revs_file_path=ignore_revs_file_path,
-                                        ignore_whitespaces=False,
-                                        skip_comments=True
-                                    )
-                        blame_result = list(blame_data2)[0]
-                        # print(blame_result.commit.hexsha, blame_result.line_num)
-                        # print(mapped_line_num, blame_result.commit.hexsha, blame_result.line_num, blame_result.line_str)
-                        # previous_commits.append((blame_result.commit, blame_result.line_num, blame_result.line_str))
-
-                    # bug_introd_commits[entry.line_num] = {'line_str': entry.line_str, 'file_path': entry.file_path, 'previous_commits': previous_commits}
-                    bug_introd_commits.append({'line_num':entry.line_num, 'line_str': entry.line_str, 'file_path': entry.file_path, 'previous_commits': previous_commits})
-                    # bug_introd_commits.append(previous_commits)
             except:
                 print(traceback.format_exc())
+                continue
+
+            for entry in blame_data.values():
+                print(entry.commit, entry.line_num, entry.line_str)
+                chains.append(BlameChain(entry, imp_file.file_path))
+            self._prefetch_mappings(blame_data.values(), imp_file.file_path)
+
+        # the chains are traced breadth-first: at each depth, the hops of all the chains blaming the same
+        # file at the same revision are blamed together
+        active_chains = chains
+        depth = 0
+        while active_chains:
+            exceeded = budget.exceeded(depth)
+            if exceeded is not None:
+                log.warning(f'{fix_commit_hash}: {exceeded} exceeded at depth {depth}, {len(active_chains)} chains truncated')
+                for chain in active_chains:
+                    chain.truncated = exceeded
+                break
+
+            hops = self._map_chains(active_chains, memo_context)
+            active_chains = self._blame_hops(hops, ignore_revs_file_path, budget)
+            depth += 1
+        log.info(f'traced {len(chains)} chains, max depth {depth}')
+
+        bug_introd_commits = []
+        for chain in chains:
+            if chain.failed:
+                continue
+
+            # only completed chains are memoized
+            if self._chain_memo is not None and chain.truncated is None:
+                self._chain_memo.put_chain(chain.keys, chain.steps[:len(chain.keys)], chain.known_key)
+
+            entry = chain.entry
+            # bug_introd_commits[entry.line_num] = {'line_str': entry.line_str, 'file_path': entry.file_path, 'previous_commits': previous_commits}
+            bic = {'line_num':entry.line_num, 'line_str': entry.line_str, 'file_path': entry.file_path, 'previous_commits': chain.steps}
+            if chain.truncated is not None:
+                bic['truncated'] = chain.truncated
+            bug_introd_commits.append(bic)
 
         return bug_introd_commits
 
-    def map_modified_line_java(self, blame_entry, blame_file_path):
-        mapping_cmd = "java -jar ASTMapEval.jar -p {project} -c {commit_id} -o {output} -f {file_path}"
-        ast_map_temp = os.path.join(self.ast_map_path, 'temp')
+    def _map_chains(self, chains: List['BlameChain'], memo_context: str) -> Dict[Tuple[str, str], Dict[int, List['BlameChain']]]:
+        """
+        Map the current line of each chain to the line it replaced in the parent of its blame commit, adding the
+        current step to the chain. Chains reaching an already traced node are completed with its chain.
+
+        :param List[BlameChain] chains: chains to advance
+        :param str memo_context: context of the chain memo keys
+        :returns Dict hops to blame, the chains waiting for each line of each (revision, file)
+        """
+        hops = dict()
+        for chain in chains:
+            blame_result = chain.current
+
+            # stop at the first node already traced, its chain is the tail of this one
+            node_key = ChainMemo.node_key(blame_result.hexsha, chain.traced_path, blame_result.file_path,
+                                          blame_result.line_num, memo_context)
+            known_chain = self._chain_memo.get_chain(node_key) if self._chain_memo is not None else None
+            if known_chain is not None:
+                chain.steps.extend(known_chain)
+                chain.known_key = node_key
+                continue
+            chain.keys.append(node_key)
+
+            try:
+                # the chain follows the blamed file, through the renames of the blame commits
+                parent_path = self.rename_index.old_path(blame_result.hexsha, blame_result.file_path)
+                if chain.traced_path.endswith(".java"):
+                    mapped_line_num, change_type = self.map_modified_line_java(blame_result, blame_result.file_path)
+                    chain.steps.append((blame_result.hexsha, blame_result.line_num, blame_result.line_str, change_type))
+                else:
+                    mapped_line_num = self.map_modified_line(blame_result, parent_path)
+                    chain.steps.append((blame_result.hexsha, blame_result.line_num, blame_result.line_str))
+            except:
+                print(traceback.format_exc())
+                chain.failed = True
+                continue
+
+            if mapped_line_num == -1:
+                continue
+
+            rev = '{commit_id}^'.format(commit_id=blame_result.hexsha)
+            hops.setdefault((rev, parent_path), dict()).setdefault(mapped_line_num, list()).append(chain)
+
+        return hops
+
+    def _blame_hops(self, hops: Dict[Tuple[str, str], Dict[int, List['BlameChain']]], ignore_revs_file_path: str,
+                    budget: 'TraceBudget' = None) -> List['BlameChain']:
+        """
+        Blame the mapped lines of the chains, with a single blame for all the lines of the same (revision, file).
+
+        :param Dict hops: the chains waiting for each line of each (revision, file), as returned by _map_chains()
+        :param str ignore_revs_file_path: ignore revs file for git blame
+        :param TraceBudget budget: budget of the fix commit, the chains of the hops left once the time or the blame
+            calls are exhausted are truncated
+        :returns List[BlameChain] the chains that moved to a new blamed line
+        """
+        next_chains = list()
+        for (rev, file_path), chains_by_line in hops.items():
+            exceeded = budget.exceeded() if budget is not None else None
+            if exceeded is not None:
+                for line_chains in chains_by_line.values():
+                    for chain in line_chains:
+                        chain.truncated = exceeded
+                continue
+
+            if budget is not None:
+                budget.blame_calls += 1
+            try:
+                blame_data = self._blame_lines(
+                    rev=rev,
+                    file_path=file_path,
+                    modified_lines=sorted(chains_by_line),
+                    ignore_revs_file_path=ignore_revs_file_path,
+                    ignore_whitespaces=False,
+                    skip_comments=True
+                )
+            except:
+                print(traceback.format_exc())
+                for line_chains in chains_by_line.values():
+                    for chain in line_chains:
+                        chain.failed = True
+                continue
+
+            for mapped_line_num, line_chains in chains_by_line.items():
+                blame_result = blame_data.get(mapped_line_num)
+                if blame_result is None:
+                    # the mapped line is a comment, the chains end here
+                    continue
+                # print(blame_result.hexsha, blame_result.line_num)
+                # print(mapped_line_num, blame_result.hexsha, blame_result.line_num, blame_result.line_str)
+                for chain in line_chains:
+                    chain.current = blame_result
+                    next_chains.append(chain)
+            self._prefetch_mappings([blame_data[line_num] for line_num in chains_by_line if line_num in blame_data], file_path)
+
+        return next_chains
+
+    def _prefetch_mappings(self, blame_results, traced_path: str):
+        """
+        Submit the (commit, file) pairs the next mapping step of Java chains needs to ASTMapEval, while the other
+        files are blamed.
 
-        commit_id = blame_entry.commit.hexsha
+        :param blame_results: the blamed lines the chains moved to
+        :param str traced_path: path of the traced file
+        """
+        if not traced_path.endswith(".java") or self.ast_map_path is None:
+            return
+        pairs = ((blame_result.hexsha, blame_result.file_path.replace('\\', '/')) for blame_result in blame_results)
+        for commit_id, file_path in dict.fromkeys(pairs):
+            self.ast_map_prefetcher.prefetch(commit_id, file_path)
+
+    def map_modified_line_java(self, blame_entry, blame_file_path):
+        commit_id = blame_entry.hexsha
         file_path = blame_file_path.replace('\\', '/')
-        
         line_num = blame_entry.line_num
 
-        mapping_db = None
-        mapping_db_file = os.path.join(ast_map_temp, "{project}.json".format(project=self.repo_full_name))
-        if os.path.exists(mapping_db_file):
-            mapping_db = json.load(open(mapping_db_file))
-            if commit_id not in mapping_db:
-                subprocess.check_output(mapping_cmd.format(project=self.repo_full_name, commit_id=commit_id, output=os.path.join(ast_map_temp, "tmp.json"), file_path=file_path), cwd=self.ast_map_path, shell=True).decode('utf-8', errors='ignore')
-
-                mapping_results = json.load(open(os.path.join(ast_map_temp, "tmp.json")))
-                mapping_db[commit_id] = {}
-                mapping_db[commit_id][file_path] = mapping_results
-            elif file_path not in mapping_db[commit_id]:
-                subprocess.check_output(mapping_cmd.format(project=self.repo_full_name, commit_id=commit_id, output=os.path.join(ast_map_temp, "tmp.json"), file_path=file_path), cwd=self.ast_map_path, shell=True).decode('utf-8', errors='ignore')
-
-                mapping_results = json.load(open(os.path.join(ast_map_temp, "tmp.json")))
-                mapping_db[commit_id][file_path] = mapping_results
-            else:
-                mapping_results = mapping_db[commit_id][file_path]
-        else:
-            subprocess.check_output(mapping_cmd.format(project=self.repo_full_name, commit_id=commit_id, output=os.path.join(ast_map_temp, "tmp.json"), file_path=file_path), cwd=self.ast_map_path, shell=True).decode('utf-8', errors='ignore')
-
-            mapping_results = json.load(open(os.path.join(ast_map_temp, "tmp.json")))
-            mapping_db = {}
-            mapping_db[commit_id] = {}
-            mapping_db[commit_id][file_path] = mapping_results
-
-        with open(mapping_db_file, 'w') as fout:
-            json.dump(mapping_db, fout, indent=4)
-
-        target_file = None
-        target_stmt = None
-        for result in mapping_results:
-            if file_path == result['src']:
-                target_file = result['dst']
-                      
-                for stmt in result['stmt']:
-                    if 'dstStmtStartLine' in stmt and stmt['dstStmtStartLine'] == int(line_num):
-                        target_stmt = stmt
-                        break
-                
-                if target_stmt is not None:
-                    break
-        
+        self.ast_map_prefetcher.wait(commit_id, file_path)
+        if not self.ast_map_store.contains(self.repo_full_name, commit_id, file_path):
+            mapping_results = self.ast_map_pool.map(self.repo_full_name, commit_id, file_path)
+            self.ast_map_store.put(self.repo_full_name, commit_id, file_path, mapping_results)
+
+        target_stmt = self.ast_map_store.get_statement(self.repo_full_name, commit_id, file_path, int(line_num))
         if target_stmt is None:
             # "New File"
             return -1, "New File"
-        
+
+        src_line, change_type = target_stmt
         # results.append((buggy_commit, buggy_file, buggy_line, target_stmt['stmtChangeType']))
-        if target_stmt['stmtChangeType'] == "Insert":
-            return -1, target_stmt['stmtChangeType']
-        
-        return target_stmt['srcStmtStartLine'], target_stmt['stmtChangeType']
-       
+        if change_type == "Insert":
+            return -1, change_type
+        if src_line is None:
+            raise KeyError(f'no srcStmtStartLine for line {line_num} of {file_path} in {commit_id}')
+
+        return src_line, change_type
 
     def map_modified_line(self, blame_entry, blame_file_path):
-        #TODO: rename type 
-        blame_commit = PyDrillerGitRepo(self.repository_path).get_commit(blame_entry.commit.hexsha)
-        # print('get blame commit', blame_commit, blame_entry.commit.hexsha)
+        # the deleted lines of each (commit, file) are parsed and normalized once, and shared by all the chains.
+        # blame_file_path is the path in the parent of the blame commit, the key of renamed files in the diff store
+        key = (self.repository_path, blame_entry.hexsha, blame_file_path)
+        candidates = line_candidates_cache.get(key, lambda: diff_store.get_deleted_lines(*key))
+        return best_match(blame_entry.line_str, blame_entry.line_num, candidates)
 
-        for mod in blame_commit.modifications:
-            file_path = mod.new_path
-            if mod.change_type == ModificationType.DELETE or mod.change_type == ModificationType.RENAME:
-                file_path = mod.old_path
 
-            if file_path != blame_file_path:
-                continue
+class BlameChain:
+    """ State of the tracing of a blamed line through the history """
+    __slots__ = ('entry', 'traced_path', 'current', 'steps', 'keys', 'known_key', 'failed', 'truncated')
 
-            if not mod.old_path:
-                # "newly added"
-                return -1
-
-            lines_added = [added for added in mod.diff_parsed['added']]
-            lines_deleted = [deleted for deleted in mod.diff_parsed['deleted']]
-
-            if len(lines_deleted) == 0:
-                return -1
-            
-            print('line added/deleted', len(lines_added), len(lines_deleted))
-
-            if blame_entry.line_str:
-                sorted_lines_deleted = [(line[0], line[1], 
-                                            compute_line_ratio(blame_entry.line_str, line[1]), 
-                                            abs(blame_entry.line_num - line[0])) 
-                                        for line in lines_deleted]
-                sorted_lines_deleted = sorted(sorted_lines_deleted, key=lambda x : (x[2], MAXSIZE-x[3]), reverse=True)
-                # print(sorted_lines_deleted)
-                
-                # print(sorted_lines_deleted)
-                if sorted_lines_deleted[0][2] > 0.75:
-                    return sorted_lines_deleted[0][0]
-                                             
-        return -1        
-                
-                    
\ No newline at end of file
+    def __init__(self, entry, traced_path: str):
+        """
+        :param BlameData entry: blamed line the chain starts from
+        :param str traced_path: path of the traced file
+        """
+        self.entry = entry
+        self.traced_path = traced_path
+        self.current = entry
+        self.steps = list()
+        self.keys = list()
+        self.known_key = None
+        self.failed = False
+        # name of the budget that stopped the chain, None if the chain is complete
+        self.truncated = None
+
+
+class TraceBudget:
+    """ Limits of the tracing of the chains of a fix commit, None for no limit """
+    __slots__ = ('max_chain_depth', 'max_seconds', 'max_blame_calls', 'start', 'blame_calls')
+
+    def __init__(self, max_chain_depth: int = None, max_seconds: float = None, max_blame_calls: int = None):
+        """
+        :param int max_chain_depth: max number of steps traced per chain
+        :param float max_seconds: max wall-clock time of the tracing, from the creation of the budget
+        :param int max_blame_calls: max number of git blame calls
+        """
+        self.max_chain_depth = max_chain_depth
+        self.max_seconds = max_seconds
+        self.max_blame_calls = max_blame_calls
+        self.start = ts()
+        self.blame_calls = 0
+
+    def exceeded(self, depth: int = None) -> Optional[str]:
+        """
+        :param int depth: number of steps already traced by the active chains, None to skip the depth check
+        :returns str name of the first exhausted budget, None if the tracing can go on
+        """
+        if self.max_chain_depth is not None and depth is not None and depth >= self.max_chain_depth:
+            return 'max_chain_depth'
+        if self.max_seconds is not None and ts() - self.start > self.max_seconds:
+            return 'max_seconds'
+        if self.max_blame_calls is not None and self.blame_calls >= self.max_blame_calls:
+            return 'max_blame_calls'
+        return None
@@ -1,12 +1,12 @@
 import traceback
-import tempfile
-import json
 import os
+import threading
 import logging as log
-import subprocess
 
-from typing import List, Set
+from typing import Dict, Iterator, List, Set, Tuple
 from git import Commit
+from szz.core.refactoring_store import RefactoringLocations, RefactoringStore, get_refactoring_store
+from szz.core.refminer_client import DEFAULT_POOL_SIZE, RefMinerPool, get_refminer_pool
 from szz.ma_szz import MASZZ
 from options import Options
 
@@ -19,64 +19,89 @@ class RASZZ(MASZZ):
 
     """
 
-    def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None, use_temp_dir: bool = True):
+    # _blame() drops the lines of refactorings and blames them again at older revisions
+    supports_incremental_reblame = False
+
+    def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None, use_temp_dir: bool = True,
+                 refminer_workers: int = DEFAULT_POOL_SIZE):
         super().__init__(repo_full_name, repo_url, repos_dir, use_temp_dir)
-        
-    def _extract_refactorings_unix(self, commits):
-        PATH_TO_REFMINER = os.path.join(Options.PYSZZ_HOME, 'tools/RefactoringMiner-2.0/bin/RefactoringMiner')
-       
-        refactorings = dict()
-        for commit in commits:
-            if not commit in refactorings:
-                with tempfile.NamedTemporaryFile(mode='r+') as tmpfile:
-                    log.info(f'Running RefMiner on {commit}')
-                    os.system(f'"{PATH_TO_REFMINER}" -c "{self._repository_path}" {commit} > {tmpfile.name}')
-                 
-                    refactorings[commit] = json.loads(tmpfile.read())
-                    
-        return refactorings
-
-
-
-    def _extract_refactorings(self, commits):
-        PATH_TO_REFMINER = os.path.join(Options.PYSZZ_HOME, 'tools/RefactoringMiner-2.0/bin/RefactoringMiner.bat')
-
-        refactorings = dict()
-        for commit in commits:
-            if not commit in refactorings:
-                # tmpfile_path = "F:/Vulnerability/SZZ/tmp/ra_tmp.json"
-        
-                # with open(tmpfile_path, 'w') as tmpfile: 
-                log.info(f'Running RefMiner on {commit}')
-                # print(f'Running RefMiner on {commit}')
-                raw_out = subprocess.check_output(f'"{PATH_TO_REFMINER}" -c "{self._repository_path}" {commit}')
-
-                # print(raw_out)
-                # clean_str = '\n'.join([line for line in raw_out.split('\n') if not line.startswith("log4j:")])
-                refactorings[commit] =json.loads(raw_out)
-                       
-
-        return refactorings
-    
+        self.refminer_workers = refminer_workers
+
+    @property
+    def refactoring_store(self) -> RefactoringStore:
+        """
+         Getter of the persistent store of the refactorings detected by RefactoringMiner in the commits of the
+         repository, shared by all the SZZ instances and processes using the same cache folder.
+
+         :returns RefactoringStore refactoring_store
+        """
+        return get_refactoring_store(os.path.join(self.cache_dir, 'refactorings.db'))
+
+    @property
+    def refminer_pool(self) -> RefMinerPool:
+        """
+         Getter of the pool of RefactoringMiner JVMs, shared by all the SZZ instances of the process.
+
+         :returns RefMinerPool refminer_pool
+        """
+        return get_refminer_pool(os.path.join(Options.PYSZZ_HOME, 'tools/RefactoringMiner-2.0'), self.refminer_workers)
+
+    def _extract_refactorings(self, commits, prefetch: bool = False) -> Dict[str, RefactoringLocations]:
+        """
+        Get the refactorings of the given commits. The commits not analyzed yet are submitted together to the
+        RefactoringMiner pool, and stored as each analysis completes.
+
+        :param Iterable[str] commits: hashes of the commits
+        :param bool prefetch: analyze the commits after the commits needed right away by the other threads
+        :returns Dict[str, RefactoringLocations] refactorings of each commit
+        """
+        submit = lambda commit: self.refminer_pool.submit(self._repository_path, commit, prefetch=prefetch)
+        return dict(self.refactoring_store.iter_extract(commits, submit))
+
     def get_impacted_files(self, fix_commit_hash: str,
                            file_ext_to_parse: List[str] = None,
                            only_deleted_lines: bool = True) -> List['ImpactedFile']:
-        impacted_files = set(super().get_impacted_files(fix_commit_hash, file_ext_to_parse, only_deleted_lines))
-        
-        fix_refactorings = self._extract_refactorings([fix_commit_hash])
+        impacted_files = super().get_impacted_files(fix_commit_hash, file_ext_to_parse, only_deleted_lines)
+        return self._filter_refactored_lines(fix_commit_hash, impacted_files)
+
+    def get_impacted_files_bulk(self, fix_commit_hashes: List[str],
+                                file_ext_to_parse: List[str] = None,
+                                only_deleted_lines: bool = True) -> Iterator[Tuple[str, List['ImpactedFile']]]:
+        fix_commit_hashes = list(fix_commit_hashes)
+        # the fix commits are analyzed by RefactoringMiner in the background, while their impacted files are computed
+        threading.Thread(target=self._prefetch_refactorings, args=(fix_commit_hashes,), daemon=True).start()
+        for fix_commit_hash, impacted_files in super().get_impacted_files_bulk(fix_commit_hashes, file_ext_to_parse, only_deleted_lines):
+            yield fix_commit_hash, self._filter_refactored_lines(fix_commit_hash, impacted_files)
+
+    def _prefetch_refactorings(self, commits: List[str]):
+        # a window of one commit per daemon: the queue of the pool never holds more prefetched commits than it can
+        # run at once, and the commits claimed by the prefetch are the ones being analyzed
+        window = self.refminer_pool.size
+        for i in range(0, len(commits), window):
+            try:
+                self._extract_refactorings(commits[i:i + window], prefetch=True)
+            except RuntimeError as e:
+                # the pool is closed, the process is exiting
+                log.warning(f'RefactoringMiner prefetch stopped: {e}')
+                return
+            except Exception as e:
+                # the commits not analyzed yet are analyzed again when their refactorings are needed
+                log.warning(f'RefactoringMiner prefetch failed: {e}')
+
+    def _filter_refactored_lines(self, fix_commit_hash: str, impacted_files: List['ImpactedFile']) -> List['ImpactedFile']:
+        """ Remove from the impacted files the lines modified by a refactoring of the fix commit """
+        impacted_files = set(impacted_files)
         
-        for refactoring in fix_refactorings[fix_commit_hash]['commits'][0]['refactorings']:
-            for location in refactoring['rightSideLocations']:
-                file_path = location['filePath']
-                from_line = location['startLine']
-                to_line   = location['endLine']
-                for f in impacted_files:
-                    lines_to_remove = set()
-                    for modified_line in f.modified_lines:
-                        if file_path == f.file_path and modified_line >= from_line and modified_line <= to_line:
-                            log.info(f'Ignoring {f.file_path} line {modified_line} (refactoring {refactoring["type"]})')
-                            lines_to_remove.add(modified_line)
-                    f.modified_lines = [line for line in f.modified_lines if not line in lines_to_remove]
+        fix_refactorings = self._extract_refactorings([fix_commit_hash])[fix_commit_hash]
+
+        for f in impacted_files:
+            lines_to_remove = set()
+            for modified_line in f.modified_lines:
+                refactoring_type = fix_refactorings.find(f.file_path, modified_line)
+                if refactoring_type is not None:
+                    log.info(f'Ignoring {f.file_path} line {modified_line} (refactoring {refactoring_type})')
+                    lines_to_remove.add(modified_line)
+            f.modified_lines = [line for line in f.modified_lines if not line in lines_to_remove]
         
         impacted_files = [f for f in impacted_files if len(f.modified_lines) > 0]
         return impacted_files
@@ -106,30 +131,23 @@ class RASZZ(MASZZ):
             detect_move_from_other_files
         )
         
-        commits = set([blame.commit.hexsha for blame in candidate_blame_data])
+        commits = set([blame.hexsha for blame in candidate_blame_data])
         blame_refactorings = self._extract_refactorings(commits)
         
         to_reblame = dict()
         
         result_blame_data = set()
         for blame in candidate_blame_data:
-            can_add = True
-            for refactoring in blame_refactorings[blame.commit.hexsha]['commits'][0]['refactorings']:
-                for location in refactoring['rightSideLocations']:
-                    file_path = location['filePath']
-                    from_line = location['startLine']
-                    to_line   = location['endLine']
-                    
-                    if blame.file_path == file_path and blame.line_num >= from_line and blame.line_num <= to_line:
-                        log.info(f'Ignoring {blame.file_path} line {blame.line_num} (refactoring {refactoring["type"]})')
-                        if not (blame.commit.hexsha + "@" + blame.file_path) in to_reblame:
-                            to_reblame[blame.commit.hexsha + "@" + blame.file_path] = ReblameCandidate(blame.commit.hexsha, blame.file_path, [blame.line_num])
-                        else:
-                            to_reblame[blame.commit.hexsha + "@" + blame.file_path].modified_lines.append(blame.line_num)
-                        can_add = False
-                    
-            if can_add:
+            refactoring_type = blame_refactorings[blame.hexsha].find(blame.file_path, blame.line_num)
+            if refactoring_type is None:
                 result_blame_data.add(blame)
+                continue
+
+            log.info(f'Ignoring {blame.file_path} line {blame.line_num} (refactoring {refactoring_type})')
+            if not (blame.hexsha + "@" + blame.file_path) in to_reblame:
+                to_reblame[blame.hexsha + "@" + blame.file_path] = ReblameCandidate(blame.hexsha, blame.file_path, [blame.line_num])
+            else:
+                to_reblame[blame.hexsha + "@" + blame.file_path].modified_lines.append(blame.line_num)
                 
         for _, reblame_candidate in to_reblame.items():
             log.info(f'Re-blaming {reblame_candidate.file_path} @ {reblame_candidate.rev}, lines {reblame_candidate.modified_lines} because of refactoring')
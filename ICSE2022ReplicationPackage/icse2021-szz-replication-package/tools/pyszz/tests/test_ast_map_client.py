@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from szz.core.ast_map_client import ASTMapDaemon, ASTMapDaemonCrashed
+
+# answers each request with an empty mapping, like ASTMapEvalDaemon
+FAKE_DAEMON = '''
+import json, sys
+for line in sys.stdin:
+    request = json.loads(line)
+    with open(request['output'], 'w') as f:
+        f.write('[]')
+    print(json.dumps({'id': request['id'], 'ok': True}), flush=True)
+'''
+
+# dies on the first request without answering it
+CRASHING_DAEMON = 'import sys; sys.stdin.readline(); sys.exit(3)'
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    """ Daemon spawning a crashing process, then working ones, whose readers wait for the test to release them """
+    daemon = ASTMapDaemon(str(tmp_path))
+    scripts = [CRASHING_DAEMON]
+    popen = subprocess.Popen
+
+    def fake_popen(args, **kwargs):
+        return popen([sys.executable, '-c', scripts.pop(0) if scripts else FAKE_DAEMON], **kwargs)
+
+    monkeypatch.setattr(subprocess, 'Popen', fake_popen)
+    monkeypatch.setattr(daemon, '_build', lambda: None)
+
+    readers = list()
+    read_replies = daemon._read_replies
+
+    def gated_read_replies(*args):
+        released = threading.Event()
+        readers.append(released)
+        released.wait(10)
+        read_replies(*args)
+
+    monkeypatch.setattr(daemon, '_read_replies', gated_read_replies)
+    daemon.readers = readers
+    yield daemon
+    for released in readers:
+        released.set()
+    daemon.close()
+
+
+def test_dead_process_does_not_fail_the_requests_of_the_next_one(daemon, tmp_path):
+    crashed = daemon.submit('project', 'commit1', 'a.c', str(tmp_path / 'out1.json'))
+    daemon._process.wait(10)
+
+    # the daemon is respawned before the reader of the dead process noticed its death
+    respawned = daemon.submit('project', 'commit2', 'b.c', str(tmp_path / 'out2.json'))
+    assert daemon.restarts == 1
+    assert len(daemon.readers) == 2
+
+    daemon.readers[0].set()
+    with pytest.raises(ASTMapDaemonCrashed):
+        crashed.result(10)
+    assert not respawned.done()
+
+    daemon.readers[1].set()
+    assert respawned.result(10) == []
+    assert not (tmp_path / 'out2.json').exists()
+    assert daemon.pending == 0
@@ -0,0 +1,95 @@
+from szz.core.blame_backend import parse_blame_incremental
+
+ONE = 'af78d02ed5dee345b2f3092ac2240bde388fdf45'
+TWO = 'f943a9d8ae121378c154d4a5ad9cfc87fb447961'
+THREE = '52623dbfbc6ff158e560f2fceee2eaabb0b421a0'
+FOUR = 'ec9ad525f0d6c79ddfa8b9bd489a38b7bc78928b'
+
+
+def commit_info(summary: str):
+    return [
+        'author A',
+        'author-mail <a@b>',
+        'author-time 1577836800',
+        'author-tz +0000',
+        'committer A',
+        'committer-mail <a@b>',
+        'committer-time 1577836800',
+        'committer-tz +0000',
+        f'summary {summary}',
+    ]
+
+
+# 'git blame --incremental -L 1,3 -L 5,7 HEAD -- new.c', where commit TWO renamed old.c (added by the boundary
+# commit ONE) to new.c: the commit info of TWO is only sent with its first group
+SEVERAL_RANGES_OUTPUT = '\n'.join([
+    f'{THREE} 3 3 1',
+    *commit_info('three'),
+    f'previous {TWO} new.c',
+    'filename new.c',
+    f'{TWO} 2 2 1',
+    *commit_info('two'),
+    f'previous {ONE} old.c',
+    'filename new.c',
+    f'{TWO} 5 5 1',
+    f'previous {ONE} old.c',
+    'filename new.c',
+    f'{TWO} 7 7 1',
+    f'previous {ONE} old.c',
+    'filename new.c',
+    f'{ONE} 1 1 1',
+    *commit_info('one'),
+    'boundary',
+    'filename old.c',
+    f'{ONE} 6 6 1',
+    'filename old.c',
+    '',
+])
+
+
+def test_parse_blame_incremental_several_ranges():
+    entries = parse_blame_incremental(SEVERAL_RANGES_OUTPUT)
+
+    assert entries == [
+        (3, THREE, 'new.c', 3),
+        (2, TWO, 'new.c', 2),
+        (5, TWO, 'new.c', 5),
+        (7, TWO, 'new.c', 7),
+        (1, ONE, 'old.c', 1),
+        (6, ONE, 'old.c', 6),
+    ]
+    assert {line_num: (sha, orig_line) for line_num, sha, _, orig_line in entries} == {
+        1: (ONE, 1), 2: (TWO, 2), 3: (THREE, 3), 5: (TWO, 5), 6: (ONE, 6), 7: (TWO, 7),
+    }
+
+
+def test_parse_blame_incremental_group_of_several_lines():
+    # 'git blame --incremental -L 4,6 ONE -- old.c'
+    output = '\n'.join([f'{ONE} 4 4 3', *commit_info('one'), 'boundary', 'filename old.c', ''])
+
+    assert parse_blame_incremental(output) == [(4, ONE, 'old.c', 4), (5, ONE, 'old.c', 5), (6, ONE, 'old.c', 6)]
+
+
+def test_parse_blame_incremental_moved_lines():
+    # lines moved by a commit keep the line number of the blamed commit
+    output = '\n'.join([f'{ONE} 10 2 2', *commit_info('one'), 'filename old.c', ''])
+
+    assert parse_blame_incremental(output) == [(2, ONE, 'old.c', 10), (3, ONE, 'old.c', 11)]
+
+
+def test_parse_blame_incremental_quoted_path():
+    # 'git blame --incremental -L 2,2 HEAD -- "sp ace é.c"'
+    output = '\n'.join([f'{FOUR} 2 2 1', *commit_info('four'), 'filename "sp ace \\303\\251.c"', ''])
+
+    assert parse_blame_incremental(output) == [(2, FOUR, 'sp ace é.c', 2)]
+
+
+def test_parse_blame_incremental_summary_looking_like_a_header():
+    # a commit info line is never taken for a header, even when it has 4 space separated fields
+    output = '\n'.join([f'{ONE} 1 1 1', *commit_info(f'{TWO} 1 1 1'), 'filename old.c', ''])
+
+    assert parse_blame_incremental(output) == [(1, ONE, 'old.c', 1)]
+
+
+def test_parse_blame_incremental_empty_output():
+    assert parse_blame_incremental('') == []
@@ -0,0 +1,99 @@
+import shutil
+
+import pytest
+
+from szz.core.comment_parser import CommentRange, c_family_comment_parser, parse_comments, parse_comments_srcml
+
+# (case, file name, source, expected comment ranges)
+CORPUS = [
+    ('line_and_block_comments', 'test.c', '\n'.join([
+        '// line comment',
+        'int a;',
+        '/* block comment */',
+        'int b;',
+    ]), [CommentRange(1, 1), CommentRange(3, 3)]),
+
+    ('multi_line_block_comment', 'test.c', '\n'.join([
+        'int a;',
+        '/*',
+        ' * block comment',
+        ' */',
+        'int b;',
+        '/** doc */ /* second */',
+    ]), [CommentRange(2, 4), CommentRange(6, 6)]),
+
+    ('unterminated_block_comment', 'test.c', '\n'.join([
+        'int a;',
+        '/* never closed',
+        'int b;',
+    ]), [CommentRange(2, 3)]),
+
+    ('markers_in_string_literals', 'test.c', '\n'.join([
+        'char *s = "// not a comment";',
+        'char *t = "/* not a comment */";',
+        'char *u = "escaped \\" // still a string";',
+        '"/*";',
+        '// comment',
+    ]), [CommentRange(5, 5)]),
+
+    ('markers_in_char_literals', 'test.c', '\n'.join([
+        "char a = '/';",
+        "char b = '\\'';",
+        "char c = '\"'; char d = '/';",
+        "/* comment */",
+    ]), [CommentRange(4, 4)]),
+
+    ('line_continuation_in_line_comment', 'test.c', '\n'.join([
+        '// comment continued \\',
+        'on the next line \\',
+        'and the one after',
+        'int a;',
+    ]), [CommentRange(1, 3)]),
+
+    ('line_continuation_with_crlf', 'test.c',
+     '// comment \\\r\ncontinued\r\nint a;\r\n// last\r\n',
+     [CommentRange(1, 2), CommentRange(4, 4)]),
+
+    ('comments_after_code', 'test.c', '\n'.join([
+        'int a; // trailing comment',
+        'int b; /* trailing block */',
+        'int c; /* trailing block',
+        '   spanning lines */ int d;',
+        '    // indented comment',
+    ]), [CommentRange(5, 5)]),
+
+    ('comment_before_code', 'test.c', '\n'.join([
+        '/* leading */ int a;',
+        'int b;',
+    ]), [CommentRange(1, 1)]),
+
+    ('java_text_block', 'Test.java', '\n'.join([
+        'String s = """',
+        '    // not a comment',
+        '    """;',
+        '// comment',
+    ]), [CommentRange(4, 4)]),
+
+    ('cpp_raw_string', 'test.cpp', '\n'.join([
+        'auto s = R"x(',
+        '// not a comment )" still raw',
+        ')x";',
+        '/* comment */',
+    ]), [CommentRange(4, 4)]),
+]
+
+
+@pytest.mark.parametrize('file_name,source,expected', [case[1:] for case in CORPUS], ids=[case[0] for case in CORPUS])
+def test_c_family_comment_parser(file_name, source, expected):
+    assert c_family_comment_parser(source, file_name) == expected
+
+
+@pytest.mark.skipif(shutil.which('srcml') is None, reason='srcML is not installed')
+@pytest.mark.parametrize('file_name,source', [case[1:3] for case in CORPUS], ids=[case[0] for case in CORPUS])
+def test_c_family_comment_parser_matches_srcml(file_name, source, tmp_path):
+    assert c_family_comment_parser(source, file_name) == parse_comments_srcml(source, file_name, str(tmp_path))
+
+
+def test_parse_comments_uses_the_lexer_for_c_family_files():
+    for file_name in ('a.c', 'a.h', 'a.cpp', 'a.cs', 'A.java'):
+        assert parse_comments('// comment\nint a;\n', file_name) == [CommentRange(1, 1)]
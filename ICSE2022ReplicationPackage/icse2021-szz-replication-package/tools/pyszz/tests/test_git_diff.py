@@ -0,0 +1,286 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from szz.core.git_diff import FileDiff, iter_commit_diffs, parse_unified_diff
+
+
+def test_parse_unified_diff_multiple_hunks():
+    diff = [
+        'diff --git a/a.c b/a.c',
+        'index 1111111..2222222 100644',
+        '--- a/a.c',
+        '+++ b/a.c',
+        '@@ -2,2 +2,3 @@ int main() {',
+        '-  int a;',
+        '-  int b;',
+        '+  long a;',
+        '+  long b;',
+        '+  long c;',
+        '@@ -10 +11,0 @@ int main() {',
+        '-  return 0;',
+        '@@ -20,0 +21,2 @@ int main() {',
+        '+  return 1;',
+        '+}',
+    ]
+
+    assert parse_unified_diff(diff) == [FileDiff('a.c', 'a.c', [2, 3, 10], [2, 3, 4, 21, 22])]
+
+
+def test_parse_unified_diff_omitted_counts():
+    # with -U0, git omits the count of a range of one line
+    diff = [
+        'diff --git a/a.c b/a.c',
+        '--- a/a.c',
+        '+++ b/a.c',
+        '@@ -5 +5 @@',
+        '-int a;',
+        '+int b;',
+        '@@ -9 +9,2 @@',
+        '-int c;',
+        '+int d;',
+        '+int e;',
+        '@@ -12,2 +13 @@',
+        '-int f;',
+        '-int g;',
+        '+int h;',
+    ]
+
+    assert parse_unified_diff(diff) == [FileDiff('a.c', 'a.c', [5, 9, 12, 13], [5, 9, 10, 13])]
+
+
+def test_parse_unified_diff_with_context_and_content():
+    diff = [
+        'diff --git a/a.c b/a.c',
+        '--- a/a.c',
+        '+++ b/a.c',
+        '@@ -1,4 +1,4 @@',
+        ' int a;',
+        '-int b;',
+        '+int c;',
+        ' int d;',
+        ' int e;',
+    ]
+
+    assert parse_unified_diff(diff, with_content=True) == [FileDiff('a.c', 'a.c', [(2, 'int b;')], [(2, 'int c;')])]
+
+
+def test_parse_unified_diff_rename():
+    diff = [
+        'diff --git a/old.c b/new.c',
+        'similarity index 80%',
+        'rename from old.c',
+        'rename to new.c',
+        'index 1111111..2222222 100644',
+        '--- a/old.c',
+        '+++ b/new.c',
+        '@@ -3 +3 @@',
+        '-int a;',
+        '+int b;',
+        'diff --git a/pure.c b/renamed.c',
+        'similarity index 100%',
+        'rename from pure.c',
+        'rename to renamed.c',
+    ]
+
+    # the pure rename has no hunk, it is not returned
+    assert parse_unified_diff(diff) == [FileDiff('old.c', 'new.c', [3], [3])]
+
+
+def test_parse_unified_diff_added_and_deleted_files():
+    diff = [
+        'diff --git a/gone.c b/gone.c',
+        'deleted file mode 100644',
+        'index 1111111..0000000',
+        '--- a/gone.c',
+        '+++ /dev/null',
+        '@@ -1,2 +0,0 @@',
+        '-int a;',
+        '--- not a file header',
+        'diff --git a/added.c b/added.c',
+        'new file mode 100644',
+        'index 0000000..2222222',
+        '--- /dev/null',
+        '+++ b/added.c',
+        '@@ -0,0 +1 @@',
+        '+++ not a file header',
+    ]
+
+    assert parse_unified_diff(diff) == [
+        FileDiff('gone.c', None, [1, 2], []),
+        FileDiff(None, 'added.c', [], [1]),
+    ]
+
+
+def test_parse_unified_diff_binary_file():
+    diff = [
+        'diff --git a/bin.dat b/bin.dat',
+        'index 1111111..2222222 100644',
+        'Binary files a/bin.dat and b/bin.dat differ',
+        'diff --git a/a.c b/a.c',
+        '--- a/a.c',
+        '+++ b/a.c',
+        '@@ -1 +1 @@',
+        '-int a;',
+        '+int b;',
+    ]
+
+    assert parse_unified_diff(diff) == [FileDiff('a.c', 'a.c', [1], [1])]
+
+
+def test_parse_unified_diff_no_newline_at_end_of_file():
+    diff = [
+        'diff --git a/a.c b/a.c',
+        '--- a/a.c',
+        '+++ b/a.c',
+        '@@ -2 +2,2 @@',
+        '-int a;',
+        '\\ No newline at end of file',
+        '+int b;',
+        '+int c;',
+        '\\ No newline at end of file',
+        'diff --git a/b.c b/b.c',
+        '--- a/b.c',
+        '+++ b/b.c',
+        '@@ -1 +1 @@',
+        '-int d;',
+        '+int e;',
+    ]
+
+    assert parse_unified_diff(diff) == [FileDiff('a.c', 'a.c', [2], [2, 3]), FileDiff('b.c', 'b.c', [1], [1])]
+
+
+def test_parse_unified_diff_quoted_paths():
+    diff = [
+        'diff --git "a/sp ace \\303\\251.c" "b/sp ace \\303\\251.c"',
+        '--- "a/sp ace \\303\\251.c"',
+        '+++ "b/sp ace \\303\\251.c"',
+        '@@ -1 +1 @@',
+        '-int a;',
+        '+int b;',
+        'diff --git a/with space.c b/with space.c',
+        '--- a/with space.c\t',
+        '+++ b/with space.c\t',
+        '@@ -1 +1 @@',
+        '-int a;',
+        '+int b;',
+    ]
+
+    assert parse_unified_diff(diff) == [
+        FileDiff('sp ace é.c', 'sp ace é.c', [1], [1]),
+        FileDiff('with space.c', 'with space.c', [1], [1]),
+    ]
+
+
+def pydriller_diff_parsed(diff: str) -> dict:
+    """ Modification.diff_parsed of PyDriller 1.15.2, which get_impacted_files() used to read the modified lines """
+    lines = diff.split('\n')
+    modified_lines = {'added': [], 'deleted': []}
+
+    count_deletions = 0
+    count_additions = 0
+
+    for line in lines:
+        line = line.rstrip()
+        count_deletions += 1
+        count_additions += 1
+
+        if line.startswith('@@'):
+            token = line.split(' ')
+            count_deletions = int(token[1].split(',')[0].replace('-', '')) - 1
+            count_additions = int(token[2].split(',')[0]) - 1
+
+        if line.startswith('-'):
+            modified_lines['deleted'].append((count_deletions, line[1:]))
+            count_additions -= 1
+
+        if line.startswith('+'):
+            modified_lines['added'].append((count_additions, line[1:]))
+            count_deletions -= 1
+
+        if line == r'\ No newline at end of file':
+            count_deletions -= 1
+            count_additions -= 1
+
+    return modified_lines
+
+
+def git(repo_path: str, *args: str) -> str:
+    return subprocess.run(['git', *args], cwd=repo_path, check=True, capture_output=True).stdout.decode('utf-8')
+
+
+def write(repo_path: str, file_path: str, content):
+    with open(os.path.join(repo_path, file_path), 'wb') as f:
+        f.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+
+
+@pytest.fixture
+def fix_commit_repo(tmp_path):
+    repo_path = str(tmp_path)
+    git(repo_path, 'init', '-q')
+    git(repo_path, 'config', 'user.name', 'test')
+    git(repo_path, 'config', 'user.email', 'test@example.com')
+
+    lines = [f'int v{i};' for i in range(1, 31)]
+    write(repo_path, 'hunks.c', '\n'.join(lines) + '\n')
+    write(repo_path, 'old.c', '\n'.join(lines[:20]) + '\n')
+    write(repo_path, 'pure.c', 'int pure;\n')
+    write(repo_path, 'gone.c', 'int a;\n-- b;\n')
+    write(repo_path, 'nonl.c', 'int a;\nint b;')
+    write(repo_path, 'bin.dat', b'\x00\x01\x02')
+    git(repo_path, 'add', '.')
+    git(repo_path, 'commit', '-q', '-m', 'initial')
+
+    # lines looking like file headers: added by the first commit ('+++ v15;') and deleted by the fix ('--- v2;')
+    hunks = list(lines)
+    hunks[1] = '-- v2;'
+    hunks[14:16] = ['++ v15;']
+    del hunks[25]
+    write(repo_path, 'hunks.c', '\n'.join(hunks) + '\n')
+    git(repo_path, 'commit', '-q', '-am', 'prepare')
+    hunks[1] = 'int w2;'
+    hunks[20:20] = ['int x;', 'int y;']
+    hunks[14] = 'int w15;'
+    hunks[-1] = 'int w30;'
+    write(repo_path, 'hunks.c', '\n'.join(hunks) + '\n')
+
+    git(repo_path, 'mv', 'old.c', 'new.c')
+    renamed = list(lines[:20])
+    renamed[9] = 'long v10;'
+    write(repo_path, 'new.c', '\n'.join(renamed) + '\n')
+    git(repo_path, 'mv', 'pure.c', 'renamed.c')
+    git(repo_path, 'rm', '-q', 'gone.c')
+    write(repo_path, 'nonl.c', 'int a;\nint c;')
+    write(repo_path, 'bin.dat', b'\x00\x01\x03')
+    write(repo_path, 'added.c', 'int added;\n')
+    git(repo_path, 'add', '.')
+    git(repo_path, 'commit', '-q', '-m', 'fix')
+
+    return repo_path
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+def test_iter_commit_diffs_matches_pydriller(fix_commit_repo):
+    fix_commit = git(fix_commit_repo, 'rev-parse', 'HEAD').strip()
+    prepare_commit = git(fix_commit_repo, 'rev-parse', 'HEAD^').strip()
+
+    commit_diffs = list(iter_commit_diffs(fix_commit_repo, [fix_commit, prepare_commit]))
+    assert [commit for commit, _ in commit_diffs] == [fix_commit, prepare_commit]
+
+    file_diffs = {(file_diff.old_path, file_diff.new_path): file_diff for file_diff in commit_diffs[0][1]}
+    assert set(file_diffs) == {('hunks.c', 'hunks.c'), ('old.c', 'new.c'), ('gone.c', None), ('nonl.c', 'nonl.c'),
+                               (None, 'added.c')}
+    assert file_diffs[('hunks.c', 'hunks.c')].deleted_lines == [2, 15, 28]
+    assert file_diffs[('gone.c', None)].deleted_lines == [1, 2]
+    assert commit_diffs[1][1] == [FileDiff('hunks.c', 'hunks.c', [2, 15, 16, 27], [2, 15])]
+
+    # same modified lines as PyDriller on the diff with context GitPython gives it
+    for (old_path, new_path), file_diff in file_diffs.items():
+        paths = [path for path in (old_path, new_path) if path is not None]
+        patch = git(fix_commit_repo, 'diff', '-M', '--no-color', f'{fix_commit}^', fix_commit, '--', *paths)
+        hunks = patch[patch.index('\n@@') + 1:]
+        diff_parsed = pydriller_diff_parsed(hunks)
+        assert file_diff.deleted_lines == [line_num for line_num, _ in diff_parsed['deleted']], old_path
+        assert file_diff.added_lines == [line_num for line_num, _ in diff_parsed['added']], new_path
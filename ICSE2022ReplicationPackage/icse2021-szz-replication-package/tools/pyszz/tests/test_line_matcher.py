@@ -0,0 +1,87 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+from szz.core import line_matcher
+from szz.core.line_matcher import MATCH_THRESHOLD, LineCandidates, best_match, compute_line_ratio
+
+
+def levenshtein_module():
+    try:
+        import Levenshtein
+        return Levenshtein
+    except ImportError:
+        pass
+    try:
+        from rapidfuzz.distance import Indel
+    except ImportError:
+        return None
+    # python-Levenshtein's ratio is the normalized Indel similarity
+    return types.SimpleNamespace(ratio=Indel.normalized_similarity)
+
+
+@pytest.fixture(params=['rapidfuzz', 'levenshtein'])
+def matcher(request, monkeypatch):
+    if request.param == 'rapidfuzz':
+        if line_matcher.process is None:
+            pytest.skip('rapidfuzz is not installed')
+    else:
+        levenshtein = levenshtein_module()
+        if levenshtein is None:
+            pytest.skip('neither python-Levenshtein nor rapidfuzz is installed')
+        # the fallback used when rapidfuzz cannot be imported
+        monkeypatch.setattr(line_matcher, 'process', None)
+        monkeypatch.setattr(line_matcher, 'Levenshtein', levenshtein, raising=False)
+    return request.param
+
+
+def test_best_match_prefers_the_highest_score(matcher):
+    candidates = LineCandidates([(8, 'int count = 0;'), (30, 'int counter = 0;')])
+
+    assert best_match('int counter = 0;', 8, candidates) == 30
+
+
+def test_best_match_equal_scores_prefer_the_closest_line(matcher):
+    candidates = LineCandidates([(1, 'return x;'), (10, '  return  x;'), (20, 'return x;')])
+
+    assert best_match('return x;', 8, candidates) == 10
+    assert best_match('return x;', 18, candidates) == 20
+    assert best_match('return x;', 2, candidates) == 1
+
+
+def test_best_match_equal_scores_and_distances_prefer_the_first_candidate(matcher):
+    assert best_match('return x;', 8, LineCandidates([(6, 'return x;'), (10, 'return x;')])) == 6
+    assert best_match('return x;', 8, LineCandidates([(10, 'return x;'), (6, 'return x;')])) == 10
+
+
+def test_best_match_threshold_boundary(matcher):
+    # 'abcd' and 'abce' differ by one deletion and one insertion out of 8 characters: ratio 0.75
+    assert compute_line_ratio('abcd', 'abce') == MATCH_THRESHOLD
+    assert best_match('abcd', 1, LineCandidates([(1, 'abce')])) == -1
+    assert best_match('abcd', 1, LineCandidates([(1, 'abce')]), threshold=0.7) == 1
+
+    # ratio 0.8
+    assert best_match('abcde', 1, LineCandidates([(1, 'abcdf')])) == 1
+
+
+def test_best_match_without_candidates(matcher):
+    assert best_match('return x;', 1, None) == -1
+    assert best_match('return x;', 1, LineCandidates([])) == -1
+    assert best_match('', 1, LineCandidates([(1, '')])) == -1
+    assert best_match('return x;', 1, LineCandidates([(1, 'int y = 2 * z;')])) == -1
+
+
+def test_line_matcher_falls_back_to_levenshtein(monkeypatch):
+    pytest.importorskip('Levenshtein')
+    # a None entry in sys.modules makes the import fail
+    monkeypatch.setitem(sys.modules, 'rapidfuzz', None)
+    try:
+        fallback = importlib.reload(line_matcher)
+        assert fallback.process is None
+        candidates = fallback.LineCandidates([(6, 'return x;'), (10, 'return  x;')])
+        assert fallback.best_match('return x;', 8, candidates) == 6
+    finally:
+        monkeypatch.undo()
+        importlib.reload(line_matcher)
@@ -0,0 +1,141 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from szz.core import refactoring_store
+from szz.core.refactoring_store import RefactoringLocations, RefactoringStore
+
+
+def refminer_output(*locations):
+    """ JSON output of RefactoringMiner with a refactoring of each (file path, start line, end line, type) """
+    return {'commits': [{'refactorings': [
+        {'type': refactoring_type, 'rightSideLocations': [{'filePath': file_path, 'startLine': start, 'endLine': end}]}
+        for file_path, start, end, refactoring_type in locations
+    ]}]}
+
+
+def resolved(result=None, exception=None) -> Future:
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RefactoringStore(str(tmp_path / 'refactorings.db'))
+    yield store
+    store.close()
+
+
+def test_refactoring_locations_find():
+    locations = RefactoringLocations.from_refminer_output(refminer_output(
+        ('a.java', 10, 40, 'Extract Method'), ('a.java', 12, 15, 'Rename Variable'), ('b.java', 1, 1, 'Move Class')))
+
+    assert locations.find('a.java', 9) is None
+    assert locations.find('a.java', 13) == 'Rename Variable'
+    assert locations.find('a.java', 20) == 'Extract Method'
+    assert locations.find('a.java', 41) is None
+    assert locations.find('b.java', 1) == 'Move Class'
+    assert locations.find('c.java', 1) is None
+    assert len(locations) == 3
+
+
+def test_iter_extract_stores_the_results(store):
+    store.put('stored', RefactoringLocations.from_intervals({'a.java': [(1, 2, 'Rename Method')]}))
+    submitted = list()
+
+    def submit(commit_id):
+        submitted.append(commit_id)
+        return resolved(refminer_output(('b.java', 3, 4, 'Extract Method')))
+
+    results = dict(store.iter_extract(['stored', 'new', 'stored'], submit))
+
+    assert submitted == ['new']
+    assert results['stored'].find('a.java', 1) == 'Rename Method'
+    assert results['new'].find('b.java', 3) == 'Extract Method'
+    assert store.get('new').intervals() == {'b.java': [(3, 4, 'Extract Method')]}
+    assert not store.claim('new')
+
+
+def test_iter_extract_stores_the_completed_results_before_raising(store, monkeypatch):
+    futures = {
+        'failed': resolved(exception=RuntimeError('RefactoringMiner failed')),
+        'ok1': resolved(refminer_output(('a.java', 1, 1, 'Rename Method'))),
+        'ok2': resolved(refminer_output(('b.java', 2, 2, 'Move Method'))),
+    }
+    # the completed futures are returned with the failed one first
+    monkeypatch.setattr(refactoring_store, 'wait', lambda running, **kwargs: (list(running), set()))
+
+    with pytest.raises(RuntimeError, match='RefactoringMiner failed'):
+        list(store.iter_extract(futures, futures.get))
+
+    assert store.get('ok1').find('a.java', 1) == 'Rename Method'
+    assert store.get('ok2').find('b.java', 2) == 'Move Method'
+    # the claim of the failed commit is released: the next run analyzes it again
+    assert store.get('failed') is None
+    assert store.claim('failed')
+
+
+def test_iter_extract_releases_the_running_commits_when_stopped(store):
+    running = Future()
+
+    def submit(commit_id):
+        return resolved(refminer_output()) if commit_id == 'done' else running
+
+    iterator = store.iter_extract(['done', 'running'], submit)
+    assert next(iterator)[0] == 'done'
+    iterator.close()
+
+    assert running.cancelled()
+    assert store.claim('running')
+
+
+def add_claim(store, commit_id, owner, claimed_at=None):
+    store._conn().execute('INSERT INTO claims (commit_id, owner, claimed_at) VALUES (?, ?, ?)',
+                          (commit_id, owner, time.time() if claimed_at is None else claimed_at))
+
+
+def test_claim_held_by_a_live_worker(store):
+    thread_id = threading.get_ident()
+    add_claim(store, 'other_process', f'{socket.gethostname()}:{os.getppid()}:{thread_id}')
+    add_claim(store, 'other_host', f'other-host:{os.getpid() + 1}:1')
+    add_claim(store, 'other_thread', f'{socket.gethostname()}:{os.getpid()}:{thread_id}')
+
+    assert not store.claim('other_process')
+    assert not store.claim('other_host')
+    assert not store.claim('other_thread')
+
+
+def test_claim_expired(store):
+    add_claim(store, 'expired', f'other-host:{os.getpid()}:1', claimed_at=time.time() - store.claim_timeout - 1)
+
+    assert store.claim('expired')
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='dead processes are only detected on POSIX')
+def test_claim_held_by_a_dead_process(store):
+    # e.g. a run killed while RefactoringMiner was analyzing the commit
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    add_claim(store, 'dead', f'{socket.gethostname()}:{process.pid}:1')
+
+    assert store.claim('dead')
+    assert not store.claim('dead')
+
+
+def test_claim_held_by_a_dead_thread(store):
+    thread = threading.Thread(target=lambda: None)
+    thread.start()
+    thread.join()
+    add_claim(store, 'dead', f'{socket.gethostname()}:{os.getpid()}:{thread.ident}')
+
+    assert store.claim('dead')
@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from szz.core.refminer_client import RefMinerPool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """ Pool of one worker whose analyses wait for the test to release them """
+    pool = RefMinerPool('refminer', size=1)
+    started = list()
+    released = threading.Event()
+
+    def detect(repo_path, commit_id):
+        started.append(commit_id)
+        released.wait(10)
+        return {'commit': commit_id}
+
+    monkeypatch.setattr(pool, '_detect', detect)
+    pool.started = started
+    pool.released = released
+    yield pool
+    released.set()
+    pool.close()
+
+
+def wait_started(pool, count):
+    for _ in range(1000):
+        if len(pool.started) >= count:
+            return
+        threading.Event().wait(0.01)
+    pytest.fail(f'{count} analyses not started')
+
+
+def test_requests_are_analyzed_before_prefetched_commits(pool):
+    running = pool.submit('repo', 'prefetch1', prefetch=True)
+    wait_started(pool, 1)
+    prefetched = [pool.submit('repo', commit_id, prefetch=True) for commit_id in ('prefetch2', 'prefetch3')]
+    requested = [pool.submit('repo', commit_id) for commit_id in ('request1', 'request2')]
+
+    pool.released.set()
+    assert [future.result(10)['commit'] for future in [running, *requested, *prefetched]] == \
+           ['prefetch1', 'request1', 'request2', 'prefetch2', 'prefetch3']
+    assert pool.started == ['prefetch1', 'request1', 'request2', 'prefetch2', 'prefetch3']
+
+
+def test_close_cancels_the_queued_commits(pool):
+    running = pool.submit('repo', 'running')
+    wait_started(pool, 1)
+    queued = [pool.submit('repo', commit_id, prefetch=True) for commit_id in ('queued1', 'queued2')]
+
+    closing = threading.Thread(target=pool.close)
+    closing.start()
+    for future in queued:
+        with pytest.raises(CancelledError):
+            future.result(10)
+
+    # the running analysis completes
+    pool.released.set()
+    closing.join(10)
+    assert not closing.is_alive()
+    assert running.result(10) == {'commit': 'running'}
+    assert pool.started == ['running']
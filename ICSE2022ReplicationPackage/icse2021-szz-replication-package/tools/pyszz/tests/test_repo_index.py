@@ -0,0 +1,102 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from szz.core.repo_index import ChangeSizeIndex, RenameIndex
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+
+
+def git(repo_path: str, *args: str) -> str:
+    return subprocess.run(['git', *args], cwd=repo_path, check=True, capture_output=True).stdout.decode('utf-8')
+
+
+def commit_file(repo_path: str, file_path: str, content: str, message: str) -> str:
+    with open(os.path.join(repo_path, file_path), 'w') as f:
+        f.write(content)
+    git(repo_path, 'add', '-A')
+    git(repo_path, 'commit', '-q', '-m', message)
+    return git(repo_path, 'rev-parse', 'HEAD').strip()
+
+
+@pytest.fixture
+def repo_path(tmp_path):
+    repo_path = str(tmp_path / 'repo')
+    os.makedirs(repo_path)
+    git(repo_path, 'init', '-q')
+    git(repo_path, 'config', 'user.name', 'test')
+    git(repo_path, 'config', 'user.email', 'test@example.com')
+    return repo_path
+
+
+def rename_file(repo_path: str, old_path: str, new_path: str, message: str) -> str:
+    git(repo_path, 'mv', old_path, new_path)
+    git(repo_path, 'commit', '-q', '-m', message)
+    return git(repo_path, 'rev-parse', 'HEAD').strip()
+
+
+def test_rename_index_incremental_update(repo_path, tmp_path, monkeypatch):
+    content = ''.join(f'int v{i};\n' for i in range(20))
+    first = commit_file(repo_path, 'old.c', content, 'add old.c')
+    rename = rename_file(repo_path, 'old.c', 'new.c', 'rename old.c')
+
+    cache_dir = str(tmp_path / 'cache')
+    index = RenameIndex(repo_path, cache_dir)
+    # only the commits renaming files are logged
+    assert index.update() == 1
+    assert index.old_path(rename, 'new.c') == 'old.c'
+    assert index.old_path(rename, 'other.c') == 'other.c'
+    assert index.old_path(first, 'old.c') == 'old.c'
+    assert index.renames(rename) == {'new.c': 'old.c'}
+    assert index.update() == 0
+
+    # only the commits that are not reachable from the indexed tips are logged, without rebuilding the index
+    second_rename = rename_file(repo_path, 'new.c', 'newer.c', 'rename new.c')
+    excluded_tips = list()
+    log = RenameIndex._log
+
+    def spy_log(self, tips):
+        excluded_tips.append(list(tips))
+        return log(self, tips)
+
+    monkeypatch.setattr(RenameIndex, '_log', spy_log)
+    monkeypatch.setattr(RenameIndex, '_reset', lambda self: pytest.fail('the index was rebuilt'))
+    assert index.update() == 1
+    assert excluded_tips == [[rename]]
+    assert index.old_path(second_rename, 'newer.c') == 'new.c'
+    assert index.old_path(rename, 'new.c') == 'old.c'
+
+    # the persisted index covers the new commit
+    reloaded = RenameIndex(repo_path, cache_dir)
+    assert reloaded.update() == 0
+    assert reloaded.old_path(second_rename, 'newer.c') == 'new.c'
+    assert reloaded.old_path(rename, 'new.c') == 'old.c'
+
+
+def test_rename_index_new_branch(repo_path):
+    content = ''.join(f'int v{i};\n' for i in range(20))
+    commit_file(repo_path, 'a.c', content, 'add a.c')
+    index = RenameIndex(repo_path)
+    assert index.update() == 0
+
+    git(repo_path, 'checkout', '-q', '-b', 'feature')
+    rename = rename_file(repo_path, 'a.c', 'b.c', 'rename a.c')
+    git(repo_path, 'checkout', '-q', '-')
+
+    assert index.update() == 1
+    assert index.old_path(rename, 'b.c') == 'a.c'
+
+
+def test_change_size_index(repo_path):
+    first = commit_file(repo_path, 'a.c', 'int a;\n', 'add a.c')
+    with open(os.path.join(repo_path, 'b.c'), 'w') as f:
+        f.write('int b;\n')
+    second = commit_file(repo_path, 'a.c', 'int a = 1;\n', 'add b.c, modify a.c')
+
+    index = ChangeSizeIndex(repo_path)
+    assert index.get(first) == 1
+    assert index.get(second) == 2
+    assert index.get('0' * 40) is None
+    assert len(index) == 2
@@ -0,0 +1,109 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+
+import com.fasterxml.jackson.databind.JsonNode;
+import com.fasterxml.jackson.databind.ObjectMapper;
+import com.fasterxml.jackson.databind.node.ObjectNode;
+
+/**
+ * Long-running wrapper of RefactoringMiner (org.refactoringminer.RefactoringMiner), so that the JVM is started and the
+ * classes are loaded once instead of once per analyzed commit.
+ *
+ * Protocol: one JSON request per line on stdin, {"id": ..., "repo": ..., "commit": ...}, one JSON reply per line on
+ * stdout, {"id": ..., "ok": true, "output": ...} or {"id": ..., "ok": false, "error": ...}, in the order of the
+ * requests. The output is the JSON document printed by 'RefactoringMiner -c repo commit'. Everything else
+ * RefactoringMiner prints goes to stderr.
+ *
+ * Build (from RefactoringMiner-2.0):
+ *   javac -cp "lib/*" -d daemon/classes daemon/RefactoringMinerDaemon.java
+ * Run (from RefactoringMiner-2.0):
+ *   java -cp "lib/*:daemon/classes" RefactoringMinerDaemon
+ */
+public class RefactoringMinerDaemon {
+
+    private static class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("RefactoringMiner called System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    /** Turn the System.exit calls of RefactoringMiner into exceptions, when the JVM still allows a security manager */
+    private static void trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrappedException(status);
+                }
+            });
+        } catch (UnsupportedOperationException | SecurityException e) {
+            // Java 18+ without -Djava.security.manager=allow: a System.exit kills the daemon, the client respawns it
+            System.err.println("RefactoringMinerDaemon: System.exit cannot be trapped: " + e);
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        PrintWriter replies = new PrintWriter(new OutputStreamWriter(System.out, StandardCharsets.UTF_8), false);
+        PrintStream stderr = new PrintStream(System.err, true);
+        System.setOut(stderr);
+        trapExit();
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        ObjectMapper mapper = new ObjectMapper();
+
+        String line;
+        while ((line = requests.readLine()) != null) {
+            if (line.trim().isEmpty()) {
+                continue;
+            }
+
+            ObjectNode reply = mapper.createObjectNode();
+            ByteArrayOutputStream output = new ByteArrayOutputStream();
+            try {
+                JsonNode request = mapper.readTree(line);
+                reply.set("id", request.get("id"));
+
+                String[] minerArgs = {"-c", request.get("repo").asText(), request.get("commit").asText()};
+                // the requests are handled one at a time, the output of RefactoringMiner is the output of the request
+                System.setOut(new PrintStream(output, true, "UTF-8"));
+                try {
+                    org.refactoringminer.RefactoringMiner.main(minerArgs);
+                } finally {
+                    System.setOut(stderr);
+                }
+                reply.put("ok", true);
+                reply.put("output", output.toString("UTF-8"));
+            } catch (ExitTrappedException e) {
+                reply.put("ok", e.status == 0);
+                if (e.status == 0) {
+                    reply.put("output", output.toString("UTF-8"));
+                } else {
+                    reply.put("error", e.getMessage());
+                }
+            } catch (Throwable e) {
+                reply.put("ok", false);
+                reply.put("error", e.toString());
+            }
+
+            replies.println(mapper.writeValueAsString(reply));
+            replies.flush();
+        }
+    }
+}
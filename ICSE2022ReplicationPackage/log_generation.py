@@ -6,6 +6,13 @@ import subprocess
 import git # get diff patch on Windows 
 from unidiff import PatchSet
 from io import StringIO
+from datetime import datetime, timedelta, timezone
+
+from setting import SZZ_FOLDER
+
+sys.path.append(os.path.join(SZZ_FOLDER, 'tools/pyszz/'))
+
+from szz.core.git_batch import object_readers
 
 def wrapper_change_path(func):
     cwd = os.getcwd()
@@ -127,13 +134,18 @@ class GitLog:
 
         return change_list
 
-    @wrapper_change_path
     def get_commit_time(self, project_path, commit_id):
-        os.chdir(project_path)
-
-        cmd = 'git show -s --format=%ci {commit}'.format(commit=commit_id)
-        out = subprocess.check_output(cmd, shell=True).decode('utf-8', errors='ignore')
-        return out
+        # same output as 'git show -s --format=%ci', read from the raw commit object
+        raw_commit = bytes(object_readers.get(project_path).read_commit(commit_id)).decode('utf-8', errors='ignore')
+        for line in raw_commit.split('\n'):
+            if line.startswith('committer '):
+                timestamp, tz = line.rsplit(' ', 2)[1:]
+                offset = (1 if tz[0] == '+' else -1) * timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5]))
+                commit_time = datetime.fromtimestamp(int(timestamp), timezone(offset))
+                return commit_time.strftime('%Y-%m-%d %H:%M:%S ') + tz + '\n'
+            if not line:
+                break
+        return ''
     
     @wrapper_change_path
     def fetch_tags(self, project_path):
@@ -65,21 +65,21 @@ def run_szz(project, commits, method, repo_url=None, max_change_size=DEFAULT_MAX
 
     output = {}
     output_latent = {}
+    # fixing commits whose chains were stopped by a budget, with the budgets that fired
+    output_truncated = {}
 
     if method == "b":
         b_szz = BaseSZZ(repo_full_name=project, repo_url=repo_url, repos_dir=REPOS_DIR, use_temp_dir=use_temp_dir)
-        for commit in commits:
+        for commit, imp_files in b_szz.get_impacted_files_bulk(commits, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True):
             print('Fixing Commit:', commit)
-            imp_files = b_szz.get_impacted_files(fix_commit_hash=commit, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True)
             bug_introducing_commits = b_szz.find_bic(fix_commit_hash=commit,
                                       impacted_files=imp_files,
                                       ignore_revs_file_path=None)
             output[commit] = [commit.hexsha for commit in bug_introducing_commits]
     elif method == "ag":
         ag_szz = AGSZZ(repo_full_name=project, repo_url=repo_url, repos_dir=REPOS_DIR, use_temp_dir=use_temp_dir)
-        for commit in commits:
+        for commit, imp_files in ag_szz.get_impacted_files_bulk(commits, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True):
             print('Fixing Commit:', commit)
-            imp_files = ag_szz.get_impacted_files(fix_commit_hash=commit, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True)
             bug_introducing_commits = ag_szz.find_bic(fix_commit_hash=commit,
                                       impacted_files=imp_files,
                                       ignore_revs_file_path=None,
@@ -87,9 +87,8 @@ def run_szz(project, commits, method, repo_url=None, max_change_size=DEFAULT_MAX
             output[commit] = [commit.hexsha for commit in bug_introducing_commits]
     elif method == "ma":
         ma_szz = MASZZ(repo_full_name=project, repo_url=repo_url, repos_dir=REPOS_DIR, use_temp_dir=use_temp_dir)
-        for commit in commits:
+        for commit, imp_files in ma_szz.get_impacted_files_bulk(commits, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True):
             print('Fixing Commit:', commit)
-            imp_files = ma_szz.get_impacted_files(fix_commit_hash=commit, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True)
             bug_introducing_commits = ma_szz.find_bic(fix_commit_hash=commit,
                                       impacted_files=imp_files,
                                       ignore_revs_file_path=None,
@@ -100,13 +99,19 @@ def run_szz(project, commits, method, repo_url=None, max_change_size=DEFAULT_MAX
         my_szz = MySZZ(repo_full_name=project, repo_url=repo_url, repos_dir=REPOS_DIR, use_temp_dir=use_temp_dir, ast_map_path=AST_MAP_PATH)
         # print(commits[0])
         # print(my_szz)
-        for commit in tqdm(commits, desc="BUG FIXING COMMIT", leave=True):
+        impacted_files = my_szz.get_impacted_files_bulk(commits, file_ext_to_parse=['c', 'cpp', 'h', 'hpp', 'cxx', 'hxx', 'cc', 'hh'], only_deleted_lines=True)
+        for commit, imp_files in tqdm(impacted_files, total=len(set(commits)), desc="BUG FIXING COMMIT", leave=True):
             # print('Fixing Commit:', commit)
             # imp_files = my_szz.get_impacted_files(fix_commit_hash=commit, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True)
-            imp_files = my_szz.get_impacted_files(fix_commit_hash=commit, file_ext_to_parse=['c', 'cpp', 'h', 'hpp', 'cxx', 'hxx', 'cc', 'hh'], only_deleted_lines=True)
             bug_introducing_commits = my_szz.find_bic(fix_commit_hash=commit,
                                       impacted_files=imp_files,
-                                      ignore_revs_file_path=None)
+                                      ignore_revs_file_path=None,
+                                      max_chain_depth=MY_SZZ_MAX_CHAIN_DEPTH,
+                                      max_seconds=MY_SZZ_MAX_SECONDS,
+                                      max_blame_calls=MY_SZZ_MAX_BLAME_CALLS)
+            truncated = sorted({bic['truncated'] for bic in bug_introducing_commits if 'truncated' in bic})
+            if truncated:
+                output_truncated[commit] = truncated
             # print(bug_introducing_commits[0])
             # exit(-1)
             # {
@@ -152,9 +157,8 @@ def run_szz(project, commits, method, repo_url=None, max_change_size=DEFAULT_MAX
                 
     elif method == "ra":
         ra_szz = RASZZ(repo_full_name=project, repo_url=repo_url, repos_dir=REPOS_DIR, use_temp_dir=use_temp_dir)
-        for commit in commits:
+        for commit, imp_files in ra_szz.get_impacted_files_bulk(commits, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True):
             print('Fixing Commit:', commit)
-            imp_files = ra_szz.get_impacted_files(fix_commit_hash=commit, file_ext_to_parse=['c', 'java', 'cpp', 'h', 'hpp'], only_deleted_lines=True)
             bug_introducing_commits = ra_szz.find_bic(fix_commit_hash=commit,
                                       impacted_files=imp_files,
                                       ignore_revs_file_path=None,
@@ -163,6 +167,10 @@ def run_szz(project, commits, method, repo_url=None, max_change_size=DEFAULT_MAX
 
     with open(output_file, 'w') as fout:
         json.dump(output, fout, indent=4)
+    if output_truncated:
+        output_truncated_file = "results/{method}-{project}-truncated.json".format(method=method, project=project)
+        with open(output_truncated_file, 'w') as fout:
+            json.dump(output_truncated, fout, indent=4)
     # with open(output_latent_file, 'w') as fout:
     #     json.dump(output_latent, fout, indent=4)
 
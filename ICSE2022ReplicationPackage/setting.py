@@ -16,4 +16,9 @@ DEFAULT_MAX_CHANGE_SIZE = sys.maxsize
 
 AST_MAP_PATH = os.path.join(WORK_DIR, 'ASTMapEval_jar')
 
+# budgets of V-SZZ per fixing commit, None for no limit
+MY_SZZ_MAX_CHAIN_DEPTH = None
+MY_SZZ_MAX_SECONDS = None
+MY_SZZ_MAX_BLAME_CALLS = None
+
 LOG_DIR = os.path.join(WORK_DIR, 'GitLogs')
\ No newline at end of file